@@ -18,12 +18,47 @@ This particular example was used during my Thesis (https://essay.utwente.nl/1045
 It showcases how metrics can be added for the analysis.
 The most important thing is that this file has a select_metrics function that returns the metrics functions, names and
 kwargs for a given metric set. The metrics functions are then used in the analysis.py file to calculate the metrics.
+select_metrics is only called once per metric set and process. Expensive resources which should live as long as the
+process (e.g. a matlab engine) can be created in the optional setup_metrics function and released in teardown_metrics.
 
 Please feel free to use this file as a template for your own metrics.
 """
 
 import edgeofpy as eop
 import neurokit2 as nk
+from eeganalyzer.metrics import call_convention, complexity, entropy, fractal, spectral, statistics
+
+# matlab engine which is shared by all epochs and files of a process, created in setup_metrics
+ml_engine = None
+
+
+def setup_metrics(name):
+    """
+    Creates the resources a metric set needs. Called once per process before select_metrics.
+
+    Args:
+        name (str): Name of the metric set.
+    """
+    global ml_engine
+    if name == 'old_with_chaos' and ml_engine is None:
+        try:
+            import matlab.engine
+            ml_engine = matlab.engine.start_matlab()
+        except Exception as e:
+            print(f'could not instantiate matlab engine. See error below\n {e}')
+
+
+def teardown_metrics(name):
+    """
+    Releases the resources created in setup_metrics. Called once when the process is done with the metric set.
+
+    Args:
+        name (str): Name of the metric set.
+    """
+    global ml_engine
+    if name == 'old_with_chaos' and ml_engine is not None:
+        ml_engine.quit()
+        ml_engine = None
 
 
 def select_metrics(name):
@@ -51,12 +86,8 @@ def select_metrics(name):
         return metrics_functions, metrics_name_list, kwargs_list
 
     elif name == 'old_with_chaos':  ####################################################################################
-        # initialize the ml engine
-        try:
-            import matlab.engine
-            ml_engine = matlab.engine.start_matlab()
-        except Exception as e:
-            print(f'could not instantiate matlab engine. See error below\n {e}')
+        # the ml engine is created once per process in setup_metrics
+        if ml_engine is None:
             return None, None, None
         metrics_name_list = ['complexity_lempel_ziv', 'fractal_dimension_katz', 'entropy_multiscale',
                              'aval_fano_factor', 'entropy_shannon', 'entropy_permutation',
@@ -72,7 +103,7 @@ def select_metrics(name):
                         'gaussian_transform': 0, 'surrogate_algorithm': 'aaft_cpp', 'downsampling_method': 'downsample',
                         'sigima': 0.5}
         metrics_name_list = metrics_name_list + ['result_cp', 'entropy_permutation_cp', 'K_cp']
-        metrics_functions = metrics_functions + [ml_engine.chaos_modified]
+        metrics_functions = metrics_functions + [call_convention(ml_engine.chaos_modified, 'positional')]
         kwargs_list = kwargs_list + [cfg_pipeline]
         return metrics_functions, metrics_name_list, kwargs_list
 
@@ -127,5 +158,52 @@ def select_metrics(name):
         kwargs_list = [None, {'denoise': True}, None]
         return metrics_functions, metrics_name_list, kwargs_list
     
+    elif name == 'statistics':
+        # built-in batch metrics, each of them is computed for a whole block of epochs and channels in one call
+        metrics_name_list = ['mean', 'variance', 'line_length']
+        metrics_functions = [statistics.mean, statistics.variance, statistics.line_length]
+        kwargs_list = [None, None, None]
+        return metrics_functions, metrics_name_list, kwargs_list
+
+    elif name == 'fractal':
+        # built-in batch versions of the fractal dimensions of final-0, they agree with neurokit2
+        metrics_name_list = ['fractal_dimension_katz', 'fractal_dimension_higuchi_k-10',
+                             'fractal_dimension_petrosian']
+        metrics_functions = [fractal.katz, fractal.higuchi, fractal.petrosian]
+        kwargs_list = [None, {'k_max': 10}, None]
+        return metrics_functions, metrics_name_list, kwargs_list
+
+    elif name == 'entropy':
+        # built-in batch versions of the entropies of final-0 and additional, they agree with neurokit2
+        metrics_name_list = ['permutation_entropy', 'multiscale_entropy', 'multiscale_permutation_entropy',
+                             'entropy_permutation_delay-30', 'weighted_entropy_permutation']
+        metrics_functions = [entropy.permutation_entropy, entropy.multiscale_entropy, entropy.multiscale_entropy,
+                             entropy.permutation_entropy, entropy.permutation_entropy]
+        kwargs_list = [None, None, {'method': 'MSPEn'},
+                       {'delay': 30}, {'weighted': True}]
+        return metrics_functions, metrics_name_list, kwargs_list
+
+    elif name == 'complexity':
+        # built-in batch versions of the Lempel-Ziv complexity and the largest Lyapunov exponent of final-0,
+        # they agree with neurokit2
+        metrics_name_list = ['complexity_lempel_ziv', 'complexity_lempel_ziv_median', 'largest_lyapunov_exponent',
+                             'largest_lyapunov_exponent_1000-points']
+        metrics_functions = [complexity.lempel_ziv, complexity.lempel_ziv, complexity.lyapunov, complexity.lyapunov]
+        kwargs_list = [None, {'symbolize': 'median'}, None, {'max_reference_points': 1000}]
+        return metrics_functions, metrics_name_list, kwargs_list
+
+    elif name == 'spectral':
+        # built-in spectral metrics, all of them are derived from one shared Welch PSD per block of epochs
+        bands = {'delta': (1, 4), 'theta': (4, 8), 'alpha': (8, 13), 'beta': (13, 30), 'gamma': (30, 45)}
+        metrics_name_list = ([f'{band}_power' for band in bands] + [f'{band}_relative_power' for band in bands]
+                             + ['spectral_edge_frequency_95', 'spectral_entropy', 'peak_alpha_frequency',
+                                'aperiodic_slope'])
+        metrics_functions = ([spectral.band_power] * len(bands) + [spectral.relative_band_power] * len(bands)
+                             + [spectral.spectral_edge, spectral.spectral_entropy, spectral.peak_frequency,
+                                spectral.aperiodic_slope])
+        kwargs_list = ([{'band': band} for band in bands.values()] + [{'band': band} for band in bands.values()]
+                       + [{'edge': 0.95}, None, {'freq_range': (7, 14)}, None])
+        return metrics_functions, metrics_name_list, kwargs_list
+
     print(f'Error in metric selection, name {name} is not a valid option')
     return None, None, None
\ No newline at end of file
@@ -18,7 +18,7 @@ This module provides the main entry point for the EEG analysis command-line inte
 
 import argparse
 import sys
-from typing import Dict, Any, Union
+from typing import Dict, Any, Optional, Union
 
 from eeganalyzer.core.processor import process_experiment
 from eeganalyzer.utils.config import load_yaml_file, check_file_exists_and_create_path
@@ -39,10 +39,13 @@ def main() -> int:
     )
     parser.add_argument('--yaml_config', type=str, required=True, help='Path to the YAML configuration file.')
     parser.add_argument('--logfile_path', type=str, required=False, default=False, help='Path to the log file (must end with .log).')
+    parser.add_argument('--n_jobs', type=int, required=False, default=None,
+                        help='Number of processes used within each file, overrides n_jobs of the configuration (-1 uses all CPUs).')
 
     args = parser.parse_args()
     yaml_file: str = args.yaml_config
     log_file: Union[str, bool] = args.logfile_path
+    n_jobs: Optional[int] = args.n_jobs
 
     # Ensure the log file path exists and append a timestamp
     log_file = check_file_exists_and_create_path(log_file, append_datetime=True)
@@ -51,7 +54,7 @@ def main() -> int:
     config: Dict[str, Any] = load_yaml_file(yaml_file)
 
     # Process the experiments as defined in the configuration
-    process_experiment(config, log_file)
+    process_experiment(config, log_file, n_jobs=n_jobs)
     
     return 0
 
@@ -18,11 +18,29 @@ This module provides the Array_processor class for processing array data.
 
 import numpy as np
 import pandas as pd
-from typing import List, Dict, Tuple, Optional, Any, Union
-import os, sys
-
+from typing import List, Dict, Iterable, Iterator, Tuple, Optional, Any, Union, TYPE_CHECKING
+from itertools import chain
+import os
+import time
+
+from eeganalyzer.core.call_adapter import CallAdapter
+from eeganalyzer.core.intermediate_cache import IntermediateCache
+from eeganalyzer.core.metric_cache import MetricCache, epoch_digests
+from eeganalyzer.core.metric_registry import MetricSet, metric_registry
+from eeganalyzer.core.parallel import run_epoch_tasks
+from eeganalyzer.core.result_accumulator import ResultAccumulator
+from eeganalyzer.core.scheduler import CostModel, DEFAULT_COST_MODEL_PATH
+from eeganalyzer.core.shared_signal import SharedSignal
+from eeganalyzer.core.sliding_window import calc_sliding_metric, epoch_view
+from eeganalyzer.metrics.batch import BatchSpec, get_batch_spec
+from eeganalyzer.metrics.intermediates import Intermediate, get_intermediates
+from eeganalyzer.metrics.sliding import SlidingSpec, get_sliding_spec
 from eeganalyzer.utils.buttler import Buttler
 
+if TYPE_CHECKING:
+    from eeganalyzer.core.montage import CompiledMontage
+    from eeganalyzer.core.stream_reader import StreamReader
+
 
 class Array_processor:
     """
@@ -30,21 +48,46 @@ class Array_processor:
     It includes methods for setting attributes, calculating metrics, epoching data, and more.
 
     Attributes:
-        data (pd.DataFrame): The input data (e.g., EEG data) to process.
+        data (pd.DataFrame or np.ndarray): The input data (e.g., EEG data) to process.
+        channel_names (list): Names of the channels of array data, None for dataframes (their labels are used).
+        stream (StreamReader): Reader of a recording which is not held in memory, used instead of data.
+        montage (CompiledMontage): Montage applied lazily to the epochs of the data, None if the data is already
+            re-referenced.
         metric_name (str): The name of the metric or set of metrics to calculate.
         sfreq (float): The sampling frequency of the input data.
         axis_of_time (int): Axis indicating time (0 for rows, 1 for columns).
+        n_jobs (int): Number of processes used to compute the metrics of one file.
+        dtype (np.dtype): Precision of the channel buffer, the epoch tensor and the results, float64 or float32.
+        cost_model_path (str): JSON file in which the learned metric runtimes are persisted. None persists them to
+            DEFAULT_COST_MODEL_PATH, but only if the metrics are computed in parallel (n_jobs > 1), an empty string
+            disables persisting.
+        metric_cache (MetricCache): Persistent cache of metric results per epoch and channel, None if disabled.
+        existing_results (pd.DataFrame): Previously saved results, only the cells missing in it are computed.
         buttler (Buttler): An object from the Buttler class to support auxiliary computations.
+        max_batch_samples (int): Maximum number of samples handed to a batch metric in a single call.
 
     Methods:
         set_sfreq(sfreq): Sets the sampling frequency.
-        set_data(data): Updates the data attribute.
+        set_data(data, channel_names): Updates the data attribute, a dataframe or an array with channel names.
+        set_stream(stream): Computes the metrics on the epochs of a StreamReader instead of data.
+        set_montage(montage): Sets a montage which is applied to the epochs block by block.
         set_axis_of_time(axis_of_time): Sets the axis representing time in the data.
         set_metric_name(metric_name): Sets the name of the metric to calculate.
+        set_n_jobs(n_jobs): Sets the number of processes used for the metric computation of one file.
+        set_dtype(dtype): Sets the precision of the signal and the results.
         transpose_data(): Swaps rows and columns based on the axis of time.
         initialize_metric_functions(name): Loads metric functions, names, and arguments.
+        get_adapter(metric_func, kwargs): Returns the metric function compiled with its kwargs, once per processor.
         apply_metric_func(data, metric_func, kwargs): Applies a metric function to a time-series.
+        call_metric(data, adapter): Calls a metric compiled into a CallAdapter, without validation.
         create_result_array(eeg_np_array, metrics_func_list, kwargs_list): Computes metrics for a given EEG data array.
+        report_failures(failures, n_series): Reports the failures of create_result_array once per metric.
+        batch_blocks(epoch_tensor, batch_spec): Splits the epochs into the blocks a batch metric is called with.
+        apply_batch_metric_func(epoch_tensor, metric_func, kwargs, batch_spec): Applies a batch metric to all epochs,
+            passing it the shared intermediates it consumes.
+        apply_sliding_metric_func(epoch_tensor, metric_func, kwargs, sliding_spec): Applies a decomposable metric to
+            overlapping epochs from block summaries.
+        flatten_result(result): Extracts the value(s) of a single metric result.
         process_result_array(result_array, metric_name_array): Processes metric results for further use.
         create_result_dict_from_eeg_frame(data_frame, metrics_func_list, metrics_name_list, kwargs_list, channelwise=True):
             Computes metrics for EEG data and organizes results by channel or overall data.
@@ -52,29 +95,80 @@ class Array_processor:
             Creates a DataFrame of computed metrics from a dictionary of results.
         calc_metrics_from_eeg_dataframe_and_annotations(dataframe, annot_label, annot_startDataRecord, annot_duration):
             Computes metrics for a designated EEG segment given its annotation details.
-        epoching(duration, start_time=0, stop_time=None, overlap=0, task=None): 
+        get_channel_buffer(): Returns the channel names and a contiguous channel-major copy of the data.
+        get_channel_names(): Returns the names of the analysed channels.
+        get_data_channel_names(): Returns the names of the channels of the data (before a lazy montage).
+        get_epoch_frame(start, stop): Returns a range of samples as dataframe, used without the epoch tensor.
+        release_channel_buffer(): Drops the channel buffer and its shared memory.
+        close(): Releases the channel buffer and saves the cost model, the process pool is kept for the next file.
+        compute_epoch_onsets(duration, start_time, stop_time, overlap): Validates epoching parameters and
+            returns the onsets of all epochs.
+        epoch_onset_samples(onsets, duration): Returns the onsets of the epochs which fit into the data in samples.
+        create_epoch_tensor(onsets, duration): Creates a zero-copy (n_epochs, n_channels, n_samples) view.
+        truncated_epochs(onsets, first_epoch): Yields the final epochs which reach beyond the data, cut at its end.
+        calc_metrics_from_epoch_tensor(epoch_tensor, channel_names, onsets, duration, label):
+            Computes metrics for every epoch of an epoch tensor, in parallel if n_jobs > 1.
+        calc_metrics_from_epoch_blocks(epoch_blocks, channel_names, onsets, duration, label):
+            Computes metrics for epochs which are delivered block by block, e.g. by a StreamReader.
+        compute_values(epoch_tensor, metric_set, function_indices): Computes metric functions on an epoch tensor.
+        calc_missing_values(epoch_tensor, metric_set, missing, out): Computes only the results missing in the cache.
+        calc_metric_values(epoch_tensor): Computes the raw (epochs, metrics, channels) result array of an epoch tensor,
+            computing every shared intermediate once.
+        get_cost_model(): Returns the learned model of the metric runtimes used to schedule parallel tasks.
+        save_cost_model(): Merges the learned metric runtimes into the persisted cost model, called by close().
+        epoching(duration, start_time=0, stop_time=None, overlap=0, task=None, use_epoch_tensor=True):
             Divides data into epochs and calculates metrics for each, returning results in a DataFrame.
     """
 
-    def __init__(self, data: Optional[pd.DataFrame] = None, metric_name: Optional[str] = None, metric_path: Optional[str] = None,
-                 sfreq: Optional[float] = None, axis_of_time: int = 0):
-            self.data: Optional[pd.DataFrame] = None
+    max_batch_samples: int = 2 ** 24
+
+    def __init__(self, data: Union[pd.DataFrame, np.ndarray, None] = None, metric_name: Optional[str] = None, metric_path: Optional[str] = None,
+                 sfreq: Optional[float] = None, axis_of_time: int = 0, n_jobs: int = 1,
+                 cost_model_path: Optional[str] = None, metric_cache: Optional[str] = None,
+                 existing_results: Optional[pd.DataFrame] = None, dtype: Union[str, np.dtype, None] = None,
+                 channel_names: Optional[List[Union[str, int]]] = None, stream: Optional['StreamReader'] = None,
+                 montage: Optional['CompiledMontage'] = None):
+            self.data: Union[pd.DataFrame, np.ndarray, None] = None
+            self.channel_names: Optional[List[Union[str, int]]] = None
+            self.stream: Optional['StreamReader'] = None
+            self.montage: Optional['CompiledMontage'] = None
             self.metric_name: Optional[str] = None
             self.metric_path: Optional[str] = None
             self.sfreq: Optional[float] = None
             self.axis_of_time: int = 0
             self.buttler: Buttler = Buttler()
+            self.n_jobs: int = 1
+            self.dtype: np.dtype = np.dtype(np.float64)
+            self._channel_buffer: Optional[Tuple[List[Union[str, int]], np.ndarray]] = None
+            self._shared_signal: Optional[SharedSignal] = None
+            self.cost_model_path: Optional[str] = cost_model_path
+            self._cost_model: Optional[CostModel] = None
+            # (metric function, kwargs) -> compiled CallAdapter, see get_adapter
+            self._adapters: Dict[Tuple[int, int], Tuple[callable, Optional[Dict[str, Any]], CallAdapter]] = {}
+            self.metric_cache: Optional[MetricCache] = MetricCache(metric_cache) if metric_cache else None
+            self.existing_results: Optional[pd.DataFrame] = existing_results
             
-            self.set_data(data)
+            # data can be omitted for processors which only compute metrics on given epoch tensors
+            if data is not None:
+                self.set_data(data, channel_names)
+            if stream is not None:
+                self.set_stream(stream)
+            if montage is not None:
+                self.set_montage(montage)
             self.set_metric_name(metric_name)
             self.set_metric_path(metric_path)
             self.select_metrics = self.import_metrics()
             self.set_sfreq(sfreq)
             self.set_axis_of_time(axis_of_time)
+            self.set_n_jobs(n_jobs)
+            self.set_dtype(dtype)
 
     def import_metrics(self):
         """
-        Dynamically imports the select_metrics function from a specified path.
+        Imports the select_metrics function from the metrics file at metric_path.
+
+        The metrics module is loaded through the process wide metric registry, so it is executed only once per
+        process instead of once per file.
 
         Returns:
             callable: The select_metrics function from the specified metrics file.
@@ -85,39 +179,7 @@ class Array_processor:
         if not self.metric_path:
             raise ValueError("Metric path is not set. Use set_metric_path() first.")
 
-        try:
-            # Get the directory and filename
-            dir_path = os.path.dirname(self.metric_path)
-            file_name = os.path.basename(self.metric_path)
-
-            # If it's a .py file, remove the extension
-            if file_name.endswith('.py'):
-                module_name = file_name[:-3]
-            else:
-                module_name = file_name
-
-            # Add the directory to sys.path if it's not already there
-            if dir_path not in sys.path:
-                sys.path.insert(1, dir_path)
-
-            # Dynamic import
-            import importlib.util
-            spec = importlib.util.spec_from_file_location(module_name, self.metric_path)
-            if not spec:
-                raise ImportError(f"Could not load spec for module at {self.metric_path}")
-
-            metrics_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(metrics_module)
-
-            # Get the select_metrics function
-            if not hasattr(metrics_module, 'select_metrics'):
-                raise AttributeError(f"The metrics module at {self.metric_path} does not contain a select_metrics function")
-
-            return metrics_module.select_metrics
-
-        except Exception as e:
-            raise ImportError(f"Failed to import metrics from {self.metric_path}: {str(e)}")
-
+        return metric_registry.load_module(self.metric_path).select_metrics
 
     def set_sfreq(self, sfreq: float) -> None:
         """
@@ -133,16 +195,55 @@ class Array_processor:
             raise ValueError("Sampling frequency must be a positive number.")
         self.sfreq = sfreq
 
-    def set_data(self, data: pd.DataFrame):
+    def set_data(self, data: Union[pd.DataFrame, np.ndarray],
+                 channel_names: Optional[List[Union[str, int]]] = None) -> None:
         """
         Updates the data attribute.
 
+        Arrays are used without conversion, e.g. the (n_channels, n_samples) array of raw.get_data() with
+        axis_of_time=1 becomes the channel buffer without being copied (if it already has the dtype of the processor).
+
         Parameters:
-            data (pd.DataFrame): EEG data to process.
+            data (pd.DataFrame or np.ndarray): EEG data to process, a two-dimensional array or dataframe.
+            channel_names (list, optional): Names of the channels of an array, in the order of its channel axis.
+                                            Defaults to the channel indices. Ignored for dataframes.
         """
-        if not isinstance(data, pd.DataFrame):
-            raise ValueError("Data must be a pandas DataFrame.")
+        if isinstance(data, np.ndarray):
+            if data.ndim != 2:
+                raise ValueError("Data arrays must be two-dimensional.")
+            if channel_names is not None and len(channel_names) not in data.shape:
+                raise ValueError("The number of channel names does not match the shape of the data.")
+            self.channel_names = list(channel_names) if channel_names is not None else None
+        elif isinstance(data, pd.DataFrame):
+            self.channel_names = None
+        else:
+            raise ValueError("Data must be a pandas DataFrame or a numpy array.")
         self.data = data
+        self.release_channel_buffer()
+
+    def set_stream(self, stream: 'StreamReader') -> None:
+        """
+        Sets a StreamReader whose epochs are computed block by block instead of the data.
+
+        Parameters:
+            stream (StreamReader): Reader of the preprocessed recording, its sampling frequency has to be the sfreq
+                                   of the processor.
+        """
+        self.stream = stream
+        self.data = None
+        self.channel_names = None
+        self.release_channel_buffer()
+
+    def set_montage(self, montage: Optional['CompiledMontage']) -> None:
+        """
+        Sets a montage which is applied lazily: the epochs are re-referenced block by block while they are computed,
+        so the re-referenced signal is never held as a whole.
+
+        Parameters:
+            montage (CompiledMontage): Montage compiled for the channels of the data (see
+                                       eeganalyzer.core.montage.compile_montage), None to use the data as it is.
+        """
+        self.montage = montage
 
     def set_axis_of_time(self, axis_of_time: int) -> None:
         """
@@ -154,6 +255,42 @@ class Array_processor:
         if axis_of_time not in [1, 0]:
             raise ValueError("Axis of time must be either 1 (columns) or 0 (rows).")
         self.axis_of_time = axis_of_time
+        self.release_channel_buffer()
+
+    def set_n_jobs(self, n_jobs: Optional[int]) -> None:
+        """
+        Sets the number of processes used to compute the metrics of one file.
+
+        Parameters:
+            n_jobs (int): Number of processes, 1 (or None) computes serially, -1 uses all CPUs.
+        """
+        if n_jobs is None:
+            n_jobs = 1
+        if n_jobs == -1:
+            n_jobs = os.cpu_count() or 1
+        if not isinstance(n_jobs, int) or n_jobs < 1:
+            raise ValueError("n_jobs must be a positive integer or -1.")
+        if n_jobs != self.n_jobs:
+            self.release_channel_buffer()
+        self.n_jobs = n_jobs
+
+    def set_dtype(self, dtype: Union[str, np.dtype, None]) -> None:
+        """
+        Sets the precision in which the signal is kept and the results are stored.
+
+        With float32 the channel buffer, its shared memory and the epoch tensor take half the memory. Batch metrics
+        declared with single_precision get the float32 epochs directly, all other metrics get float64 copies of the
+        blocks or channels they are called with.
+
+        Parameters:
+            dtype (str or np.dtype): 'float64' or 'float32', None keeps float64.
+        """
+        dtype = np.dtype(np.float64 if dtype is None else dtype)
+        if dtype not in (np.dtype(np.float64), np.dtype(np.float32)):
+            raise ValueError(f"dtype must be float64 or float32, not {dtype}.")
+        if dtype != self.dtype:
+            self.release_channel_buffer()
+        self.dtype = dtype
 
     def set_metric_name(self, metric_name: str) -> None:
         """
@@ -192,10 +329,14 @@ class Array_processor:
         elif self.axis_of_time == 0:
             self.data = self.data.T
             self.axis_of_time = 1
+        self.release_channel_buffer()
 
     def initialize_metric_functions(self, name: str) -> Tuple[List[callable], List[str], List[Dict[str, Any]]]:
         """
         Loads the metric functions, their names, and corresponding arguments from the Metrics module.
+
+        The metric set is resolved and validated by the metric registry the first time it is requested in a process,
+        every later call returns the same resolved functions without calling select_metrics again.
         
         Parameters:
             name (str): Name of the metrics set to be loaded.
@@ -208,25 +349,32 @@ class Array_processor:
         
         Raises:
             ValueError: If the name is not valid or no metrics are found for the given name.
-            TypeError: If the output of Metrics.select_metrics is not a tuple of lists.
         """
-        if not isinstance(name, str) or not name.strip():
-            raise ValueError("Metric set name must be a non-empty string.")
-
-        try:
-            metrics_functions, metrics_name_list, kwargs_list = self.select_metrics(name)
+        metric_set = metric_registry.get_metric_set(self.metric_path, name)
+        # The adapters resolved by the registry are reused when the functions are applied one by one
+        for metric_func, kwargs, adapter in zip(metric_set.functions, metric_set.kwargs_list, metric_set.adapters):
+            self._adapters[(id(metric_func), id(kwargs))] = (metric_func, kwargs, adapter)
+        return metric_set.as_lists()
 
-            if not isinstance(metrics_functions, list) or not isinstance(metrics_name_list, list) or not isinstance(
-                    kwargs_list, list):
-                raise TypeError("Output of Metrics.select_metrics must be three lists.")
+    def get_adapter(self, metric_func: callable, kwargs: Optional[Dict[str, Any]]) -> CallAdapter:
+        '''
+        Returns the CallAdapter of a metric function with its kwargs, compiled only once per processor.
 
-            if not metrics_functions or not metrics_name_list or not kwargs_list:
-                raise ValueError(f"No metrics found for the name: {name}")
+        Functions of a metric set loaded by initialize_metric_functions get the adapter resolved by the metric
+        registry.
 
-        except Exception as e:
-            raise ValueError(f"An error occurred while retrieving metrics for '{name}': {e}")
+        Inputs:
+        - metric_func: The metric function.
+        - kwargs: Additional arguments for the function.
 
-        return metrics_functions, metrics_name_list, kwargs_list
+        Returns:
+        - The metric function compiled with its kwargs.
+        '''
+        key = (id(metric_func), id(kwargs))
+        # The function and kwargs are kept with the adapter, so their ids cannot be reused by other objects
+        if key not in self._adapters:
+            self._adapters[key] = (metric_func, kwargs, CallAdapter(metric_func, kwargs))
+        return self._adapters[key][2]
 
     def apply_metric_func(self, data: Union[np.ndarray, List[float]], 
                          metric_func: callable, 
@@ -260,31 +408,37 @@ class Array_processor:
 
         # Ensures EEG channel is saved as contiguous array in memory
         data = np.ascontiguousarray(data)
+        adapter = self.get_adapter(metric_func, kwargs)
+        try:
+            return self.call_metric(data, adapter)
+        except Exception as e:
+            print(f"Could not apply metric '{adapter.name}' to data. Exception: {e}")
+            return None
 
-        # Try applying the metric function with the given arguments
-        if kwargs:
-            try:
-                # Try applying kwargs as keyword arguments
-                return metric_func(data, **kwargs)
-            except TypeError as e:
-                # If kwargs are not accepted, use kwarg values as an arg list instead
-                print(f"TypeError occurred: {e}. Retrying with positional arguments.")
-                return metric_func(data, *list(kwargs.values()))
-            except Exception as e:
-                # Catch any unexpected exceptions and handle gracefully
-                print(f"Could not apply metric '{metric_func.__name__}' to data. Exception: {e}")
-                return None
-        else:
-            # If no kwargs are provided, calculate with default parameters
-            try:
-                return metric_func(data)
-            except Exception as e:
-                # Catch and log exceptions during default metric calculation
-                print(
-                    f"Could not apply metric '{metric_func.__name__}' to data with default parameters. Exception: {e}")
-                return None
+    def call_metric(self, data: np.ndarray, adapter: CallAdapter, **extra_kwargs: Any) -> Any:
+        '''
+        Calls a compiled metric on a one-dimensional time series, without validating the inputs.
 
-    def create_result_array(self, eeg_np_array, metrics_func_list: list, kwargs_list: list[dict]) -> list:
+        Inputs:
+        - data: Channel data (one-dimensional time series).
+        - adapter: The metric function compiled with its kwargs.
+        - extra_kwargs: Additional keyword arguments, e.g. shared intermediates.
+
+        Returns:
+        - Function output after calculation on the data.
+
+        Raises:
+        - Any exception raised by the metric function.
+        '''
+        # Batch metrics which need the sampling frequency get it as keyword argument
+        batch_spec = get_batch_spec(adapter.func)
+        if batch_spec is not None and batch_spec.needs_sfreq and 'sfreq' not in adapter.kwargs:
+            extra_kwargs.setdefault('sfreq', self.sfreq)
+        return adapter(data, **extra_kwargs)
+
+    def create_result_array(self, eeg_np_array, metrics_func_list: list, kwargs_list: list[dict],
+                            adapters: Optional[List[CallAdapter]] = None,
+                            failures: Optional[Dict[str, list]] = None) -> list:
         '''
         Creates a list of computed metric results for the provided EEG data.
         
@@ -292,19 +446,168 @@ class Array_processor:
         - eeg_np_array (np.ndarray): Numpy array containing EEG data, with each element representing a sample or channel.
         - metrics_func_list (list): List of callable metric functions to be applied to the EEG data.
         - kwargs_list (list[dict]): List of dictionaries containing additional arguments for each corresponding metric function.
+        - adapters (list[CallAdapter], optional): The functions already compiled with their kwargs.
+        - failures (dict, optional): Collects [number of failures, first exception] per metric name instead of
+          reporting every failure, see report_failures.
         
         Returns:
-        - list: A list of results where each result corresponds to the output of a metric function applied to the EEG data.
+        - list: A list of results where each result corresponds to the output of a metric function applied to the EEG data,
+          None where the calculation failed.
         
         Raises:
         - ValueError: If the input arguments are not structured as expected or contain invalid values.
         '''
-        return [self.apply_metric_func(eeg_np_array, metric_func, kwargs)
-                for metric_func, kwargs in zip(metrics_func_list, kwargs_list)]
+        if adapters is None:
+            adapters = [self.get_adapter(metric_func, kwargs) for metric_func, kwargs in zip(metrics_func_list, kwargs_list)]
+        data = np.ascontiguousarray(eeg_np_array)
+        results = []
+        for adapter in adapters:
+            try:
+                results.append(self.call_metric(data, adapter))
+            except Exception as e:
+                if failures is None:
+                    print(f"Could not apply metric '{adapter.name}' to data. Exception: {e}")
+                else:
+                    failure = failures.setdefault(adapter.name, [0, e])
+                    failure[0] += 1
+                results.append(None)
+        return results
+
+    @staticmethod
+    def report_failures(failures: Dict[str, list], n_series: int) -> None:
+        '''
+        Reports the failures collected by create_result_array once per metric instead of once per time series.
+
+        Parameters:
+        - failures (dict): [number of failures, first exception] per metric name.
+        - n_series (int): Number of time series the metrics were applied to.
+        '''
+        for name, (n_failed, first_error) in failures.items():
+            print(f"Could not apply metric '{name}' in {n_failed} of {n_series} time series, storing None instead. "
+                  f"First exception: {first_error}")
+
+
+    def batch_blocks(self, epoch_tensor: np.ndarray, batch_spec: BatchSpec) -> List[Tuple[int, int]]:
+        '''
+        Splits the epochs of an epoch tensor into the blocks a batch metric is called with.
+
+        Metrics accepting 3-D input are called once per block of epochs (limited by max_batch_samples), metrics
+        accepting 2-D input once per epoch.
+
+        Parameters:
+        - epoch_tensor (np.ndarray): Tensor of shape (n_epochs, n_channels, n_samples).
+        - batch_spec (BatchSpec): The batch specification of the metric.
+
+        Returns:
+        - list: (first epoch, stop epoch) of every block.
+        '''
+        n_epochs, n_channels, n_samples = epoch_tensor.shape
+        if batch_spec.ndim == 3:
+            block_size = max(1, self.max_batch_samples // max(1, n_channels * n_samples))
+        else:
+            block_size = 1
+        return [(start, min(start + block_size, n_epochs)) for start in range(0, n_epochs, block_size)]
+
+    def apply_batch_metric_func(self, epoch_tensor: np.ndarray, metric_func: callable,
+                                kwargs: Optional[Dict[str, Any]], batch_spec: BatchSpec,
+                                intermediates: Optional[Dict[str, Intermediate]] = None,
+                                intermediate_cache: Optional[IntermediateCache] = None) -> np.ndarray:
+        '''
+        Applies a batch metric to all epochs and channels of an epoch tensor, block by block (see batch_blocks).
+
+        Parameters:
+        - epoch_tensor (np.ndarray): Tensor of shape (n_epochs, n_channels, n_samples).
+        - metric_func (callable): Function decorated with eeganalyzer.metrics.batch_metric.
+        - kwargs (dict): Additional arguments for the function.
+        - batch_spec (BatchSpec): The batch specification of the function.
+        - intermediates (dict, optional): Intermediates the function consumes, by keyword argument.
+        - intermediate_cache (IntermediateCache, optional): Cache the intermediates are taken from and released to,
+          required if intermediates are given.
+
+        Returns:
+        - np.ndarray: Results of shape (n_epochs, n_channels), NaN where the calculation failed.
+        '''
+        kwargs = dict(kwargs or {})
+        if batch_spec.needs_sfreq:
+            kwargs.setdefault('sfreq', self.sfreq)
+        intermediates = intermediates or {}
+
+        n_epochs, n_channels, _ = epoch_tensor.shape
+        results = np.full((n_epochs, n_channels), np.nan, dtype=self.dtype)
+        for block_start, block_stop in self.batch_blocks(epoch_tensor, batch_spec):
+            block = epoch_tensor[block_start:block_stop] if batch_spec.ndim == 3 else epoch_tensor[block_start]
+            unit = ('block', batch_spec.ndim, block_start, block_stop)
+            try:
+                # Intermediates are shared between consumers, so they are computed in the precision of the signal
+                block_kwargs = {**kwargs, **{argument: intermediate_cache.get(unit, key, block)
+                                             for argument, key in intermediates.items()}}
+                if not batch_spec.single_precision:
+                    block = block.astype(np.float64, copy=False)
+                results[block_start:block_stop] = metric_func(block, **block_kwargs)
+            except Exception as e:
+                print(f"Could not apply batch metric '{metric_func.__name__}' to epochs "
+                      f"{block_start} to {block_stop - 1}. Exception: {e}")
+            finally:
+                if intermediates:
+                    intermediate_cache.release_all([unit], intermediates.values())
+        return results
+
+    def apply_sliding_metric_func(self, epoch_tensor: np.ndarray, metric_func: callable,
+                                  kwargs: Optional[Dict[str, Any]], sliding_spec: SlidingSpec) -> Optional[np.ndarray]:
+        '''
+        Applies a decomposable metric to all epochs of an overlapping epoch tensor, processing every sample once.
+
+        Parameters:
+        - epoch_tensor (np.ndarray): Tensor of shape (n_epochs, n_channels, n_samples).
+        - metric_func (callable): Function decorated with eeganalyzer.metrics.sliding_metric.
+        - kwargs (dict): Additional arguments for the function.
+        - sliding_spec (SlidingSpec): The decomposition of the function.
+
+        Returns:
+        - np.ndarray or None: Results of shape (n_epochs, n_channels), None if the metric has to be computed
+          directly, because the epochs do not overlap, the metric does not support the precision of the tensor or
+          the decomposition failed.
+        '''
+        kwargs = dict(kwargs or {})
+        batch_spec = get_batch_spec(metric_func)
+        if epoch_tensor.dtype != np.float64 and (batch_spec is None or not batch_spec.single_precision):
+            # The block summaries are taken from the signal itself, which is only converted block by block
+            return None
+        if batch_spec is not None and batch_spec.needs_sfreq:
+            kwargs.setdefault('sfreq', self.sfreq)
+        try:
+            return calc_sliding_metric(epoch_tensor, sliding_spec, kwargs)
+        except Exception as e:
+            print(f"Could not decompose metric '{metric_func.__name__}' into blocks, computing it per epoch. "
+                  f"Exception: {e}")
+            return None
 
 
     ############################################ advanced functions ########################################################
 
+    def flatten_result(self, result: Any) -> List[Any]:
+        '''
+        Extracts the value(s) of a single metric result.
+
+        Parameters:
+        - result: Output of a metric function. For lists and tuples the first element is used, dictionaries contribute
+          all of their values, other types are used directly.
+
+        Returns:
+        - list: The extracted values, one per output of the metric function.
+        '''
+        result_type = type(result)
+        if result_type in (list, tuple):
+            return [result[0]] if len(result) > 0 else [None]
+        if result_type == dict:
+            values = []
+            for key, value in result.items():
+                if key == 'result':
+                    value = self.buttler.map_chaos_pipe_result_to_float(value)
+                values.append(value)
+            return values
+        return [result]  # Handle other result types directly
+
     def process_result_array(self, result_array: List[Any], metric_name_array: List[str]) -> List[Tuple[str, Any]]:
         '''
         Processes the results from calculated metrics and extracts relevant information for further use.
@@ -330,20 +633,8 @@ class Array_processor:
         # Initialize processed array
         processed_array = []
         for result in result_array:
-            result_type = type(result)
             try:
-                if result_type in (list, tuple):
-                    if len(result) > 0:
-                        processed_array.append(result[0])
-                    else:
-                        processed_array.append(None)
-                elif result_type == dict:
-                    for key, value in result.items():
-                        if key == 'result':
-                            value = self.buttler.map_chaos_pipe_result_to_float(value)
-                        processed_array.append(value)
-                else:
-                    processed_array.append(result)  # Handle other result types directly
+                processed_array.extend(self.flatten_result(result))
             except Exception as e:
                 print(f"Error processing result: {result}. Exception: {e}")
                 processed_array.append(None)
@@ -361,7 +652,8 @@ class Array_processor:
                                           metrics_func_list: List[callable],
                                           metrics_name_list: List[str], 
                                           kwargs_list: List[Dict[str, Any]],
-                                          channelwise: bool = True) -> Tuple[Dict[Union[str, int], List[Tuple[str, Any]]], List[str]]:
+                                          channelwise: bool = True,
+                                          adapters: Optional[List[CallAdapter]] = None) -> Tuple[Dict[Union[str, int], List[Tuple[str, Any]]], List[str]]:
 
         '''
         Creates a dictionary of computed metrics for EEG data.
@@ -372,6 +664,7 @@ class Array_processor:
             metrics_name_list (list[str]): List of names corresponding to the metric functions.
             kwargs_list (list[dict]): List of dictionaries containing additional arguments for the metric functions.
             channelwise (bool): If True, computes metrics for each time series individually; otherwise computes on the full data frame.
+            adapters (list[CallAdapter], optional): The metric functions compiled with their kwargs, compiled here if not given.
         
         Returns:
             tuple:
@@ -391,6 +684,9 @@ class Array_processor:
             raise TypeError("data_frame must be a pandas DataFrame or a numpy array.")
 
         result_dict = {}
+        if adapters is None:
+            adapters = [self.get_adapter(metric_func, kwargs) for metric_func, kwargs in zip(metrics_func_list, kwargs_list)]
+        failures = {}
         columns = data_frame.columns if isinstance(data_frame, pd.DataFrame) else range(data_frame.shape[1])
         data_frame = data_frame.to_numpy() if isinstance(data_frame, pd.DataFrame) else data_frame
 
@@ -399,7 +695,8 @@ class Array_processor:
                 for col, colname in zip(range(data_frame.shape[1]), columns):
                     try:
                         temp_data = data_frame[:, col]
-                        raw_result_array = self.create_result_array(temp_data, metrics_func_list, kwargs_list)
+                        raw_result_array = self.create_result_array(temp_data, metrics_func_list, kwargs_list, adapters,
+                                                                    failures)
                         processed_result_array = self.process_result_array(raw_result_array, metrics_name_list)
                         result_dict[colname] = processed_result_array
                     except Exception as e:
@@ -409,7 +706,8 @@ class Array_processor:
                 for row in range(data_frame.shape[0]):
                     try:
                         temp_data = data_frame[row, :]
-                        raw_result_array = self.create_result_array(temp_data, metrics_func_list, kwargs_list)
+                        raw_result_array = self.create_result_array(temp_data, metrics_func_list, kwargs_list, adapters,
+                                                                    failures)
                         processed_result_array = self.process_result_array(raw_result_array, metrics_name_list)
                         result_dict[row] = processed_result_array
                     except Exception as e:
@@ -417,12 +715,14 @@ class Array_processor:
                         result_dict[row] = None
         else:
             try:
-                raw_result_array = self.create_result_array(self.data, metrics_func_list, kwargs_list)
+                raw_result_array = self.create_result_array(self.data, metrics_func_list, kwargs_list, adapters,
+                                                            failures)
                 processed_result_array = self.process_result_array(raw_result_array, metrics_name_list)
                 result_dict = {column: processed_result_array for column in range(self.data.shape[1])}
             except Exception as e:
                 print(f"Error processing entire data frame: {e}")
                 result_dict = {}
+        self.report_failures(failures, len(columns) if channelwise else 1)
 
         return result_dict, metrics_name_list
 
@@ -514,12 +814,13 @@ class Array_processor:
 
 
         try:
-            # Initialize metrics to be calculated
-            metrics_functions, metrics_name_list, kwargs_list = self.initialize_metric_functions(self.metric_name)
+            # Initialize metrics to be calculated, compiled once per process
+            metric_set = metric_registry.get_metric_set(self.metric_path, self.metric_name)
+            metrics_functions, metrics_name_list, kwargs_list = metric_set.as_lists()
 
             # Calculate the results for the metrics and store them in a dictionary
             result_dict, metrics_name_list = self.create_result_dict_from_eeg_frame(
-                dataframe, metrics_functions, metrics_name_list, kwargs_list
+                dataframe, metrics_functions, metrics_name_list, kwargs_list, adapters=metric_set.adapters
             )
 
             # Create the sub-results dataframe from the results dictionary
@@ -531,24 +832,134 @@ class Array_processor:
 
         return sub_results_frame
 
-    def epoching(self, duration: int, start_time: int = 0, stop_time: Optional[int] = None,
-                 overlap: int = 0, task: Optional[str] = None) -> pd.DataFrame:
+    def get_channel_buffer(self) -> Tuple[List[Union[str, int]], np.ndarray]:
         """
-        Divide data into epochs and calculate metrics for each epoch.
+        Returns the channel names and a contiguous channel-major buffer of the data.
+
+        The buffer has the shape (n_channels, n_samples) and the dtype of the processor. It is created only once per
+        data object, so all epochs can be taken as views of the same memory. If n_jobs > 1 the buffer lives in
+        shared memory.
+
+        Returns:
+            tuple:
+                - channel_names (list): Names of the channels in the order of the buffer rows.
+                - buffer (np.ndarray): C-contiguous array of shape (n_channels, n_samples).
+        """
+        if self._channel_buffer is None:
+            values = self.data.to_numpy() if isinstance(self.data, pd.DataFrame) else self.data
+            if self.axis_of_time == 0:
+                values = values.T
+            channel_names = self.get_data_channel_names()
+            if self.n_jobs > 1:
+                # Worker processes attach to the buffer by name, so epoch tasks transfer no signal bytes
+                self._shared_signal = SharedSignal.empty(values.shape, self.dtype, channel_names, self.sfreq)
+                self._shared_signal.array[...] = values
+                buffer = self._shared_signal.array
+            else:
+                buffer = np.ascontiguousarray(values, dtype=self.dtype)
+            self._channel_buffer = (channel_names, buffer)
+        return self._channel_buffer
+
+    def get_channel_names(self) -> List[Union[str, int]]:
+        """
+        Returns the names of the analysed channels.
+
+        Returns:
+            list: The channel names of the stream, of the lazy montage or else of the data.
+        """
+        if self.stream is not None:
+            return list(self.stream.channel_names)
+        if self.montage is not None:
+            return list(self.montage.channel_names)
+        return self.get_data_channel_names()
+
+    def get_data_channel_names(self) -> List[Union[str, int]]:
+        """
+        Returns the names of the channels of the data.
+
+        Returns:
+            list: The column (axis_of_time=0) or index (axis_of_time=1) labels of a dataframe, or the channel names of
+                  an array or its channel indices if no names were given.
+        """
+        if isinstance(self.data, pd.DataFrame):
+            return list(self.data.columns) if self.axis_of_time == 0 else list(self.data.index)
+        n_channels = self.data.shape[1] if self.axis_of_time == 0 else self.data.shape[0]
+        return list(self.channel_names) if self.channel_names is not None else list(range(n_channels))
+
+    def get_n_samples(self) -> int:
+        """
+        Returns the number of samples of the data or of the stream.
+        """
+        if self.stream is not None:
+            return self.stream.n_samples
+        return self.data.shape[0] if self.axis_of_time == 0 else self.data.shape[1]
+
+    def get_epoch_frame(self, start: int, stop: int) -> pd.DataFrame:
+        """
+        Returns the samples start to stop of all channels as dataframe, in the layout given by axis_of_time.
 
         Parameters:
-            duration (int): Length of each epoch in seconds (mandatory).
+            start (int): Index of the first sample.
+            stop (int): Index after the last sample.
+
+        Returns:
+            pd.DataFrame: The samples of the epoch, channels are labelled with their names.
+        """
+        if self.montage is not None:
+            values = self.data.to_numpy() if isinstance(self.data, pd.DataFrame) else self.data
+            values = values[start:stop, :].T if self.axis_of_time == 0 else values[:, start:stop]
+            values = self.montage.apply(np.asarray(values, dtype=np.float64))
+            if self.axis_of_time == 0:
+                return pd.DataFrame(values.T, columns=self.get_channel_names())
+            return pd.DataFrame(values, index=self.get_channel_names())
+        if isinstance(self.data, pd.DataFrame):
+            if self.axis_of_time == 0:
+                return self.data.iloc[start:stop, :]
+            return self.data.iloc[:, start:stop]
+        if self.axis_of_time == 0:
+            return pd.DataFrame(self.data[start:stop, :], columns=self.get_channel_names())
+        return pd.DataFrame(self.data[:, start:stop], index=self.get_channel_names())
+
+    def release_channel_buffer(self) -> None:
+        """
+        Drops the channel buffer and releases its shared memory block, if there is one.
+        """
+        self._channel_buffer = None
+        if self._shared_signal is not None:
+            self._shared_signal.close()
+            self._shared_signal = None
+
+    def close(self) -> None:
+        """
+        Releases the channel buffer and its shared memory, saves the cost model and closes the metric cache. The
+        processor can still be used afterwards, without the metric cache. The process pool is shared by all
+        processors and kept for the next file, see parallel.shutdown_worker_pool.
+        """
+        self.release_channel_buffer()
+        self.save_cost_model()
+        if self.metric_cache is not None:
+            self.metric_cache.close()
+            self.metric_cache = None
+
+    def compute_epoch_onsets(self, duration: Optional[float], start_time: Optional[float] = 0,
+                             stop_time: Optional[float] = None, overlap: Optional[float] = 0) -> Tuple[List[int], float]:
+        """
+        Validates the epoching parameters and computes the onset of every epoch.
+
+        Parameters:
+            duration (int): Length of each epoch in seconds.
             start_time (int): Start time in seconds for epoching. Defaults to 0.
             stop_time (int): End time in seconds for epoching. Defaults to total duration.
             overlap (int): Overlap in seconds between consecutive epochs. Defaults to 0.
-            task (str): Task label for metrics calculation (optional).
 
         Returns:
-            pd.DataFrame: A dataframe containing calculated metrics for all epochs.
+            tuple:
+                - onsets (list[int]): Onsets of the epochs in seconds.
+                - duration (float): The validated duration of the epochs in seconds.
         """
-
         # Determine the total duration (in seconds) based on the data length and sampling frequency
-        total_duration = np.round(len(self.data) / self.sfreq)
+        n_samples = self.get_n_samples()
+        total_duration = np.round(n_samples / self.sfreq)
         # Validate duration
         if not duration or duration <= 0:
             duration = total_duration
@@ -575,17 +986,418 @@ class Array_processor:
             duration = stop_time - start_time
             print("The interval between start_time and stop_time is less than the duration. Setting duration to full interval.")
 
+        onsets = [int(t_onset) for t_onset in np.arange(start_time, (stop_time - duration) + 1, duration - overlap)]
+        return onsets, duration
+
+    def epoch_onset_samples(self, onsets: List[int], duration: float) -> Tuple[np.ndarray, int]:
+        """
+        Converts the onsets of the epochs to samples and drops the epochs which reach beyond the data (see
+        truncated_epochs).
+
+        Parameters:
+            onsets (list[int]): Onsets of the epochs in seconds.
+            duration (float): Duration of the epochs in seconds.
+
+        Returns:
+            tuple:
+                - onset_samples (np.ndarray): Onsets of the valid epochs in samples.
+                - n_samples (int): Length of the epochs in samples.
+        """
+        n_samples = int(duration * self.sfreq)
+        onset_samples = np.array([int(t_onset * self.sfreq) for t_onset in onsets], dtype=int)
+        # Windows that would reach beyond the data are not valid epochs
+        return onset_samples[onset_samples + n_samples <= self.get_n_samples()], n_samples
+
+    def create_epoch_tensor(self, onsets: List[int], duration: float) -> np.ndarray:
+        """
+        Creates a channel-major epoch tensor of shape (n_epochs, n_channels, n_samples).
+
+        The tensor is a read-only sliding window view on the channel buffer, no samples are copied as long as the
+        onsets are evenly spaced in samples. Every epoch of a channel (tensor[e, c]) is a contiguous 1-D array.
+
+        Parameters:
+            onsets (list[int]): Onsets of the epochs in seconds.
+            duration (float): Duration of the epochs in seconds.
+
+        Returns:
+            np.ndarray: The epoch tensor.
+        """
+        _, buffer = self.get_channel_buffer()
+        onset_samples, n_samples = self.epoch_onset_samples(onsets, duration)
+        return epoch_view(buffer, onset_samples, n_samples)
+
+    def truncated_epochs(self, onsets: List[int], first_epoch: int) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Yields the final epochs which reach beyond the end of the data, cut off at its end.
+
+        The total duration is rounded to full seconds, so the last epoch can reach up to half a second beyond the
+        data. Such an epoch is computed on its remaining samples, as when the data is sliced per epoch. Its length
+        differs from the other epochs, so its samples are copied into a block of their own.
+
+        Parameters:
+            onsets (list[int]): Onsets of all epochs in seconds.
+            first_epoch (int): Index of the first epoch which reaches beyond the data, see epoch_onset_samples.
+
+        Yields:
+            tuple: (index of the epoch, tensor of shape (1, n_channels, n_remaining_samples)).
+        """
+        n_samples = self.get_n_samples()
+        for epoch_idx in range(first_epoch, len(onsets)):
+            start = int(onsets[epoch_idx] * self.sfreq)
+            if start >= n_samples:
+                break
+            if self.stream is not None:
+                samples = self.stream.chunk(start, n_samples)
+            else:
+                _, buffer = self.get_channel_buffer()
+                samples = buffer[:, start:]
+                if self.montage is not None:
+                    samples = self.montage.apply(samples)
+            yield epoch_idx, np.ascontiguousarray(samples)[np.newaxis]
+
+    def calc_metrics_from_epoch_tensor(self, epoch_tensor: np.ndarray, channel_names: List[Union[str, int]],
+                                       onsets: List[int], duration: float,
+                                       label: Union[str, int, float, None] = None) -> pd.DataFrame:
+        """
+        Computes the metrics for every epoch of an epoch tensor.
+
+        Parameters:
+            epoch_tensor (np.ndarray): Tensor of shape (n_epochs, n_channels, n_samples).
+            channel_names (list): Names of the channels along the second axis of the tensor.
+            onsets (list[int]): Onsets of the epochs in seconds.
+            duration (float): Duration of the epochs in seconds.
+            label (str): Label associated with the epochs.
+
+        Returns:
+            pd.DataFrame: A dataframe containing calculated metrics for all epochs, in the same layout as
+                          calc_metrics_from_eeg_dataframe_and_annotations.
+        """
+        return self.calc_metrics_from_epoch_blocks([(0, epoch_tensor)], channel_names, onsets[:len(epoch_tensor)],
+                                                   duration, label)
+
+    def calc_metrics_from_epoch_blocks(self, epoch_blocks: Iterable[Tuple[int, np.ndarray]],
+                                       channel_names: List[Union[str, int]], onsets: List[int], duration: float,
+                                       label: Union[str, int, float, None] = None) -> pd.DataFrame:
+        """
+        Computes the metrics for epochs which are delivered block by block.
+
+        Only one block has to be in memory at a time, the results of all epochs are collected in one accumulator.
+
+        Parameters:
+            epoch_blocks (iterable): (index of the first epoch of the block, tensor of shape (n_block_epochs,
+                                     n_channels, n_samples)) for consecutive blocks of epochs, e.g. from
+                                     StreamReader.epochs.
+            channel_names (list): Names of the channels along the second axis of the tensors.
+            onsets (list[int]): Onsets of all epochs in seconds.
+            duration (float): Duration of the epochs in seconds.
+            label (str): Label associated with the epochs.
+
+        Returns:
+            pd.DataFrame: A dataframe containing calculated metrics for all epochs, in the same layout as
+                          calc_metrics_from_eeg_dataframe_and_annotations.
+        """
+        if not isinstance(label, (str, int, float)):
+            label = '<missing>'
+            print('no label was provided, using <missing> instead.')
+
+        try:
+            # With n_jobs > 1 the metrics are set up in the workers, which compute them
+            metric_set = metric_registry.get_metric_set(self.metric_path, self.metric_name, setup=self.n_jobs == 1)
+        except Exception as e:
+            raise RuntimeError("Error occurred during calculating metrics for EEG epoch tensor.") from e
+
+        # All results are written into one preallocated (epochs, metrics, channels) array
+        accumulator = ResultAccumulator(len(onsets), metric_set.names, channel_names, dtype=self.dtype)
+        for epoch_idx, t_onset in enumerate(onsets):
+            accumulator.set_epoch(epoch_idx, label, t_onset, duration)
+        if len(onsets) == 0:
+            return accumulator.to_dataframe()
+
+        # (functions, epochs, channels) cells which still have to be computed
+        missing = np.ones((len(metric_set.functions), len(onsets), len(channel_names)), dtype=bool)
+        if self.existing_results is not None:
+            found = accumulator.fill_from_dataframe(self.existing_results)
+            metric_index = {name: i for i, name in enumerate(metric_set.names)}
+            for function_idx, output_names in enumerate(metric_set.output_names):
+                output_idx = [metric_index[name] for name in output_names]
+                missing[function_idx] &= ~found[:, output_idx, :].all(axis=1)
+
+        for first_epoch, epoch_tensor in epoch_blocks:
+            if len(epoch_tensor) == 0:
+                continue
+            epochs = slice(first_epoch, first_epoch + len(epoch_tensor))
+            # basic slices, so the cache and the computation write into the accumulator
+            block_missing, block_values = missing[:, epochs], accumulator.values[epochs]
+            print(f'Calculating for times: {onsets[epochs.start]} to {onsets[epochs.stop - 1] + duration} seconds')
+            if self.metric_cache is not None:
+                digests = epoch_digests(epoch_tensor, self.sfreq)
+                cache_missing, keys = self.metric_cache.lookup(metric_set, digests, block_values)
+                block_missing &= cache_missing
+            if not block_missing.all():
+                print(f'{np.count_nonzero(block_missing)} of {block_missing.size} results have to be computed, '
+                      f'the others are reused')
+
+            self.calc_missing_values(epoch_tensor, metric_set, block_missing, block_values)
+            if self.metric_cache is not None:
+                self.metric_cache.store(metric_set, keys, block_values, block_missing)
+
+        return accumulator.to_dataframe()
+
+    def compute_values(self, epoch_tensor: np.ndarray, metric_set: MetricSet,
+                       function_indices: Optional[List[int]] = None) -> np.ndarray:
+        """
+        Computes metric functions on an epoch tensor, in parallel if n_jobs > 1, and learns their runtimes.
+
+        Parameters:
+            epoch_tensor (np.ndarray): Tensor of shape (n_epochs, n_channels, n_samples).
+            metric_set (MetricSet): The resolved metric set.
+            function_indices (list[int], optional): Indices of the metric functions to compute, defaults to all.
+
+        Returns:
+            np.ndarray: Results of shape (n_epochs, n_metrics, n_channels), NaN for metrics which were not computed.
+        """
+        if self.n_jobs > 1 and epoch_tensor.shape[0] * epoch_tensor.shape[1] > 1:
+            return run_epoch_tasks(self, epoch_tensor, metric_set, self.n_jobs, function_indices)
+
+        timings = {}
+        values = self.calc_metric_values(epoch_tensor, function_indices=function_indices, timings=timings)
+        # Learn the metric runtimes, so later parallel runs can be scheduled
+        cost_model = self.get_cost_model()
+        identities = metric_set.identities
+        n_calls = epoch_tensor.shape[0] * epoch_tensor.shape[1]
+        for function_idx, seconds in timings.items():
+            cost_model.record(identities[function_idx], epoch_tensor.shape[2], seconds, n_calls)
+        return values
+
+    def calc_missing_values(self, epoch_tensor: np.ndarray, metric_set: MetricSet, missing: np.ndarray,
+                            out: np.ndarray) -> None:
+        """
+        Computes the results which are marked as missing and writes them into a result array.
+
+        A function is computed on all channels of every epoch in which at least one channel is missing. Functions
+        missing in the same epochs are computed together.
+
+        Parameters:
+            epoch_tensor (np.ndarray): Tensor of shape (n_epochs, n_channels, n_samples).
+            metric_set (MetricSet): The resolved metric set.
+            missing (np.ndarray): Boolean array of shape (n_functions, n_epochs, n_channels).
+            out (np.ndarray): Result array of shape (n_epochs, n_metrics, n_channels).
+        """
+        metric_index = {name: i for i, name in enumerate(metric_set.names)}
+        groups = {}
+        for function_idx in range(len(metric_set.functions)):
+            epochs = tuple(np.flatnonzero(missing[function_idx].any(axis=1)))
+            if epochs:
+                groups.setdefault(epochs, []).append(function_idx)
+
+        for epochs, function_indices in groups.items():
+            epochs = np.array(epochs)
+            steps = np.diff(epochs)
+            if len(steps) == 0 or np.all(steps == steps[0]):
+                # Evenly spaced epochs (e.g. an extended stop_time) keep the tensor a view on the channel buffer
+                step = int(steps[0]) if len(steps) else 1
+                sub_tensor = epoch_tensor[epochs[0]:epochs[-1] + 1:step]
+            else:
+                sub_tensor = epoch_tensor[epochs]
+            values = self.compute_values(sub_tensor, metric_set, function_indices)
+            output_idx = [metric_index[name] for function_idx in function_indices
+                          for name in metric_set.output_names[function_idx]]
+            out[np.ix_(epochs, output_idx, np.arange(out.shape[2]))] = values[:, output_idx, :]
+
+    def calc_metric_values(self, epoch_tensor: np.ndarray, out: Optional[np.ndarray] = None,
+                           verbose: bool = True, function_indices: Optional[List[int]] = None,
+                           timings: Optional[Dict[int, float]] = None) -> np.ndarray:
+        """
+        Computes the metrics of the metric set for every epoch and channel of an epoch tensor.
+
+        Parameters:
+            epoch_tensor (np.ndarray): Tensor of shape (n_epochs, n_channels, n_samples).
+            out (np.ndarray, optional): Array of shape (n_epochs, n_metrics, n_channels) the results are written to.
+            verbose (bool): If True, prints which metric is calculated.
+            function_indices (list[int], optional): Indices of the metric functions to compute, defaults to all.
+            timings (dict, optional): If given, the runtime in seconds of every computed function is stored in it
+                                      by function index.
+
+        Returns:
+            np.ndarray: Results of shape (n_epochs, n_metrics, n_channels), NaN where a calculation failed.
+        """
+        metric_set = metric_registry.get_metric_set(self.metric_path, self.metric_name)
+        metric_index = {name: i for i, name in enumerate(metric_set.names)}
+        if out is None:
+            out = np.full((epoch_tensor.shape[0], len(metric_set.names), epoch_tensor.shape[1]), np.nan,
+                          dtype=self.dtype)
+        if function_indices is None:
+            function_indices = range(len(metric_set.functions))
+
+        # Every consumer retains the shared intermediates it will request for each unit of data in advance, so they
+        # are computed once and evicted after their last consumer
+        intermediate_cache = IntermediateCache(self.sfreq)
+        consumers = {}
+        for function_idx in function_indices:
+            intermediates = get_intermediates(metric_set.functions[function_idx], metric_set.kwargs_list[function_idx])
+            if intermediates:
+                units = self._intermediate_units(epoch_tensor, metric_set.functions[function_idx])
+                intermediate_cache.retain_all(units, intermediates.values())
+                consumers[function_idx] = (intermediates, units)
+
+        for function_idx in function_indices:
+            metric_func = metric_set.functions[function_idx]
+            kwargs = metric_set.kwargs_list[function_idx]
+            output_names = metric_set.output_names[function_idx]
+            intermediates, units = consumers.get(function_idx, ({}, []))
+            if verbose:
+                print(f'Calculating {", ".join(output_names)}')
+            start = time.perf_counter()
+            batch_spec = get_batch_spec(metric_func)
+            sliding_spec = get_sliding_spec(metric_func)
+            sliding_values = None
+            if sliding_spec is not None and len(output_names) == 1:
+                # Overlapping epochs of decomposable metrics are combined from block summaries
+                sliding_values = self.apply_sliding_metric_func(epoch_tensor, metric_func, kwargs, sliding_spec)
+            if sliding_values is not None:
+                out[:, metric_index[output_names[0]], :] = sliding_values
+                intermediate_cache.release_all(units, intermediates.values())
+            elif batch_spec is not None:
+                # Batch metrics get whole blocks of epochs in a single call
+                out[:, metric_index[output_names[0]], :] = self.apply_batch_metric_func(
+                    epoch_tensor, metric_func, kwargs, batch_spec, intermediates, intermediate_cache
+                )
+            else:
+                # Scalar-only metrics fall back to one call per channel and epoch
+                self._calc_scalar_metric(epoch_tensor, metric_set.adapters[function_idx],
+                                         [metric_index[name] for name in output_names], out,
+                                         intermediates, intermediate_cache)
+            if timings is not None:
+                timings[function_idx] = time.perf_counter() - start
+        return out
+
+    def _intermediate_units(self, epoch_tensor: np.ndarray, metric_func: callable) -> List[Tuple]:
+        # The units of data a metric is called with, intermediates are shared by consumers of the same unit
+        batch_spec = get_batch_spec(metric_func)
+        if batch_spec is not None:
+            return [('block', batch_spec.ndim, start, stop)
+                    for start, stop in self.batch_blocks(epoch_tensor, batch_spec)]
+        return [('series', epoch_idx, channel_idx) for epoch_idx in range(epoch_tensor.shape[0])
+                for channel_idx in range(epoch_tensor.shape[1])]
+
+    def _calc_scalar_metric(self, epoch_tensor: np.ndarray, adapter: CallAdapter, output_idx: List[int],
+                            out: np.ndarray, intermediates: Optional[Dict[str, Intermediate]] = None,
+                            intermediate_cache: Optional[IntermediateCache] = None) -> None:
+        n_series = epoch_tensor.shape[0] * epoch_tensor.shape[1]
+        if adapter.error is not None:
+            # Reported when the metric set was loaded
+            if intermediates:
+                intermediate_cache.release_all(self._intermediate_units(epoch_tensor, adapter.func),
+                                               intermediates.values())
+            return
+        n_failed = 0
+        first_error = None
+        for epoch_idx, epoch in enumerate(epoch_tensor):
+            for channel_idx, channel_data in enumerate(epoch):
+                # Scalar metrics (e.g. of neurokit2) get float64 time series, also from a float32 signal
+                channel_data = np.ascontiguousarray(channel_data, dtype=np.float64)
+                unit = ('series', epoch_idx, channel_idx)
+                try:
+                    shared = {argument: intermediate_cache.get(unit, key, channel_data)
+                              for argument, key in (intermediates or {}).items()}
+                    values = self.flatten_result(self.call_metric(channel_data, adapter, **shared))
+                except Exception as e:
+                    n_failed += 1
+                    first_error = first_error or e
+                    continue
+                finally:
+                    if intermediates:
+                        intermediate_cache.release_all([unit], intermediates.values())
+                for metric_idx, value in zip(output_idx, values):
+                    try:
+                        out[epoch_idx, metric_idx, channel_idx] = np.nan if value is None else value
+                    except (TypeError, ValueError):
+                        n_failed += 1
+                        first_error = first_error or ValueError(f"Result {value} is not numeric.")
+        # Failures are reported once per metric instead of once per channel and epoch
+        if n_failed:
+            print(f"Could not apply metric '{adapter.name}' in {n_failed} of {n_series} channels and epochs, "
+                  f"storing NaN instead. First exception: {first_error}")
+
+    def get_cost_model(self) -> CostModel:
+        """
+        Returns the cost model of the metric runtimes, loading it from cost_model_path on first use.
+
+        Returns:
+            CostModel: The cost model.
+        """
+        if self._cost_model is None:
+            self._cost_model = CostModel(DEFAULT_COST_MODEL_PATH if self.cost_model_path is None
+                                         else self.cost_model_path or None)
+        return self._cost_model
+
+    def save_cost_model(self) -> None:
+        """
+        Merges the metric runtimes learned since the last save into the persisted cost model.
+
+        The default cost model is only written by parallel runs (n_jobs > 1), which use it for scheduling. A
+        configured cost_model_path is always written.
+        """
+        if self._cost_model is not None and (self.cost_model_path is not None or self.n_jobs > 1):
+            self._cost_model.save()
+
+    def epoching(self, duration: int, start_time: int = 0, stop_time: Optional[int] = None,
+                 overlap: int = 0, task: Optional[str] = None, use_epoch_tensor: bool = True) -> pd.DataFrame:
+        """
+        Divide data into epochs and calculate metrics for each epoch.
+
+        Parameters:
+            duration (int): Length of each epoch in seconds (mandatory).
+            start_time (int): Start time in seconds for epoching. Defaults to 0.
+            stop_time (int): End time in seconds for epoching. Defaults to total duration.
+            overlap (int): Overlap in seconds between consecutive epochs. Defaults to 0.
+            task (str): Task label for metrics calculation (optional).
+            use_epoch_tensor (bool): If True, all epochs are taken as views of one contiguous channel-major buffer
+                                     instead of slicing the dataframe per epoch. Defaults to True.
+
+        Returns:
+            pd.DataFrame: A dataframe containing calculated metrics for all epochs.
+        """
+        onsets, duration = self.compute_epoch_onsets(duration, start_time, stop_time, overlap)
+        # Epochs which reach beyond the data are kept with their remaining samples, see truncated_epochs
+        onsets = [t_onset for t_onset in onsets if int(t_onset * self.sfreq) < self.get_n_samples()]
+
+        if self.stream is not None:
+            # The epochs are read, preprocessed and computed chunk by chunk
+            onset_samples, n_samples = self.epoch_onset_samples(onsets, duration)
+            return self.calc_metrics_from_epoch_blocks(
+                chain(self.stream.epochs(onset_samples, n_samples), self.truncated_epochs(onsets, len(onset_samples))),
+                self.get_channel_names(), onsets, duration, task
+            )
+
+        if use_epoch_tensor and self.montage is not None:
+            # The epochs are re-referenced block by block, as views on the re-referenced samples of each block
+            _, buffer = self.get_channel_buffer()
+            onset_samples, n_samples = self.epoch_onset_samples(onsets, duration)
+            return self.calc_metrics_from_epoch_blocks(
+                chain(self.montage.epoch_blocks(buffer, onset_samples, n_samples, self.max_batch_samples),
+                      self.truncated_epochs(onsets, len(onset_samples))),
+                self.get_channel_names(), onsets, duration, task
+            )
+
+        if use_epoch_tensor:
+            channel_names, _ = self.get_channel_buffer()
+            epoch_tensor = self.create_epoch_tensor(onsets, duration)
+            return self.calc_metrics_from_epoch_blocks(
+                chain([(0, epoch_tensor)], self.truncated_epochs(onsets, len(epoch_tensor))),
+                channel_names, onsets, duration, task
+            )
+
         # Initialize results container
         results = []
 
         # Iterate through epochs
-        for t_onset in np.arange(start_time, (stop_time - duration) + 1, duration - overlap):
-            t_onset = int(t_onset)
+        for t_onset in onsets:
             t_onset_samples = int(t_onset * self.sfreq)  # Convert time to sample index
             t_stop_samples = int((t_onset + duration) * self.sfreq)  # Calculate end sample index
 
             # Extract the EEG dataframe for this epoch
-            eeg_dataframe = self.data.iloc[t_onset_samples:t_stop_samples, :]
+            eeg_dataframe = self.get_epoch_frame(t_onset_samples, t_stop_samples)
 
             # Calculate metrics for the current epoch
             print(f'Calculating for times: {t_onset} to {t_onset + duration} seconds')
@@ -599,4 +1411,4 @@ class Array_processor:
         # Combine all epochs into a single dataframe
         full_epoch_frame = pd.concat(results, axis=0) if results else pd.DataFrame()
 
-        return full_epoch_frame
\ No newline at end of file
+        return full_epoch_frame
@@ -0,0 +1,92 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Precompiled metric calls for EEG analysis.
+
+This module provides the CallAdapter class. A metric function and its kwargs are compiled once per metric set into
+an adapter which calls the function with the right calling convention (see eeganalyzer.metrics.calling). The
+per-channel loop then calls the adapter without any validation or retry, and signature mismatches are reported once
+when the metric set is loaded.
+"""
+
+import inspect
+from typing import Any, Callable, Dict, Optional
+
+from eeganalyzer.metrics.calling import KEYWORD, POSITIONAL, get_call_convention
+
+
+class CallAdapter:
+    """
+    Calls a metric function on a time series with its compiled arguments.
+
+    Attributes:
+        func (callable): The metric function.
+        name (str): Name of the function, used in messages.
+        convention (str): 'keyword' or 'positional'.
+        kwargs (dict): Keyword arguments, for the keyword convention.
+        args (tuple): Positional arguments after the time series, for the positional convention.
+        error (str): Why the function cannot be called with its kwargs, None if it can. Invalid adapters return
+            None without calling the function.
+    """
+
+    def __init__(self, func: Callable, kwargs: Optional[Dict[str, Any]] = None,
+                 convention: Optional[str] = None) -> None:
+        self.func = func
+        self.name = getattr(func, '__name__', None) or repr(func)
+        self.error = None
+        kwargs = dict(kwargs or {})
+        self.convention = convention or get_call_convention(func) or self._inspect_convention(func, kwargs)
+        self.kwargs = kwargs if self.convention == KEYWORD else {}
+        self.args = tuple(kwargs.values()) if self.convention == POSITIONAL else ()
+
+    def _inspect_convention(self, func: Callable, kwargs: Dict[str, Any]) -> str:
+        if not kwargs:
+            return KEYWORD
+        try:
+            signature = inspect.signature(func)
+        except (TypeError, ValueError):
+            # e.g. MATLAB engine functions, which only take positional arguments
+            print(f"The signature of metric '{self.name}' cannot be inspected, its kwargs are passed as positional "
+                  f"arguments in the given order.")
+            return POSITIONAL
+        try:
+            signature.bind_partial(None, **kwargs)
+            return KEYWORD
+        except TypeError as keyword_error:
+            try:
+                signature.bind_partial(None, *kwargs.values())
+            except TypeError:
+                self.error = str(keyword_error)
+                print(f"Metric '{self.name}' does not accept the arguments {list(kwargs)}: {keyword_error}. "
+                      f"It will not be computed.")
+                return KEYWORD
+            print(f"Metric '{self.name}' does not accept the keyword arguments {list(kwargs)}, they are passed as "
+                  f"positional arguments in the given order.")
+            return POSITIONAL
+
+    def __call__(self, data: Any, **extra_kwargs: Any) -> Any:
+        """
+        Calls the metric function on a time series.
+
+        Args:
+            data: The time series.
+            **extra_kwargs: Additional keyword arguments, e.g. shared intermediates.
+
+        Returns:
+            The output of the metric function, None for invalid adapters.
+        """
+        if self.error is not None:
+            return None
+        if self.convention == POSITIONAL:
+            return self.func(data, *self.args, **extra_kwargs)
+        return self.func(data, **self.kwargs, **extra_kwargs)
@@ -16,12 +16,20 @@ CSV processor for EEG analysis.
 This module provides the CSVProcessor class for processing CSV data.
 """
 
+import os
+from typing import Union
+
 import pandas as pd
-from scipy.signal import butter, filtfilt, resample_poly
 
 from eeganalyzer.core.array_processor import Array_processor
+from eeganalyzer.core.resampling import ResampleFilterStage
+from eeganalyzer.core.result_accumulator import (check_preprocessing_settings, merge_result_frames, read_result_frame,
+                                                  write_preprocessing_settings)
 from eeganalyzer.utils.buttler import Buttler
 
+# Order of the Butterworth filters of CSV files
+DEFAULT_CSV_FILTER_ORDER = 5
+
 
 class CSVProcessor:
     """
@@ -32,9 +40,18 @@ class CSVProcessor:
     and calculating metrics.
     """
 
-    def __init__(self, datapath: str, header=0, index=0, sfreq: int = None, remove_first_column: bool = False):
+    def __init__(self, datapath: str, header=0, index=0, sfreq: int = None, remove_first_column: bool = False,
+                 n_jobs: int = 1, metric_cache: str = None, dtype: str = None, filter_order: int = None,
+                 filter_design: str = None):
         self.datapath = datapath
         self.sfreq = sfreq
+        self.n_jobs = n_jobs
+        self.metric_cache = metric_cache
+        self.dtype = dtype
+        # Order of the Butterworth filters and the design of the one-stage preprocessing (see
+        # eeganalyzer.core.resampling), without a design the data is filtered and then resampled (see preprocess)
+        self.filter_order = filter_order or DEFAULT_CSV_FILTER_ORDER
+        self.filter_design = filter_design
         self.remove_first_column = remove_first_column
         self.data = self.load_data_file(datapath, header, index)
         self.buttler = Buttler()  # Optional utility for handling file operations
@@ -60,6 +77,8 @@ class CSVProcessor:
             # If remove_time_vector is True, remove the first column
             if self.remove_first_column:
                 data = data.iloc[:, 1:]
+            if self.dtype is not None:
+                data = data.astype(self.dtype, copy=False)
             return data
         except FileNotFoundError:
             print(f"File not found: {data_file}. Please check the filepath.")
@@ -70,9 +89,26 @@ class CSVProcessor:
         return None
 
 
+    def apply_stage(self, stage: ResampleFilterStage):
+        """
+        Filters and resamples the data columns with a ResampleFilterStage (see eeganalyzer.core.resampling).
+
+        Args:
+        - stage (ResampleFilterStage): The stage, created for the sampling frequency of the data.
+
+        Updates:
+        - The `data` attribute and the sampling frequency are replaced by the processed data.
+        """
+        processed_data = stage.apply(self.data.to_numpy().T).T
+        if self.dtype is not None:
+            processed_data = processed_data.astype(self.dtype, copy=False)
+        self.data = pd.DataFrame(processed_data, columns=self.data.columns)
+        self.sfreq = stage.sfreq
+
     def downsample(self, resamp_freq):
         """
-        Resamples the data to a new sampling frequency using scipy's resample_poly.
+        Resamples the data to a new sampling frequency with a polyphase filter, the ratio of the frequencies is
+        reduced to its smallest terms.
 
         Args:
         - resamp_freq (int): Target resampling frequency in Hz.
@@ -84,28 +120,23 @@ class CSVProcessor:
             print(f"Invalid resampling frequency: {resamp_freq}. Frequency must be a positive number.")
             return
         if self.sfreq and self.sfreq > resamp_freq:
-            # Compute the integer factors for downsampling using resample_poly
-            up = resamp_freq
-            down = self.sfreq
             try:
-                resampled_data = resample_poly(self.data.to_numpy(), up, down, axis=0)
-                self.data = pd.DataFrame(resampled_data, columns=self.data.columns)  # Convert back to DataFrame
-                self.sfreq = resamp_freq
+                self.apply_stage(ResampleFilterStage(self.sfreq, resamp_freq=resamp_freq, design='butterworth'))
             except Exception as e:
                 print(f"An error occurred during resampling: {e}")
         else:
             print(f"Resampling frequency {resamp_freq} must be lower than the current sampling frequency {self.sfreq}.")
 
 
-    def apply_filter(self, l_freq: float = None, h_freq: float = None, order: int = 5):
+    def apply_filter(self, l_freq: float = None, h_freq: float = None, order: int = None):
         """
-        Applies zero-phase (two-pass) filtering to the data columns using filtfilt.
-        Can perform high-pass, low-pass, or band-pass filtering.
+        Applies zero-phase (two-pass) Butterworth filtering in second-order sections to the data columns.
+        Can perform high-pass, low-pass, band-pass or (l_freq above h_freq) band-stop filtering.
 
         Args:
         - l_freq (float): The lower cutoff frequency for filtering (high-pass).
         - h_freq (float): The higher cutoff frequency for filtering (low-pass).
-        - order (int): The order of the filter. Default is 5.
+        - order (int): The order of the filter. Defaults to the filter order of the processor.
 
         Outputs:
         - None. The `data` attribute is modified in place.
@@ -114,36 +145,65 @@ class CSVProcessor:
             print("Data not loaded or sampling frequency not set. Cannot apply filtering.")
             return
         try:
-            # Calculate Nyquist frequency
-            nyquist = 0.5 * self.sfreq
-
-            # Set up filter parameters based on l_freq and h_freq
-            if l_freq and h_freq:
-                low = l_freq / nyquist
-                high = h_freq / nyquist
-                b, a = butter(order, [low, high], btype='band')
-            elif l_freq:
-                low = l_freq / nyquist
-                b, a = butter(order, low, btype='high')
-            elif h_freq:
-                high = h_freq / nyquist
-                b, a = butter(order, high, btype='low')
-            else:
+            stage = ResampleFilterStage(self.sfreq, l_freq, h_freq, order=order or self.filter_order,
+                                        design='butterworth')
+            if stage.pre_band is None:
                 print("No filtering performed as both l_freq and h_freq are not specified.")
                 return
+            self.apply_stage(stage)
+        except Exception as e:
+            print(f"An error occurred during filtering: {e}")
+
+    def preprocess(self, l_freq: float = None, h_freq: float = None, resamp_freq=None):
+        """
+        Filters and downsamples the data. Without a filter design, the data is filtered with apply_filter and then
+        downsampled. With a filter design, the data is filtered and downsampled in one stage of this design, with the
+        'butterworth' design the low-pass can then be the anti-aliasing filter of the resampling and the high-pass is
+        filtered at the lower rate.
 
-            # Apply zero-phase filtering with filtfilt
-            numeric_data = self.data.to_numpy()
-            filtered_data = filtfilt(b, a, numeric_data, axis=0)
-            self.data = pd.DataFrame(filtered_data, columns=self.data.columns)
+        Args:
+        - l_freq (float): The lower cutoff frequency for filtering (high-pass).
+        - h_freq (float): The higher cutoff frequency for filtering (low-pass).
+        - resamp_freq (float): Target resampling frequency in Hz, None for no resampling.
 
+        Outputs:
+        - None. The `data` attribute is modified in place.
+        """
+        if self.filter_design is None:
+            if l_freq or h_freq:
+                self.apply_filter(l_freq, h_freq)
+            if resamp_freq:
+                self.downsample(resamp_freq)
+            return
+        if resamp_freq and resamp_freq >= self.sfreq:
+            print(f"Resampling frequency {resamp_freq} must be lower than the current sampling frequency {self.sfreq}.")
+        try:
+            stage = ResampleFilterStage(self.sfreq, l_freq, h_freq, resamp_freq, self.filter_order, self.filter_design)
+            if stage.pre_band is None and stage.window is None:
+                return
+            self.apply_stage(stage)
         except Exception as e:
-            print(f"Error loading CSV file: {e}")
-            return None, None
+            print(f"An error occurred during filtering and resampling: {e}")
+
+    def preprocessing_settings(self, l_freq: float = None, h_freq: float = None, resamp_freq=None) -> dict:
+        """
+        Returns the preprocessing settings of a run, which are recorded with its results, so a run which only
+        computes the missing results does not merge results of different preprocessing (see
+        eeganalyzer.core.result_accumulator.check_preprocessing_settings).
+        """
+        if self.filter_design is None:
+            method = f'sos-then-polyphase-{self.filter_order}'
+        elif self.filter_design == 'butterworth':
+            method = f'sos-polyphase-{self.filter_order}'
+        else:
+            method = self.filter_design
+        resampled = bool(resamp_freq) and resamp_freq < self.sfreq
+        return {'l_freq': l_freq, 'h_freq': h_freq, 'resamp_freq': resamp_freq if resampled else None,
+                'method': method}
 
     def compute_metrics(self, metric_set_name: str, metric_path: str, outfile: str, l_freq=None, h_freq=None,
                         ep_start: int = None, ep_stop: int = None, ep_dur: int = None, overlap: int = 0,
-                        resamp_freq=None, repeat_measurement: bool = False) -> str:
+                        resamp_freq=None, repeat_measurement: Union[bool, str] = False) -> str:
         """
         Compute metrics for CSV data.
 
@@ -158,27 +218,36 @@ class CSVProcessor:
             ep_dur (int, optional): Duration of individual epochs in seconds. Defaults to None.
             overlap (int, optional): Amount of overlap between epochs in seconds. Defaults to 0.
             resamp_freq (float, optional): Frequency to which the data will be downsampled. Defaults to None.
-            repeat_measurement (bool, optional): If True, recalculate metrics even if the output file exists. Defaults to False.
+            repeat_measurement (bool or str, optional): If True, recalculate metrics even if the output file exists.
+                If 'missing', only the results missing in the existing file are computed and merged into it.
+                Defaults to False.
 
         Returns:
             str: A message indicating the outcome of the processing.
         """
         try:
             # Check the name of the outfile
-            outfile_check, outfile_check_message = self.buttler.check_outfile_name(outfile, file_exists_ok=repeat_measurement)
+            outfile_check, outfile_check_message = self.buttler.check_outfile_name(
+                outfile, file_exists_ok=bool(repeat_measurement)
+            )
             if not outfile_check:
                 return outfile_check_message
+            existing_results = None
+            if repeat_measurement == 'missing' and os.path.exists(outfile):
+                existing_results = read_result_frame(outfile)
 
             # Validate that data exists
             if self.data is None or self.sfreq is None:
                 return "Data not loaded or sampling frequency not set."
 
-            # Apply filtering
-            self.apply_filter(l_freq=l_freq, h_freq=h_freq)
+            # Results of a different preprocessing are not merged with the new ones
+            settings = self.preprocessing_settings(l_freq, h_freq, resamp_freq)
+            if existing_results is not None and not check_preprocessing_settings(outfile, settings):
+                return ('existing results were preprocessed differently, skipping file (recompute them with '
+                        'repeat_measurement set to true)')
 
-            # Downsample if required
-            if resamp_freq:
-                self.downsample(resamp_freq)
+            # Filter and downsample if required
+            self.preprocess(l_freq=l_freq, h_freq=h_freq, resamp_freq=resamp_freq)
 
             # Initialize the ArrayProcessor for metric calculation
             array_processor = Array_processor(
@@ -187,19 +256,30 @@ class CSVProcessor:
                 axis_of_time=0,
                 metric_name=metric_set_name,
                 metric_path=metric_path,
+                n_jobs=self.n_jobs,
+                metric_cache=self.metric_cache,
+                existing_results=existing_results,
+                dtype=self.dtype,
             )
 
             # Extract default or provided epoching parameters
-            result_frame = array_processor.epoching(
-                duration=ep_dur,
-                start_time=ep_start,
-                stop_time=ep_stop,
-                overlap=overlap
-            )
+            try:
+                result_frame = array_processor.epoching(
+                    duration=ep_dur,
+                    start_time=ep_start,
+                    stop_time=ep_stop,
+                    overlap=overlap
+                )
+            finally:
+                array_processor.close()
+
+            # Keep the results of the existing file which were not requested again
+            result_frame = merge_result_frames(existing_results, result_frame)
 
             # Save dataframe to csv
             if not result_frame.empty:
                 result_frame.to_csv(outfile)
+                write_preprocessing_settings(outfile, settings)
                 return 'finished and saved successfully'
             else:
                 return 'no metrics could be calculated'
@@ -16,11 +16,20 @@ EEG processor for EEG analysis.
 This module provides the EEG_processor class for processing EEG data.
 """
 
+import os
+from typing import Union
+
 import mne
+import numpy as np
 import pandas as pd
-from icecream import ic
 
 from eeganalyzer.core.array_processor import Array_processor
+from eeganalyzer.core.montage import Montage, compile_montage, montage_identity
+from eeganalyzer.core.resampling import DEFAULT_FILTER_DESIGN, DEFAULT_FILTER_ORDER, ResampleFilterStage
+from eeganalyzer.core.result_accumulator import (check_preprocessing_settings, merge_result_frames, read_result_frame,
+                                                  write_preprocessing_settings)
+from eeganalyzer.core.signal_cache import SignalCache
+from eeganalyzer.core.stream_reader import StreamReader
 from eeganalyzer.utils.buttler import Buttler
 
 
@@ -33,12 +42,50 @@ class EEG_processor:
     changing montages, downsampling, and calculating metrics.
     """
 
-    def __init__(self, datapath, preload: bool = True):
+    def __init__(self, datapath, preload: bool = True, n_jobs: int = 1, metric_cache: str = None, dtype: str = None,
+                 chunk_duration: float = None, signal_cache: str = None, signal_cache_size: float = None,
+                 share_preprocessing: bool = False, lazy_montage: bool = False, filter_order: int = None,
+                 filter_design: str = None):
         self.datapath = datapath
+        self.n_jobs = n_jobs
+        self.metric_cache = metric_cache
+        # Preprocessed signals are reused from the signal cache, see compute_metrics
+        self.signal_cache = SignalCache(signal_cache, signal_cache_size) if signal_cache else None
+        self.cached_signal = None
+        # The signal is filtered and re-referenced in float64 and converted when it is handed to the Array_processor
+        self.dtype = dtype
+        # Design ('mne' by default or 'butterworth') and order of the Butterworth filters, see
+        # eeganalyzer.core.resampling
+        self.filter_design = filter_design
+        self.filter_order = filter_order
+        # With a chunk duration the file is never loaded as a whole, but streamed through a StreamReader
+        self.chunk_duration = chunk_duration
+        self.stream_reader = None
+        # The compiled montage, applied to the whole signal or, with lazy_montage, per block of epochs
+        self.montage = None
+        self.lazy_montage = lazy_montage
+        if chunk_duration:
+            preload = False
+        self.existing_results = None
         self.raw, self.sfreq = self.load_data_file(datapath, preload)
         self.info = self.raw.info
+        # The preprocessed EEG channels as (channel names, array of shape (n_channels, n_samples) in µV at sfreq), the
+        # raw instance itself is never filtered or resampled
+        self.signal = None
+        # With shared preprocessing, compute_metrics can be called for several runs, the loaded, filtered and
+        # downsampled signals are kept for the following runs
+        self.stages = {} if share_preprocessing else None
         self.buttler = Buttler()
 
+    def close(self):
+        """
+        Closes the signal cache once the processor is done with the file. Signals opened from the cache stay
+        readable, later runs preprocess the file without the cache.
+        """
+        if self.signal_cache is not None:
+            self.signal_cache.close()
+            self.signal_cache = None
+
     def load_data_file(self, data_file: str, preload: bool = True):
         """
         Loads an EEG file into an mne raw instance and extracts its sampling frequency.
@@ -65,57 +112,100 @@ class EEG_processor:
         """
         self.raw.load_data()
 
+    def eeg_picks(self) -> list:
+        """
+        Returns the names of the EEG channels of the raw instance which are not marked as bad.
+        """
+        return [self.raw.ch_names[i] for i in mne.pick_types(self.raw.info, eeg=True, exclude='bads')]
+
+    def load_eeg_signal(self):
+        """
+        Sets the signal to the EEG channels of the raw instance which are not marked as bad, in µV at the sampling
+        frequency of the recording. Files which are not preloaded are read directly into the signal.
+        """
+        picks = self.eeg_picks()
+        self.signal = (picks, self.raw.get_data(picks=picks, units='uV'))
+        self.sfreq = self.raw.info['sfreq']
+
+    def create_stage(self, l_freq: float = None, h_freq: float = None, resamp_freq=None) -> ResampleFilterStage:
+        """
+        Creates the ResampleFilterStage which filters and downsamples the signal (see eeganalyzer.core.resampling).
+        """
+        l_freq = None if l_freq == 'None' else l_freq
+        h_freq = None if h_freq == 'None' else h_freq
+        return ResampleFilterStage(self.sfreq, l_freq, h_freq, resamp_freq, self.filter_order, self.filter_design)
+
+    def apply_stage(self, stage: ResampleFilterStage):
+        """
+        Filters and downsamples the signal with a ResampleFilterStage, the signal is loaded first if necessary.
+        """
+        if self.signal is None:
+            self.load_eeg_signal()
+        channel_names, data = self.signal
+        self.signal = (channel_names, stage.apply(data))
+        self.sfreq = stage.sfreq
+
     def downsample(self, resamp_freq):
         """
-        Downsamples the EEG data to the specified sampling frequency.
+        Downsamples the EEG signal to the specified sampling frequency.
         """
         if resamp_freq is None or resamp_freq <= 0:
             print(f"Invalid resampling frequency: {resamp_freq}. Frequency must be a positive number.")
             return
         if self.sfreq > resamp_freq:
-            self.raw.resample(resamp_freq)
-            self.sfreq = resamp_freq
+            self.apply_stage(self.create_stage(resamp_freq=resamp_freq))
         else:
             print(f"Resampling frequency {resamp_freq} must be lower than the current sampling frequency {self.sfreq}.")
 
-    def apply_filter(self, l_freq: float = None, h_freq: float = None, picks: str = 'eeg'):
+    def apply_filter(self, l_freq: float = None, h_freq: float = None):
         """
-        Filters a raw instance and returns it afterwards.
+        Filters the EEG signal with the zero-phase filters of the filter design.
         """
-        if l_freq and l_freq != 'None' and h_freq and h_freq != 'None':
-            self.raw.filter(l_freq=l_freq, h_freq=h_freq, picks=picks)
-        elif l_freq and l_freq != 'None':
-            self.raw.filter(l_freq=l_freq, h_freq=self.raw.info['sfreq'], picks=picks)
-        elif h_freq and h_freq != 'None':
-            self.raw.filter(l_freq=0, h_freq=h_freq, picks=picks)
-        else:
+        stage = self.create_stage(l_freq, h_freq)
+        if stage.pre_band is None:
             print("No filtering performed as both l_freq and h_freq are not specified.")
+            return
+        self.apply_stage(stage)
 
-    def ensure_electrodes_present(self, anodes, cathods, new_names):
+    def preprocess(self, l_freq: float = None, h_freq: float = None, resamp_freq=None):
         """
-        checks if the anode and cathode for the bipolar reference are present, if not they will be dropped
+        Filters and downsamples the EEG signal in one stage, in place of apply_filter and downsample. With the
+        'butterworth' design the low-pass can be the anti-aliasing filter of the resampling and the high-pass is
+        filtered at the lower rate.
+        """
+        if resamp_freq and resamp_freq >= self.sfreq:
+            print(f"Resampling frequency {resamp_freq} must be lower than the current sampling frequency {self.sfreq}.")
+        self.apply_stage(self.create_stage(l_freq, h_freq, resamp_freq))
 
-        inputs:
-        -anodes: a list of anode names which contains the name or None if the electrode is not present
-        -cathodes: a list of cathode names which contains the name or None if the electrode is not present
-        -new_names: a list of the bipolar channel names
-        returns:
-        -droped_names: all bipolar channels for which stuff was missing
-        -new_names: new names which did not have to be dropped
-        -anodes: anodes which have not been dropped
-        -cathodes: cathodes which have not been dropped
+    def use_shared_stage(self, l_freq: float = None, h_freq: float = None, resamp_freq=None):
+        """
+        Sets the signal to the filtered and downsampled EEG signal, in place of preprocess. The loaded, the
+        prefiltered and the downsampled signals are kept, so the file is only read once and runs with the same filter
+        band (and sampling frequency) only filter (and downsample) once. Runs are expected to be ordered by filter
+        band, the stages of a previous band are dropped when a new band is requested.
         """
-        drop_idx = []
-        for i, (a, c, nn) in enumerate(zip(anodes, cathods, new_names)):
-            if a and c:
-                continue
+        picks = self.eeg_picks()
+        if self.stages.get('loaded', (None,))[0] != picks:
+            self.stages.clear()
+            self.load_eeg_signal()
+            self.stages['loaded'] = self.signal
+        self.sfreq = self.raw.info['sfreq']
+        stage = self.create_stage(l_freq, h_freq, resamp_freq)
+        band_key = ('filter', stage.pre_band)
+        output_key = ('resample', l_freq, h_freq, stage.sfreq)
+        if output_key not in self.stages:
+            if stage.pre_band is None:
+                # e.g. the low-pass is fused with the resampling, the loaded signal is resampled directly
+                prefiltered = self.stages['loaded'][1]
             else:
-                drop_idx.append(i)
-        droped_names = [dn for i, dn in enumerate(new_names) if i in drop_idx]
-        new_names = [nn for i, nn in enumerate(new_names) if i not in drop_idx]
-        anodes = [a for i, a in enumerate(anodes) if i not in drop_idx]
-        cathods = [c for i, c in enumerate(cathods) if i not in drop_idx]
-        return anodes, cathods, new_names, droped_names
+                if band_key not in self.stages:
+                    for key in [key for key in self.stages if key != 'loaded']:
+                        del self.stages[key]
+                    self.stages[band_key] = stage.prefilter(self.stages['loaded'][1])
+                prefiltered = self.stages[band_key]
+            self.stages[output_key] = stage.postfilter(stage.resample(prefiltered))
+        self.signal = (picks, self.stages[output_key])
+        self.sfreq = stage.sfreq
 
     def only_keep_10_20_channels_and_check_bipolar(self):
         """
@@ -143,110 +233,187 @@ class EEG_processor:
         self.raw.info['bads'] = list(set(self.raw.info['bads']))
         return duplicate_positive
 
-    def convert_electrode_names_to_channel_names(self, electrode_names: list[str], channel_names: list[str]):
-        """
-        Goes through the electrode names and converts them to channel names if the electrode name is part of the channel name
-
-        inputs:
-        -electrode_names: names of the electrodes from the montage
-        -channel_names: names of the channels after conversion to ensure unified names in the outputs
-        returns:
-        -outputs_array: array of the same size as electrode_names containing either None or the according channel name
-        """
-        output_array = list()
-        for i, e_name in enumerate(electrode_names):
-            output_array.append(None)
-            for c_name in channel_names:
-                if e_name.lower() in c_name.lower():
-                    output_array[i] = c_name
-                    break
-        return output_array
-
-    def change_montage(self, montage: str):
-        """
-        Changes the montage of a raw instance.
-        """
-        # Pick only EEG channels and exclude bad channels
-        raw_internal = self.raw.pick(exclude='bads', picks='eeg').copy()
-        
-        # Apply the specified montage
-        if montage == 'avg':
-            ic(raw_internal.set_eeg_reference(ref_channels='average'))
-        # change montage to doublebanana
-        elif montage == 'doublebanana':
-            anodes = ['Fp2', 'F8', 'T4', 'T6',
-                      'Fp2', 'F4', 'C4', 'P4',
-                      'Fz', 'Cz',
-                      'Fp1', 'F3', 'C3', 'P3',
-                      'Fp1', 'F7', 'T3', 'T5']
-            cathodes = ['F8', 'T4', 'T6', 'O2',
-                        'F4', 'C4', 'P4', 'O2',
-                        'Cz', 'Pz',
-                        'F3', 'C3', 'P3', 'O1',
-                        'F7', 'T3', 'T5', 'O1']
-            new_names = ['Fp2-F8', 'F8-T4', 'T4-T6', 'T6-O2',
-                         'Fp2-F4', 'F4-C4', 'C4-P4', 'P4-O2',
-                         'Fz-Cz', 'Cz-Pz',
-                         'Fp1-F3', 'F3-C3', 'C3-P3', 'P3-O1',
-                         'Fp1-F7', 'F7-T3', 'T3-T5', 'T5-O1']
-            # make sure names are unified and match the above
-            anode_eeg_channels = self.convert_electrode_names_to_channel_names(anodes, raw_internal.ch_names)
-            cathode_eeg_channels = self.convert_electrode_names_to_channel_names(cathodes, raw_internal.ch_names)
-            try:
-                # try setting the new bipolar reference
-                ic(mne.set_bipolar_reference(inst=raw_internal, anode=anode_eeg_channels, cathode=cathode_eeg_channels,
-                                             ch_name=new_names, copy=False))
-            except ValueError:
-                try:
-                    # if setting failes in the previous step we need to check all channels are present and match
-                    anode_eeg_channels, cathode_eeg_channels, new_names, dropped_names = self.ensure_electrodes_present(
-                        anode_eeg_channels, cathode_eeg_channels, new_names)
-                    print(
-                        f'montage could not be set fully, probably not all needed channels are present. The following channels could not be computed: {dropped_names}')
-                    ic(mne.set_bipolar_reference(inst=raw_internal, anode=anode_eeg_channels, cathode=cathode_eeg_channels,
-                                                 ch_name=new_names, copy=False))
-                except ValueError:
-                    print('montage could not be set at all')
-                    return None
-        # set cirumferential montage
-        elif montage == 'circumferential':
-            anodes = ['Fp2', 'F8', 'T4', 'T6',
-                      'O2', 'O1', 'T5', 'T3',
-                      'F7', 'Fp1']
-            cathodes = ['F8', 'T4', 'T6',
-                        'O2', 'O1', 'T5', 'T3',
-                        'F7', 'Fp1', 'Fp2']
-            new_names = ['Fp2-F8', 'F8-T4', 'T4-T6', 'T6-O2',
-                         'O2-O1', 'O1-T5', 'T5-T3', 'T3-F7',
-                         'F7-Fp1', 'Fp1-Fp2']
-            # unify names
-            anode_eeg_channels = self.convert_electrode_names_to_channel_names(anodes, raw_internal.ch_names)
-            cathode_eeg_channels = self.convert_electrode_names_to_channel_names(cathodes, raw_internal.ch_names)
-            try:
-                # set montage
-                mne.set_bipolar_reference(inst=raw_internal, anode=anode_eeg_channels, cathode=cathode_eeg_channels,
-                                          ch_name=new_names, copy=False)
-            except ValueError:
-                # drop channels if montage could not be dropped
-                anode_eeg_channels, cathode_eeg_channels, new_names, dropped_names = self.ensure_electrodes_present(
-                    anode_eeg_channels, cathode_eeg_channels, new_names)
-                print(
-                    f'montage could not be set fully, probably not all needed channels are present. The following channels could not be computed: {dropped_names}')
-                mne.set_bipolar_reference(inst=raw_internal, anode=anode_eeg_channels, cathode=cathode_eeg_channels,
-                                          ch_name=new_names, copy=False)
-        # set montage to a specific channel
-        elif montage in raw_internal.ch_names:
-            raw_internal.set_eeg_reference(ref_channels=montage)
+    def change_montage(self, montage: Montage):
+        """
+        Compiles the montage for the EEG channels of the raw instance which are not marked as bad (see
+        eeganalyzer.core.montage). The signal is not copied or changed, the montage is applied as one matrix product
+        when the signal is taken (get_eeg_array), or lazily per block of epochs.
+
+        Returns the compiled montage, None if the montage could not be set.
+        """
+        # Only EEG channels without bads are re-referenced
+        try:
+            self.montage = compile_montage(self.eeg_picks(), montage)
+        except ValueError as e:
+            print(e)
+            return None
+        return self.montage
+
+    def get_eeg_array(self, apply_montage: bool = True):
+        """
+        Returns the channel names and the preprocessed signal as (n_channels, n_samples) array in µV.
+
+        The signal is loaded from the raw instance if it was not preprocessed, in µV (the unit of to_data_frame,
+        which the metrics are parametrised in). No time column and no dataframe are created. If a montage was set,
+        only its input channels are taken and, unless apply_montage is False, the montage is applied.
+        """
+        if self.signal is None:
+            self.load_eeg_signal()
+        channel_names, data = self.signal
+        if self.montage is None:
+            return list(channel_names), data
+        if list(self.montage.input_names) != list(channel_names):
+            data = data[[channel_names.index(name) for name in self.montage.input_names]]
+        if not apply_montage:
+            return list(self.montage.input_names), data
+        return list(self.montage.channel_names), self.montage.apply(data)
+
+    def create_stream_reader(self, l_freq: float = None, h_freq: float = None, montage: Montage = None,
+                             resamp_freq=None, chunk_duration: float = None) -> StreamReader:
+        """
+        Creates a StreamReader which filters, resamples and re-references the EEG channels of the raw instance
+        chunk by chunk, in place of preprocess and change_montage. The chunk duration defaults to the one of the
+        processor.
+        """
+        picks = self.eeg_picks()
+        l_freq = None if l_freq == 'None' else l_freq
+        h_freq = None if h_freq == 'None' else h_freq
+        stream_reader = StreamReader(self.raw, picks, l_freq, h_freq, resamp_freq, montage,
+                                     chunk_duration=chunk_duration or self.chunk_duration, dtype=self.dtype,
+                                     filter_order=self.filter_order, filter_design=self.filter_design)
+        self.sfreq = stream_reader.sfreq
+        return stream_reader
+
+    def analysis_time_ranges(self, relevant_annot_labels: list = None, ep_start: float = None,
+                             ep_stop: float = None) -> list[tuple[float, float]]:
+        """
+        Works out which parts of the recording the epoching of compute_metrics_fif reads.
+
+        The ranges follow the rules of calc_metric_from_annotations, calc_metric_from_whole_file and
+        Array_processor.compute_epoch_onsets, rounded outwards to whole seconds as the epoch onsets are.
+
+        Args:
+        - relevant_annot_labels (list, optional): Annotation labels as for compute_metrics_fif.
+        - ep_start (float, optional): Start offset for epoching in seconds.
+        - ep_stop (float, optional): Stop of the analyzed segments in seconds.
+
+        Returns:
+        - list: Sorted and merged (start, stop) ranges in seconds of the recording.
+        """
+        total_duration = np.round(self.raw.n_times / self.raw.info['sfreq'])
+        if relevant_annot_labels:
+            labels = None if relevant_annot_labels[0] == 'all' else relevant_annot_labels
+            segments = []
+            for annot in self.raw.annotations:
+                if labels and annot['description'] not in labels:
+                    continue
+                start = annot['onset'] + (ep_start or 0)
+                annot_stop = annot['onset'] + annot['duration']
+                segments.append((start, min(start + ep_stop, annot_stop) if ep_stop else annot_stop))
         else:
-            print(f'The given montage is not a viable option or a channel of the raw_internal object, no montage applied')
-        
-        return raw_internal
+            segments = [(ep_start, ep_stop)]
+
+        ranges = []
+        for start, stop in segments:
+            stop = total_duration if stop is None else min(total_duration, stop)
+            if not start or start < 0 or start >= stop:
+                start = 0
+            ranges.append((float(np.floor(start)), float(np.ceil(stop))))
+        merged = []
+        for start, stop in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+            else:
+                merged.append((start, stop))
+        return merged
 
-    def extract_eeg_columns(self, eeg_dataframe):
+    def preprocessing_method(self, streamed: bool = False) -> str:
         """
-        Extracts all besides the first column from the eeg dataframe.
+        Names the filters and the resampling the signal is preprocessed with. With the 'butterworth' design, loaded
+        and streamed signals are preprocessed by the same stage. With the 'mne' design, streamed signals are
+        resampled polyphase and loaded signals as raw.resample does, so they differ.
         """
-        return eeg_dataframe.columns[1:]
+        if (self.filter_design or DEFAULT_FILTER_DESIGN) == 'mne':
+            return 'stream' if streamed else 'mne'
+        return f'sos-polyphase-{self.filter_order or DEFAULT_FILTER_ORDER}'
+
+    def preprocessing_settings(self, l_freq: float = None, h_freq: float = None, resamp_freq=None,
+                               montage: Montage = None, streamed: bool = False) -> dict:
+        """
+        Returns the preprocessing settings of a run, which are recorded with its results, so a run which only
+        computes the missing results does not merge results of different preprocessing (see
+        eeganalyzer.core.result_accumulator.check_preprocessing_settings).
+        """
+        resampled = bool(resamp_freq) and resamp_freq < self.raw.info['sfreq']
+        return {
+            'l_freq': None if l_freq == 'None' else l_freq,
+            'h_freq': None if h_freq == 'None' else h_freq,
+            'resamp_freq': resamp_freq if resampled else None,
+            'montage': montage_identity(montage),
+            # Streaming only changes the signal if it is resampled
+            'method': self.preprocessing_method(streamed and resampled),
+        }
+
+    def signal_cache_key(self, l_freq: float = None, h_freq: float = None, resamp_freq=None,
+                         montage: Montage = None) -> str:
+        """
+        Creates the key of the preprocessed signal in the signal cache, from the fingerprint of the file, the
+        preprocessing parameters and the bad channels (which include the channels dropped as non 10-20 channels).
+        """
+        l_freq = None if l_freq == 'None' else l_freq
+        h_freq = None if h_freq == 'None' else h_freq
+        method = self.preprocessing_method(bool(self.chunk_duration))
+        return self.signal_cache.make_key(self.datapath, l_freq, h_freq, resamp_freq, montage_identity(montage),
+                                          self.raw.info['bads'],
+                                          self.dtype or 'float64', method)
+
+    def create_array_processor(self, metric_set_name, metric_path) -> Array_processor:
+        """
+        Creates the Array_processor for the signal of the raw instance, with channels along the first axis, for the
+        memory mapped signal from the signal cache, or for the stream reader in streaming mode.
+        """
+        if self.cached_signal is not None:
+            channel_names, data, _ = self.cached_signal
+            return Array_processor(
+                data=data,
+                channel_names=channel_names,
+                sfreq=self.sfreq,
+                axis_of_time=1,
+                metric_name=metric_set_name,
+                metric_path=metric_path,
+                n_jobs=self.n_jobs,
+                metric_cache=self.metric_cache,
+                existing_results=self.existing_results,
+                dtype=self.dtype,
+            )
+        if self.stream_reader is not None:
+            return Array_processor(
+                stream=self.stream_reader,
+                sfreq=self.sfreq,
+                metric_name=metric_set_name,
+                metric_path=metric_path,
+                n_jobs=self.n_jobs,
+                metric_cache=self.metric_cache,
+                existing_results=self.existing_results,
+                dtype=self.dtype,
+            )
+        # With a lazy montage the Array_processor re-references the epochs block by block
+        lazy_montage = self.montage if self.lazy_montage else None
+        channel_names, data = self.get_eeg_array(apply_montage=lazy_montage is None)
+        print(f'Data shape: {data.shape}')
+        return Array_processor(
+            data=data,
+            channel_names=channel_names,
+            sfreq=self.sfreq,
+            axis_of_time=1,
+            metric_name=metric_set_name,
+            metric_path=metric_path,
+            n_jobs=self.n_jobs,
+            metric_cache=self.metric_cache,
+            existing_results=self.existing_results,
+            dtype=self.dtype,
+            montage=lazy_montage,
+        )
 
     def calc_metric_from_annotations(self, metric_set_name, metric_path, ep_dur: int, ep_start: int, ep_stop: int,
                                      overlap: int = 0, relevant_annot_labels: list = None) -> pd.DataFrame:
@@ -265,52 +432,43 @@ class EEG_processor:
         Returns:
         - pandas.DataFrame: A dataframe containing metrics for all epochs segmented from the annotated EEG data.
             """
-            # Load data from the raw EEG object and convert it to a DataFrame
-        self.raw.load_data()
-        data = self.raw.to_data_frame()
-        eeg_cols = self.extract_eeg_columns(data)
-        print(f'Data shape: {data.shape}')
-
-        # Initialize the ArrayProcessor for metric calculations
-        array_processor = Array_processor(
-            data=data[eeg_cols],
-            sfreq=self.sfreq,
-            axis_of_time=0,
-            metric_name=metric_set_name,
-            metric_path=metric_path,
-        )
+        # Initialize the ArrayProcessor for metric calculations on the signal of the raw EEG object
+        array_processor = self.create_array_processor(metric_set_name, metric_path)
         ep_start = ep_start or 0  # Default ep_start to 0 if None
-        raw_annots = self.raw.annotations
-        full_annot_frame = pd.DataFrame()
-        sub_frame_list = []
-        # Check if there are annotations in the EEG file
-        if raw_annots:
-            for annot in raw_annots:
-                annot_name = annot['description']
-
-                # Skip annotations not in relevant_annot_labels, if provided
-                if relevant_annot_labels and annot_name not in relevant_annot_labels:
-                    continue
-
-                # Extract start and duration of the annotation
-                annot_start_seconds = annot['onset']
-                annot_duration_seconds = annot['duration']
-                annot_stop_seconds = annot_start_seconds + annot_duration_seconds
-
-                print(f'Processing annotation: {annot_name}, Times: {annot_start_seconds}-{annot_stop_seconds}')
-
-                # Calculate epoch start and stop times
-                ep_start_seconds = annot_start_seconds + ep_start
-                ep_stop_seconds = (min(ep_start_seconds + ep_stop, annot_stop_seconds)
-                                   if ep_stop else annot_stop_seconds)
-
-                # Call the epoching function to calculate metrics
-                sub_results_frame = array_processor.epoching(
-                    ep_dur, ep_start_seconds, ep_stop_seconds, overlap, annot_name
-                )
-
-                # Append metrics of the current annotation to the subframe list
-                sub_frame_list.append(sub_results_frame)
+        try:
+            raw_annots = self.raw.annotations
+            full_annot_frame = pd.DataFrame()
+            sub_frame_list = []
+            # Check if there are annotations in the EEG file
+            if raw_annots:
+                for annot in raw_annots:
+                    annot_name = annot['description']
+
+                    # Skip annotations not in relevant_annot_labels, if provided
+                    if relevant_annot_labels and annot_name not in relevant_annot_labels:
+                        continue
+
+                    # Extract start and duration of the annotation
+                    annot_start_seconds = annot['onset']
+                    annot_duration_seconds = annot['duration']
+                    annot_stop_seconds = annot_start_seconds + annot_duration_seconds
+
+                    print(f'Processing annotation: {annot_name}, Times: {annot_start_seconds}-{annot_stop_seconds}')
+
+                    # Calculate epoch start and stop times
+                    ep_start_seconds = annot_start_seconds + ep_start
+                    ep_stop_seconds = (min(ep_start_seconds + ep_stop, annot_stop_seconds)
+                                       if ep_stop else annot_stop_seconds)
+
+                    # Call the epoching function to calculate metrics
+                    sub_results_frame = array_processor.epoching(
+                        ep_dur, ep_start_seconds, ep_stop_seconds, overlap, annot_name
+                    )
+
+                    # Append metrics of the current annotation to the subframe list
+                    sub_frame_list.append(sub_results_frame)
+        finally:
+            array_processor.close()
 
         # create the final dataframe from all created subframes
         if len(sub_frame_list) > 0:
@@ -338,28 +496,16 @@ class EEG_processor:
         - pandas.DataFrame: A dataframe containing the computed metrics for each channel across all epochs.
                             Each row corresponds to a specific segment of the EEG data.
         """
-        # Load data from the raw EEG object into memory
-        self.raw.load_data()
-
-        # Convert raw data to a pandas DataFrame
-        data = self.raw.to_data_frame()
-
-        # Extract EEG channel columns (excluding the time column)
-        eeg_cols = self.extract_eeg_columns(data)
-
-        # Initialize the ArrayProcessor with relevant EEG data and parameters
-        array_processor = Array_processor(
-            data=data.loc[:,eeg_cols],
-            sfreq=self.sfreq,
-            axis_of_time=0,
-            metric_name=metric_set_name,
-            metric_path=metric_path,
-        )
+        # Initialize the ArrayProcessor with the signal of the raw EEG object
+        array_processor = self.create_array_processor(metric_set_name, metric_path)
 
         # Compute metrics using the epoching function
-        result_frame = array_processor.epoching(
-            ep_dur, ep_start, ep_stop, overlap, task_label
-        )
+        try:
+            result_frame = array_processor.epoching(
+                ep_dur, ep_start, ep_stop, overlap, task_label
+            )
+        finally:
+            array_processor.close()
 
         # Return the resulting DataFrame containing computed metrics
         return result_frame
@@ -424,7 +570,7 @@ class EEG_processor:
 
     def compute_metrics(self, metric_set_name: str, metric_path, annot: list, outfile: str, lfreq: int, hfreq: int,
                         montage: str, ep_start: int = None, ep_stop: int = None, ep_dur: int = None, overlap: int = 0,
-                        resamp_freq=None, repeat_measurement: bool = False) -> str:
+                        resamp_freq=None, repeat_measurement: Union[bool, str] = False) -> str:
         """
         Compute metrics for EEG processing
 
@@ -440,7 +586,8 @@ class EEG_processor:
         - hfreq (int): Low-pass frequency cutoff for filtering data before metric calculations.
                        The filter allows frequencies between lfreq and hfreq to pass.
         - montage (str): Name of the montage to apply. Valid options are:
-                         'avg', specific reference channel, 'doublebanana', 'circumferential'.
+                         'avg', specific reference channel, 'doublebanana', 'circumferential' or the path of a
+                         YAML file with a user-defined montage (see eeganalyzer.core.montage).
         - ep_start (int, optional): Start offset for epoching in seconds, relative to the beginning
                                      of the file or annotation. Defaults to 0.
         - ep_stop (int, optional): Stop offset for epoching in seconds, relative to the beginning
@@ -450,13 +597,34 @@ class EEG_processor:
         - overlap (int, optional): Amount of overlap between epochs in seconds. Defaults to 0.
         - resamp_freq (int, optional): Frequency to which the data will be downsampled. Defaults to None
                                        (no downsampling).
-        - repeat_measurement (bool, optional): If True and the metrics CSV file already exists, the
+        - repeat_measurement (bool or str, optional): If True and the metrics CSV file already exists, the
                                                calculation is redone, and the existing file is overwritten.
                                                If False, existing metrics are reused, and computation is skipped.
+                                               If 'missing', only the results missing in the existing file
+                                               (new metrics, epochs or channels and NaN values) are computed
+                                               and merged into it.
         - include_chaos_pipe (bool, optional): If True, includes the pipeline by Toker. Requires a valid
                                                MATLAB version with the pipeline accessible in its path.
         - multiprocess (bool, optional): If True, enables multiprocessing for metric computations. Defaults to False.
 
+        Filtering and downsampling are one ResampleFilterStage (see eeganalyzer.core.resampling). By default the
+        signal is filtered and resampled as raw.filter and raw.resample of MNE do, the 'butterworth' filter design
+        filters with zero-phase Butterworth filters and fuses the low-pass with the polyphase resampling where
+        possible. The preprocessing settings are recorded next to the outfile, and with repeat_measurement 'missing'
+        nothing is merged into results which were preprocessed differently.
+
+        If the processor was created with a chunk_duration, the file is streamed: filtering, downsampling and the
+        montage are applied chunk by chunk and the metrics are computed on the epochs of each chunk, so the memory
+        needed does not grow with the length of the recording.
+
+        With a signal cache, the whole preprocessed signal is stored as memory map (keyed by the file fingerprint,
+        the filter, sampling frequency, montage and bad channels) and later runs with the same preprocessing open it
+        instead of loading and preprocessing the file again.
+
+        Without a signal cache, if the file is not preloaded and the epoching (ep_start, ep_stop, annotations) only
+        covers parts of the recording, only these parts are loaded, filtered, resampled and re-referenced in the
+        same way, each with the padding the filter needs.
+
         Returns:
         - str: A message indicating the outcome of the processing. Possible messages:
                * 'finished and saved successfully': When computation and saving succeed.
@@ -468,27 +636,80 @@ class EEG_processor:
         """
         try:
             # Check the name of the outfile
-            outfile_check, outfile_check_message = self.buttler.check_outfile_name(outfile, file_exists_ok=repeat_measurement)
+            outfile_check, outfile_check_message = self.buttler.check_outfile_name(
+                outfile, file_exists_ok=bool(repeat_measurement)
+            )
             if not outfile_check:
                 return outfile_check_message
+            self.existing_results, self.stream_reader, self.cached_signal, self.montage = None, None, None, None
+            self.signal, self.sfreq = None, self.raw.info['sfreq']
+            if repeat_measurement == 'missing' and os.path.exists(outfile):
+                self.existing_results = read_result_frame(outfile)
 
             # Only keeps channels which correspond to the typical 10-20 system names
             bipolar = self.only_keep_10_20_channels_and_check_bipolar()
             if bipolar:
                 print(f'Most likely already has a bipolar montage \nChannel names: \n {self.raw.ch_names}')
 
-            # Filter
-            self.apply_filter(lfreq, hfreq)
+            # A signal preprocessed in the same way by an earlier run is opened from the signal cache
+            cache_key = None
+            if self.signal_cache is not None:
+                cache_key = self.signal_cache_key(lfreq, hfreq, resamp_freq, montage)
+                self.cached_signal = self.signal_cache.get(cache_key)
+
+            # Only the parts of the recording which are epoched have to be loaded, unless the whole preprocessed
+            # signal is cached for later runs
+            time_ranges = self.analysis_time_ranges(annot, ep_start, ep_stop)
+            analysed_duration = sum(stop - start for start, stop in time_ranges)
+            crop = (not self.raw.preload and cache_key is None
+                    and analysed_duration < self.raw.n_times / self.raw.info['sfreq'])
+
+            # Results of a different preprocessing are not merged with the new ones
+            streamed = bool(self.chunk_duration or crop)
+            settings = self.preprocessing_settings(lfreq, hfreq, resamp_freq, montage, streamed)
+            if self.existing_results is not None and not check_preprocessing_settings(outfile, settings):
+                return ('existing results were preprocessed differently, skipping EEG (recompute them with '
+                        'repeat_measurement set to true)')
+
+            if self.cached_signal is not None:
+                print(f'Using the preprocessed signal from the signal cache {self.signal_cache.path}')
+                self.sfreq = self.cached_signal[2]
+            elif self.chunk_duration or crop:
+                # Filter, downsample and montage are applied chunk by chunk while the epochs are read. Without a
+                # chunk duration every analysed range is read in one chunk, with the context the filter needs
+                chunk_duration = self.chunk_duration
+                if not chunk_duration:
+                    print(f'Loading {analysed_duration:.0f} s of the recording in {len(time_ranges)} range(s)')
+                    chunk_duration = max([stop - start for start, stop in time_ranges], default=0) + 1
+                try:
+                    self.stream_reader = self.create_stream_reader(lfreq, hfreq, montage, resamp_freq, chunk_duration)
+                except ValueError as e:
+                    print(e)
+                    return 'could not set montage, maybe EEG is faulty, skipping EEG'
+                if cache_key is not None:
+                    # The cache file is written chunk by chunk, the metrics are then computed on its memory map
+                    reader = self.stream_reader
+                    if self.signal_cache.store_chunks(cache_key, reader.channel_names, reader.sfreq,
+                                                      (len(reader.channel_names), reader.n_samples), reader.dtype,
+                                                      reader.chunks()):
+                        self.cached_signal = self.signal_cache.get(cache_key)
+                        self.stream_reader = None
+            elif self.stages is not None:
+                # Filter and downsample, reusing the stages of earlier runs on this file
+                self.use_shared_stage(lfreq, hfreq, resamp_freq)
+            else:
+                # Filter and downsample
+                self.preprocess(lfreq, hfreq, resamp_freq)
 
-            # Downsample
-            self.downsample(resamp_freq)
+            if self.cached_signal is None and self.stream_reader is None:
+                # Montage (also excludes bads and non-EEG channels even if no remontaging is done)
+                if self.change_montage(montage) is None:
+                    return 'could not set montage, maybe EEG is faulty, skipping EEG'
 
-            # Montage (also excludes bads and non-EEG channels even if no remontaging is done)
-            raw = self.change_montage(montage)
-            if not raw:
-                return 'could not set montage, maybe EEG is faulty, skipping EEG'
-            else:
-                self.raw = raw
+                if cache_key is not None:
+                    channel_names, data = self.get_eeg_array()
+                    self.signal_cache.put(cache_key, channel_names, self.sfreq,
+                                          data.astype(self.dtype or np.float64, copy=False))
 
             # Extract the task label in case only epoching is used to use as annot
             task_label = self.buttler.find_task_from_filename(self.datapath)
@@ -498,9 +719,14 @@ class EEG_processor:
                 metric_set_name, metric_path, annot, ep_dur, ep_start, ep_stop, overlap, task_label
             )
 
+            # Keep the results of the existing file which were not requested again
+            if self.existing_results is not None:
+                full_results_frame = merge_result_frames(self.existing_results, full_results_frame)
+
             # Save dataframe to csv
             if not full_results_frame.empty:
                 full_results_frame.to_csv(outfile)
+                write_preprocessing_settings(outfile, settings)
                 return 'finished and saved successfully'
             else:
                 return 'no metrics could be calculated'
@@ -0,0 +1,138 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Reference counted cache of intermediate results for EEG analysis.
+
+This module provides the IntermediateCache class, which computes the intermediates declared by the metrics of a set
+(see eeganalyzer.metrics.intermediates) once per unit of data and evicts them when their last consumer is done.
+"""
+
+from collections import Counter
+from typing import Any, Dict, Hashable, Iterable, Tuple
+
+import numpy as np
+
+from eeganalyzer.metrics.intermediates import Intermediate, get_producer, resolve
+
+# A unit of data, e.g. ('block', ndim, start, stop) for a block of epochs
+Unit = Hashable
+
+
+class IntermediateCache:
+    """
+    Computes intermediate results on demand and keeps them until their last consumer has released them.
+
+    Before the metrics are computed, every consumer retains the intermediates it will request for every unit of data.
+    An intermediate that is computed retains its own dependencies until it is computed, so every node of the DAG
+    lives exactly as long as it has pending consumers.
+
+    Attributes:
+        sfreq (float): Sampling frequency, passed to intermediates which need it.
+    """
+
+    def __init__(self, sfreq: float = None) -> None:
+        self.sfreq = sfreq
+        self._values: Dict[Tuple[Unit, Intermediate], Any] = {}
+        self._refcounts: Counter = Counter()
+        self._computed = set()
+
+    def _dependencies(self, key: Intermediate) -> Dict[str, Intermediate]:
+        producer = get_producer(key.name)
+        return {argument: resolve(dependency, key.kwargs) for argument, dependency in producer.requires.items()}
+
+    def retain(self, unit: Unit, key: Intermediate) -> None:
+        """
+        Registers one pending request of an intermediate for a unit of data.
+
+        Args:
+            unit (hashable): Identifies the data the intermediate is computed on.
+            key (Intermediate): The intermediate.
+        """
+        if self._refcounts[(unit, key)] == 0 and (unit, key) not in self._values:
+            # The intermediate will be computed once, which consumes each of its dependencies once
+            for dependency in self._dependencies(key).values():
+                self.retain(unit, dependency)
+        self._refcounts[(unit, key)] += 1
+
+    def retain_all(self, units: Iterable[Unit], keys: Iterable[Intermediate]) -> None:
+        """
+        Registers one pending request of every intermediate for every unit of data.
+        """
+        keys = list(keys)
+        for unit in units:
+            for key in keys:
+                self.retain(unit, key)
+
+    def get(self, unit: Unit, key: Intermediate, data: np.ndarray) -> Any:
+        """
+        Returns an intermediate of a unit of data, computing it and its dependencies if necessary.
+
+        Args:
+            unit (hashable): Identifies the data.
+            key (Intermediate): The intermediate.
+            data (np.ndarray): The data of the unit.
+
+        Returns:
+            The intermediate result.
+        """
+        if (unit, key) in self._values:
+            return self._values[(unit, key)]
+        producer = get_producer(key.name)
+        dependencies = self._dependencies(key)
+        planned = self._refcounts[(unit, key)] > 0
+        kwargs = {**key.kwargs, **{argument: self.get(unit, dependency, data)
+                                   for argument, dependency in dependencies.items()}}
+        if producer.needs_sfreq:
+            kwargs['sfreq'] = self.sfreq
+        try:
+            value = producer.func(data, **kwargs)
+        finally:
+            if planned:
+                self._computed.add((unit, key))
+                for dependency in dependencies.values():
+                    self.release(unit, dependency)
+        if planned:
+            self._values[(unit, key)] = value
+        return value
+
+    def release(self, unit: Unit, key: Intermediate) -> None:
+        """
+        Marks one request of an intermediate as done, evicting it if it has no pending requests left.
+
+        Args:
+            unit (hashable): Identifies the data.
+            key (Intermediate): The intermediate.
+        """
+        self._refcounts[(unit, key)] -= 1
+        if self._refcounts[(unit, key)] > 0:
+            return
+        del self._refcounts[(unit, key)]
+        self._values.pop((unit, key), None)
+        if (unit, key) in self._computed:
+            self._computed.discard((unit, key))
+        else:
+            # Never computed, so the requests it holds on its dependencies are dropped as well
+            for dependency in self._dependencies(key).values():
+                self.release(unit, dependency)
+
+    def release_all(self, units: Iterable[Unit], keys: Iterable[Intermediate]) -> None:
+        """
+        Marks one request of every intermediate for every unit of data as done.
+        """
+        keys = list(keys)
+        for unit in units:
+            for key in keys:
+                self.release(unit, key)
+
+    def __len__(self) -> int:
+        return len(self._values)
@@ -0,0 +1,241 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Content-addressed metric cache for EEG analysis.
+
+This module provides the MetricCache class, a sqlite database which stores the results of one metric function on
+one channel of one epoch. The key is built from the samples of the epoch (after preprocessing) and their sampling
+frequency, the identity and arguments of the metric function, a hash of its source code and the versions of the
+libraries it uses. Changing the epoching, the preprocessing or a metric therefore only misses the cells which
+actually changed.
+"""
+
+import hashlib
+import inspect
+import os
+import sqlite3
+import sys
+from types import ModuleType
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+import eeganalyzer
+from eeganalyzer.core.metric_registry import MetricSet
+
+# Number of keys per sqlite query, below the default limit of host parameters
+_QUERY_CHUNK = 500
+
+
+def _library_versions(func: Callable) -> List[str]:
+    """
+    Collects the versions of the packages a metric function refers to, including its own package.
+    """
+    packages = {(getattr(func, '__module__', None) or '').split('.')[0]}
+    func_globals = getattr(func, '__globals__', {})
+    code = getattr(func, '__code__', None)
+    for name in (code.co_names if code is not None else ()):
+        value = func_globals.get(name)
+        module = value if isinstance(value, ModuleType) else sys.modules.get(getattr(value, '__module__', None) or '')
+        if module is not None:
+            packages.add(module.__name__.split('.')[0])
+    versions = []
+    for package in sorted(packages):
+        version = getattr(sys.modules.get(package), '__version__', None)
+        if version is not None:
+            versions.append(f'{package}=={version}')
+    return versions
+
+
+def function_key(func: Callable, identity: str) -> bytes:
+    """
+    Creates the part of the cache key which describes a metric function.
+
+    Args:
+        func (callable): The metric function.
+        identity (str): The metric_identity of the function and its arguments.
+
+    Returns:
+        bytes: A digest of the identity, the source code and the library versions of the function.
+    """
+    unwrapped = inspect.unwrap(func)
+    try:
+        source = inspect.getsource(unwrapped)
+    except (OSError, TypeError):
+        # e.g. builtins or callables defined interactively, the identity has to suffice
+        source = ''
+    digest = hashlib.blake2b(digest_size=16)
+    for part in [identity, source, f'eeganalyzer=={eeganalyzer.__version__}'] + _library_versions(unwrapped):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.digest()
+
+
+def epoch_digests(epoch_tensor: np.ndarray, sfreq: float) -> np.ndarray:
+    """
+    Hashes the samples of every channel of every epoch together with their sampling frequency.
+
+    The same samples at another rate are another signal for every metric which gets sfreq (e.g. spectral metrics or
+    shared intermediates), so the rate is part of every digest.
+
+    Args:
+        epoch_tensor (np.ndarray): Tensor of shape (n_epochs, n_channels, n_samples).
+        sfreq (float): Sampling frequency of the epochs.
+
+    Returns:
+        np.ndarray: Object array of shape (n_epochs, n_channels) with one digest (bytes) per time series.
+    """
+    digests = np.empty(epoch_tensor.shape[:2], dtype=object)
+    header = f'{epoch_tensor.dtype.str}@{float(sfreq)!r}'.encode()
+    for epoch_idx, epoch in enumerate(epoch_tensor):
+        for channel_idx, channel_data in enumerate(epoch):
+            digest = hashlib.blake2b(header, digest_size=16)
+            # Every epoch of a channel is contiguous in the channel buffer, so this does not copy
+            digest.update(np.ascontiguousarray(channel_data).data)
+            digests[epoch_idx, channel_idx] = digest.digest()
+    return digests
+
+
+class MetricCache:
+    """
+    Persistent cache of metric results per (epoch samples, metric function) in a sqlite database.
+
+    Every entry holds the values of all outputs of one function on one time series. The database can be shared by
+    several processes and experiments.
+
+    Attributes:
+        path (str): Path of the sqlite database.
+    """
+
+    def __init__(self, path: str):
+        if os.path.isdir(path) or not os.path.splitext(path)[1]:
+            path = os.path.join(path, 'metric_cache.sqlite')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, value BLOB NOT NULL)')
+        self._connection.commit()
+
+    @staticmethod
+    def make_keys(function_digest: bytes, digests: np.ndarray) -> List[bytes]:
+        """
+        Combines the digest of a function with the digests of the time series.
+
+        Args:
+            function_digest (bytes): The function_key of the metric function.
+            digests (np.ndarray): Digests of the time series, see epoch_digests.
+
+        Returns:
+            list[bytes]: One key per time series in the (C-)order of digests.
+        """
+        return [hashlib.blake2b(function_digest + digest, digest_size=20).digest() for digest in digests.ravel()]
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        """
+        Looks up several keys at once.
+
+        Args:
+            keys (list[bytes]): The keys to look up.
+
+        Returns:
+            dict: {key: values} for all keys which are in the cache.
+        """
+        found = {}
+        for start in range(0, len(keys), _QUERY_CHUNK):
+            chunk = list(keys[start:start + _QUERY_CHUNK])
+            rows = self._connection.execute(
+                f'SELECT key, value FROM results WHERE key IN ({",".join("?" * len(chunk))})', chunk
+            )
+            for key, value in rows:
+                found[bytes(key)] = np.frombuffer(value, dtype=np.float64)
+        return found
+
+    def put_many(self, items: Sequence[Tuple[bytes, np.ndarray]]) -> None:
+        """
+        Stores several results at once.
+
+        Args:
+            items (list): (key, values) pairs, values are the outputs of one function on one time series.
+        """
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)',
+                [(key, np.asarray(values, dtype=np.float64).tobytes()) for key, values in items],
+            )
+
+    def lookup(self, metric_set: MetricSet, digests: np.ndarray, out: np.ndarray) -> Tuple[np.ndarray, List[List[bytes]]]:
+        """
+        Fills the cached results of a metric set into a result array.
+
+        Args:
+            metric_set (MetricSet): The metric set to look up.
+            digests (np.ndarray): Digests of shape (n_epochs, n_channels), see epoch_digests.
+            out (np.ndarray): Result array of shape (n_epochs, n_metrics, n_channels).
+
+        Returns:
+            tuple:
+                - missing (np.ndarray): Boolean array of shape (n_functions, n_epochs, n_channels), True where a
+                  function still has to be computed.
+                - keys (list): The keys of every function in the (C-)order of digests, to store the new results.
+        """
+        metric_index = {name: i for i, name in enumerate(metric_set.names)}
+        missing = np.ones((len(metric_set.functions),) + digests.shape, dtype=bool)
+        all_keys = []
+        for function_idx, (func, identity) in enumerate(zip(metric_set.functions, metric_set.identities)):
+            keys = self.make_keys(function_key(func, identity), digests)
+            all_keys.append(keys)
+            output_idx = [metric_index[name] for name in metric_set.output_names[function_idx]]
+            found = self.get_many(keys)
+            for flat_idx, key in enumerate(keys):
+                values = found.get(key)
+                if values is None or len(values) != len(output_idx):
+                    continue
+                epoch_idx, channel_idx = divmod(flat_idx, digests.shape[1])
+                out[epoch_idx, output_idx, channel_idx] = values
+                missing[function_idx, epoch_idx, channel_idx] = False
+        return missing, all_keys
+
+    def store(self, metric_set: MetricSet, keys: List[List[bytes]], values: np.ndarray, computed: np.ndarray) -> None:
+        """
+        Stores newly computed results of a metric set.
+
+        Args:
+            metric_set (MetricSet): The metric set the results belong to.
+            keys (list): The keys returned by lookup.
+            values (np.ndarray): Result array of shape (n_epochs, n_metrics, n_channels).
+            computed (np.ndarray): Boolean array of shape (n_functions, n_epochs, n_channels), True for the cells
+                which were computed and should be stored.
+
+        Cells in which all outputs of a function are NaN are not stored. This is what a failed calculation leaves
+        behind, and failures (e.g. a missing optional dependency) have to be retried on the next run.
+        """
+        metric_index = {name: i for i, name in enumerate(metric_set.names)}
+        items = []
+        for function_idx, function_keys in enumerate(keys):
+            output_idx = [metric_index[name] for name in metric_set.output_names[function_idx]]
+            function_values = values[:, output_idx, :]
+            stored = computed[function_idx] & ~np.isnan(function_values).all(axis=1)
+            for epoch_idx, channel_idx in zip(*np.nonzero(stored)):
+                items.append((function_keys[epoch_idx * values.shape[2] + channel_idx],
+                              function_values[epoch_idx, :, channel_idx]))
+        try:
+            self.put_many(items)
+        except sqlite3.Error as e:
+            print(f"Could not store results in the metric cache {self.path}. Error: {e}")
+
+    def close(self) -> None:
+        """
+        Closes the database connection.
+        """
+        self._connection.close()
@@ -0,0 +1,275 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Metric set registry for EEG analysis.
+
+This module provides the MetricRegistry class which loads metrics files and resolves metric sets once per process.
+A metrics file has to contain a select_metrics(name) function and can optionally define the hooks
+setup_metrics(name) and teardown_metrics(name). setup_metrics is called once before a set is resolved for the first
+time in a process and can be used to create expensive resources (e.g. a matlab engine or lookup tables).
+teardown_metrics is called once when the registry is torn down, at the latest when the process exits.
+
+A process which only hands out the computation to worker processes resolves a set without setup_metrics (see
+get_metric_set), each worker sets up the metric set itself on its first lookup.
+"""
+
+import atexit
+import importlib.util
+import json
+import multiprocessing.util
+import os
+import sys
+from dataclasses import dataclass, field
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from eeganalyzer.core.call_adapter import CallAdapter
+
+
+def metric_identity(func: Callable, kwargs: Optional[Dict[str, Any]]) -> str:
+    """
+    Creates a string identifying a metric function together with its arguments, independent of the metric set.
+
+    Args:
+        func (callable): The metric function.
+        kwargs (dict): Additional arguments of the function.
+
+    Returns:
+        str: e.g. 'neurokit2.complexity.fractal_katz.fractal_katz{}'
+    """
+    module = getattr(func, '__module__', None) or type(func).__module__
+    name = getattr(func, '__qualname__', None) or getattr(func, '__name__', None) or type(func).__qualname__
+    return f'{module}.{name}{json.dumps(kwargs or {}, sort_keys=True, default=repr)}'
+
+
+@dataclass
+class MetricSet:
+    """
+    A resolved and validated metric set.
+
+    Attributes:
+        name (str): Name of the metric set.
+        metric_path (str): Path of the metrics file the set was loaded from.
+        functions (list): Metric functions to calculate on the time series.
+        names (list[str]): Names of the metrics, used to save the results.
+        kwargs_list (list): Dictionaries (or None) with additional arguments for the functions.
+        output_names (list[list[str]]): The names belonging to each function. Every function has one output,
+            except if there are more names than functions, then the last function gets all remaining names
+            (e.g. a function returning a dictionary of several results).
+        adapters (list[CallAdapter]): The functions compiled with their kwargs, used to call them per time series.
+    """
+    name: str
+    metric_path: str
+    functions: List[Callable]
+    names: List[str]
+    kwargs_list: List[Optional[Dict[str, Any]]]
+    output_names: List[List[str]] = field(default_factory=list)
+    adapters: List[CallAdapter] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        if not self.output_names:
+            n_functions = len(self.functions)
+            self.output_names = [[name] for name in self.names[:n_functions - 1]] + [self.names[n_functions - 1:]]
+        if not self.adapters:
+            # Calling conventions are resolved once here, signature mismatches are reported when the set is loaded
+            self.adapters = [CallAdapter(func, kwargs) for func, kwargs in zip(self.functions, self.kwargs_list)]
+
+    @property
+    def identities(self) -> List[str]:
+        """
+        The metric_identity of every function of the set.
+        """
+        return [metric_identity(func, kwargs) for func, kwargs in zip(self.functions, self.kwargs_list)]
+
+    def as_lists(self) -> Tuple[List[Callable], List[str], List[Optional[Dict[str, Any]]]]:
+        """
+        Returns the metric set in the format of select_metrics.
+
+        Returns:
+            tuple: (metrics_functions, metrics_name_list, kwargs_list)
+        """
+        return self.functions, self.names, self.kwargs_list
+
+
+@dataclass
+class _LoadedModule:
+    module: ModuleType
+    mtime: float
+    active_sets: List[str] = field(default_factory=list)
+
+
+class MetricRegistry:
+    """
+    Loads metrics files and resolves metric sets once per process.
+
+    Metrics modules are cached by their absolute path and reloaded only if the file changed on disk.
+    Resolved metric sets are cached by (path, name), so the user's select_metrics is called only once per set
+    and process, no matter how many epochs or files are processed.
+    """
+
+    def __init__(self) -> None:
+        self._modules: Dict[str, _LoadedModule] = {}
+        self._sets: Dict[Tuple[str, str], MetricSet] = {}
+        # Sets resolved without setup_metrics, only used to hand out the computation
+        self._unprepared_sets: Dict[Tuple[str, str], MetricSet] = {}
+
+    def load_module(self, metric_path: str) -> ModuleType:
+        """
+        Imports a metrics file, or returns the already imported module if the file did not change.
+
+        Parameters:
+            metric_path (str): Path to the metrics file.
+
+        Returns:
+            ModuleType: The imported metrics module.
+
+        Raises:
+            ImportError: If the module cannot be imported or does not contain a select_metrics function.
+        """
+        path = os.path.abspath(metric_path)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError as e:
+            raise ImportError(f"Failed to import metrics from {metric_path}: {str(e)}")
+
+        loaded = self._modules.get(path)
+        if loaded is not None and loaded.mtime == mtime:
+            return loaded.module
+        if loaded is not None:
+            # The file changed on disk, release the resources of the old module before reloading
+            self._teardown_module(path)
+
+        try:
+            dir_path = os.path.dirname(path)
+            file_name = os.path.basename(path)
+            module_name = file_name[:-3] if file_name.endswith('.py') else file_name
+
+            # Add the directory to sys.path so the metrics file can import its neighbours
+            if dir_path not in sys.path:
+                sys.path.insert(1, dir_path)
+
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            if not spec:
+                raise ImportError(f"Could not load spec for module at {metric_path}")
+            metrics_module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(metrics_module)
+
+            if not hasattr(metrics_module, 'select_metrics'):
+                raise AttributeError(f"The metrics module at {metric_path} does not contain a select_metrics function")
+        except Exception as e:
+            raise ImportError(f"Failed to import metrics from {metric_path}: {str(e)}")
+
+        self._modules[path] = _LoadedModule(module=metrics_module, mtime=mtime)
+        return metrics_module
+
+    def get_metric_set(self, metric_path: str, name: str, setup: bool = True) -> MetricSet:
+        """
+        Resolves a metric set, calling setup_metrics and select_metrics only the first time it is requested.
+
+        Parameters:
+            metric_path (str): Path to the metrics file.
+            name (str): Name of the metric set.
+            setup (bool): If False, the set is resolved without calling setup_metrics, for a process which only hands
+                          out the computation to workers. If select_metrics needs the resources of setup_metrics
+                          (it raises or returns an invalid set without them), the set is set up anyway.
+
+        Returns:
+            MetricSet: The resolved and validated metric set.
+
+        Raises:
+            ValueError: If the name is not valid or the metric set returned by select_metrics is invalid.
+        """
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError("Metric set name must be a non-empty string.")
+
+        module = self.load_module(metric_path)
+        path = os.path.abspath(metric_path)
+        key = (path, name)
+        if key in self._sets:
+            return self._sets[key]
+        if not setup:
+            if key not in self._unprepared_sets:
+                try:
+                    self._unprepared_sets[key] = self._validate(name, path, *module.select_metrics(name))
+                except Exception:
+                    return self.get_metric_set(metric_path, name)
+            return self._unprepared_sets[key]
+
+        loaded = self._modules[path]
+        try:
+            if hasattr(module, 'setup_metrics'):
+                module.setup_metrics(name)
+            loaded.active_sets.append(name)
+            metric_set = self._validate(name, path, *module.select_metrics(name))
+        except Exception as e:
+            raise ValueError(f"An error occurred while retrieving metrics for '{name}': {e}")
+
+        self._sets[key] = metric_set
+        return metric_set
+
+    @staticmethod
+    def _validate(name: str, metric_path: str, metrics_functions, metrics_name_list, kwargs_list) -> MetricSet:
+        if not isinstance(metrics_functions, list) or not isinstance(metrics_name_list, list) or not isinstance(
+                kwargs_list, list):
+            raise TypeError("Output of Metrics.select_metrics must be three lists.")
+        if not metrics_functions or not metrics_name_list or not kwargs_list:
+            raise ValueError(f"No metrics found for the name: {name}")
+        if len(metrics_functions) != len(kwargs_list):
+            raise ValueError("metrics_functions and kwargs_list must have the same length.")
+        if len(metrics_name_list) < len(metrics_functions):
+            raise ValueError("Every metric function needs at least one name in metrics_name_list.")
+        for func, kwargs in zip(metrics_functions, kwargs_list):
+            if not callable(func):
+                raise TypeError(f"Metric function {func} is not callable.")
+            if kwargs is not None and not isinstance(kwargs, dict):
+                raise TypeError("kwargs must be a dictionary or None.")
+        return MetricSet(name=name, metric_path=metric_path, functions=metrics_functions,
+                         names=metrics_name_list, kwargs_list=kwargs_list)
+
+    def _teardown_module(self, path: str) -> None:
+        loaded = self._modules.pop(path, None)
+        if loaded is None:
+            return
+        for sets in (self._sets, self._unprepared_sets):
+            for key in [key for key in sets if key[0] == path]:
+                del sets[key]
+        if hasattr(loaded.module, 'teardown_metrics'):
+            for name in loaded.active_sets:
+                try:
+                    loaded.module.teardown_metrics(name)
+                except Exception as e:
+                    print(f"Error during teardown of metric set '{name}': {e}")
+
+    def teardown(self) -> None:
+        """
+        Calls teardown_metrics for every metric set that was set up and clears the registry.
+        """
+        for path in list(self._modules):
+            self._teardown_module(path)
+
+    def forget(self) -> None:
+        """
+        Clears the registry without calling teardown_metrics, e.g. in a forked worker process, whose copies of the
+        modules and of the resources created by setup_metrics belong to the parent process.
+        """
+        self._modules.clear()
+        self._sets.clear()
+        self._unprepared_sets.clear()
+
+
+# One registry per process, resources are released when the process exits. Worker processes of a multiprocessing
+# pool leave through os._exit, so atexit does not reach them, and forked workers drop the finalizers of their parent.
+# Pool workers therefore start with an empty registry and register their own finalizer (see parallel.init_worker).
+metric_registry = MetricRegistry()
+atexit.register(metric_registry.teardown)
+multiprocessing.util.Finalize(metric_registry, metric_registry.teardown, exitpriority=10)
@@ -0,0 +1,340 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Montage engine for EEG analysis.
+
+This module holds the bipolar montages used by the EEG_processor and compiles every supported montage (average
+reference, bipolar montages, a reference channel or a user-defined montage from a YAML file) into a sparse derivation
+matrix for a channel layout. Compiled montages are cached by the fingerprint of the layout and the montage, so each
+distinct layout is compiled once per process. A montage is then applied as a single matrix product, either to a
+whole signal or lazily to the blocks of epochs which are analysed.
+
+A user-defined montage is a YAML file with the derivations of its channels, given as anode and cathode or as weights
+of the electrodes:
+
+    # keep the channels which are not part of any derivation (as the bipolar montages do), defaults to false
+    keep_unused: false
+    channels:
+      Fp1-F3: [Fp1, F3]
+      Cz-Laplace: {Cz: 1, C3: -0.25, C4: -0.25, Fz: -0.25, Pz: -0.25}
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+
+from eeganalyzer.core.sliding_window import epoch_view
+from eeganalyzer.utils.config import load_yaml_file
+
+# anodes, cathodes and names of the bipolar channels of each bipolar montage
+BIPOLAR_MONTAGES: Dict[str, Tuple[List[str], List[str], List[str]]] = {
+    'doublebanana': (
+        ['Fp2', 'F8', 'T4', 'T6',
+         'Fp2', 'F4', 'C4', 'P4',
+         'Fz', 'Cz',
+         'Fp1', 'F3', 'C3', 'P3',
+         'Fp1', 'F7', 'T3', 'T5'],
+        ['F8', 'T4', 'T6', 'O2',
+         'F4', 'C4', 'P4', 'O2',
+         'Cz', 'Pz',
+         'F3', 'C3', 'P3', 'O1',
+         'F7', 'T3', 'T5', 'O1'],
+        ['Fp2-F8', 'F8-T4', 'T4-T6', 'T6-O2',
+         'Fp2-F4', 'F4-C4', 'C4-P4', 'P4-O2',
+         'Fz-Cz', 'Cz-Pz',
+         'Fp1-F3', 'F3-C3', 'C3-P3', 'P3-O1',
+         'Fp1-F7', 'F7-T3', 'T3-T5', 'T5-O1'],
+    ),
+    'circumferential': (
+        ['Fp2', 'F8', 'T4', 'T6',
+         'O2', 'O1', 'T5', 'T3',
+         'F7', 'Fp1'],
+        ['F8', 'T4', 'T6',
+         'O2', 'O1', 'T5', 'T3',
+         'F7', 'Fp1', 'Fp2'],
+        ['Fp2-F8', 'F8-T4', 'T4-T6', 'T6-O2',
+         'O2-O1', 'O1-T5', 'T5-T3', 'T3-F7',
+         'F7-Fp1', 'Fp1-Fp2'],
+    ),
+}
+
+# A montage as it can be given in the configuration: None, 'avg', the name of a bipolar montage, a reference
+# channel, the path of a YAML file or the already loaded derivations of a user-defined montage
+Montage = Union[str, Dict[str, Any], None]
+
+# Derivation matrices with a larger fraction of non-zero entries are applied as dense matrices
+DENSE_PRODUCT_DENSITY = 0.05
+
+# Compiled montages by the fingerprint of their layout and montage
+_compiled_montages: Dict[str, 'CompiledMontage'] = {}
+
+
+def match_channel_names(electrode_names: List[str], channel_names: List[str]) -> List[Optional[str]]:
+    """
+    Goes through the electrode names and converts them to channel names if the electrode name is part of the
+    channel name.
+
+    Args:
+        electrode_names (list): Names of the electrodes from the montage.
+        channel_names (list): Names of the channels of the recording.
+
+    Returns:
+        list: For every electrode the first channel name containing it (case insensitive), None if there is none.
+    """
+    output_array = []
+    for e_name in electrode_names:
+        output_array.append(None)
+        for c_name in channel_names:
+            if e_name.lower() in c_name.lower():
+                output_array[-1] = c_name
+                break
+    return output_array
+
+
+def is_montage_file(montage: Montage) -> bool:
+    """
+    Checks if a montage is given as the path of a YAML file.
+    """
+    return isinstance(montage, str) and montage.lower().endswith(('.yaml', '.yml'))
+
+
+def montage_spec(montage: Montage) -> Optional[Dict[str, Any]]:
+    """
+    Returns the derivations of a bipolar or user-defined montage.
+
+    Args:
+        montage (str or dict): Name of a bipolar montage, path of a YAML file or the content of such a file.
+
+    Returns:
+        dict or None: {'channels': {name: {electrode: weight}}, 'keep_unused': bool}, None for montages which are
+                      not defined by derivations ('avg', a reference channel or None).
+    """
+    if isinstance(montage, str) and montage in BIPOLAR_MONTAGES:
+        anodes, cathodes, new_names = BIPOLAR_MONTAGES[montage]
+        return {'channels': {name: {anode: 1.0, cathode: -1.0} for anode, cathode, name
+                             in zip(anodes, cathodes, new_names)}, 'keep_unused': True}
+    if is_montage_file(montage):
+        montage = load_yaml_file(montage)
+    if not isinstance(montage, dict):
+        return None
+    if not isinstance(montage.get('channels'), dict) or not montage['channels']:
+        raise ValueError("A user-defined montage needs a 'channels' mapping of channel names to derivations.")
+    channels = {}
+    for name, derivation in montage['channels'].items():
+        if isinstance(derivation, (list, tuple)) and len(derivation) == 2:
+            channels[str(name)] = {str(derivation[0]): 1.0, str(derivation[1]): -1.0}
+        elif isinstance(derivation, dict):
+            channels[str(name)] = {str(electrode): float(weight) for electrode, weight in derivation.items()}
+        else:
+            raise ValueError(f"The derivation of channel '{name}' has to be [anode, cathode] or a mapping of "
+                             f"electrodes to weights, not {derivation}.")
+    return {'channels': channels, 'keep_unused': bool(montage.get('keep_unused', False))}
+
+
+def montage_identity(montage: Montage) -> Any:
+    """
+    Returns a JSON serialisable identity of a montage, the derivations for user-defined montages, so editing a
+    montage file changes its identity.
+    """
+    if is_montage_file(montage) or isinstance(montage, dict):
+        return montage_spec(montage)
+    return montage
+
+
+def layout_fingerprint(channel_names: List[str], montage: Montage) -> str:
+    """
+    Fingerprints a channel layout together with a montage.
+
+    Args:
+        channel_names (list): Names of the channels of the recording.
+        montage (str or dict): The montage.
+
+    Returns:
+        str: Hex digest.
+    """
+    layout = json.dumps({'channels': list(channel_names), 'montage': montage_identity(montage)}, sort_keys=True)
+    return hashlib.blake2b(layout.encode(), digest_size=16).hexdigest()
+
+
+class CompiledMontage:
+    """
+    A montage compiled for one channel layout.
+
+    Attributes:
+        input_names (list): Names of the channels of the recording, in the order of the matrix columns.
+        channel_names (list): Names of the montage channels, in the order of the matrix rows.
+        matrix (scipy.sparse.csr_matrix): Derivation matrix of shape (n_montage_channels, n_channels).
+        fingerprint (str): Fingerprint of the layout and the montage.
+    """
+
+    def __init__(self, input_names: List[str], channel_names: List[str], matrix: sparse.csr_matrix,
+                 fingerprint: str):
+        self.input_names = list(input_names)
+        self.channel_names = list(channel_names)
+        self.matrix = matrix
+        self.fingerprint = fingerprint
+        # BLAS is faster than the sparse product unless the matrix is very sparse (e.g. bipolar pairs of hd-EEG)
+        self._dense = matrix.toarray() if matrix.nnz > DENSE_PRODUCT_DENSITY * np.prod(matrix.shape) else None
+
+    def apply(self, signal: np.ndarray) -> np.ndarray:
+        """
+        Re-references a signal with a single matrix product.
+
+        Args:
+            signal (np.ndarray): Array of shape (n_channels, n_samples), with the channels of input_names.
+
+        Returns:
+            np.ndarray: C-contiguous array of shape (n_montage_channels, n_samples) with the dtype of the signal.
+        """
+        matrix = self._dense if self._dense is not None else self.matrix
+        return np.ascontiguousarray(matrix @ signal, dtype=signal.dtype)
+
+    def epoch_blocks(self, signal: np.ndarray, onset_samples: np.ndarray, n_samples: int,
+                     max_block_samples: int) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Re-references the epochs of a signal lazily, block by block, so the re-referenced signal is never
+        materialised as a whole.
+
+        Every block covers consecutive epochs, their samples are re-referenced once with one matrix product and the
+        epochs are views on the result, so overlapping epochs stay overlapping views.
+
+        Args:
+            signal (np.ndarray): Array of shape (n_channels, n_samples), with the channels of input_names.
+            onset_samples (np.ndarray): Sorted onsets of the epochs in samples.
+            n_samples (int): Length of the epochs in samples.
+            max_block_samples (int): Maximum number of re-referenced samples (channels x samples) per block, every
+                                     block holds at least one epoch.
+
+        Yields:
+            tuple: (index of the first epoch of the block, tensor of shape (n_block_epochs, n_montage_channels,
+                   n_samples)).
+        """
+        onset_samples = np.asarray(onset_samples, dtype=int)
+        max_span = max(n_samples, max_block_samples // max(1, len(self.channel_names)))
+        first = 0
+        while first < len(onset_samples):
+            # All epochs which end within max_span samples of the onset of the first epoch of the block
+            last = int(np.searchsorted(onset_samples, onset_samples[first] + max_span - n_samples, side='right'))
+            last = max(last, first + 1)
+            start, stop = int(onset_samples[first]), int(onset_samples[last - 1]) + n_samples
+            block = self.apply(signal[:, start:stop])
+            yield first, epoch_view(block, onset_samples[first:last] - start, n_samples)
+            first = last
+
+
+def _compile_derivations(channel_names: List[str], spec: Dict[str, Any]) -> Tuple[sparse.csr_matrix, List[str]]:
+    """
+    Compiles the derivations of a bipolar or user-defined montage.
+
+    The channels are ordered as MNE orders them for bipolar montages: the channels which are not part of any
+    derivation come first (if they are kept), followed by the derivations whose electrodes are all present.
+    """
+    index = {name: i for i, name in enumerate(channel_names)}
+    derivations, dropped_names = [], []
+    for name, weights in spec['channels'].items():
+        matched = match_channel_names(list(weights), channel_names)
+        if all(matched):
+            derivations.append((name, {channel: weight for channel, weight in zip(matched, weights.values())}))
+        else:
+            dropped_names.append(name)
+    if dropped_names:
+        print(f'montage could not be set fully, probably not all needed channels are present. The following '
+              f'channels could not be computed: {dropped_names}')
+    if not derivations:
+        raise ValueError('montage could not be set at all')
+
+    kept = []
+    if spec['keep_unused']:
+        used = {channel for _, weights in derivations for channel in weights}
+        kept = [name for name in channel_names if name not in used]
+    rows, columns, data = [], [], []
+    for row, name in enumerate(kept):
+        rows.append(row)
+        columns.append(index[name])
+        data.append(1.0)
+    for row, (_, weights) in enumerate(derivations, start=len(kept)):
+        for channel, weight in weights.items():
+            rows.append(row)
+            columns.append(index[channel])
+            data.append(weight)
+    shape = (len(kept) + len(derivations), len(channel_names))
+    # duplicate entries (e.g. an electrode matched twice) are summed
+    matrix = sparse.coo_matrix((data, (rows, columns)), shape=shape).tocsr()
+    return matrix, kept + [name for name, _ in derivations]
+
+
+def compile_montage(channel_names: List[str], montage: Montage) -> CompiledMontage:
+    """
+    Compiles a montage for a channel layout, or returns the cached compilation of the same layout and montage.
+
+    Args:
+        channel_names (list): Names of the channels of the recording.
+        montage (str or dict): 'avg', 'doublebanana', 'circumferential', the name of a reference channel, the path
+                               of a YAML file with a user-defined montage (or its content), or None to keep the
+                               channels unchanged.
+
+    Returns:
+        CompiledMontage: The compiled montage.
+
+    Raises:
+        ValueError: If none of the derivations of a bipolar or user-defined montage can be computed.
+    """
+    fingerprint = layout_fingerprint(channel_names, montage)
+    compiled = _compiled_montages.get(fingerprint)
+    if compiled is not None:
+        return compiled
+
+    channel_names = list(channel_names)
+    n_channels = len(channel_names)
+    spec = montage_spec(montage)
+    names = channel_names
+    if montage is None:
+        matrix = sparse.identity(n_channels, format='csr')
+    elif isinstance(montage, str) and montage == 'avg':
+        matrix = sparse.csr_matrix(np.eye(n_channels) - 1.0 / n_channels)
+    elif spec is not None:
+        matrix, names = _compile_derivations(channel_names, spec)
+    elif montage in channel_names:
+        reference = sparse.csr_matrix(
+            (-np.ones(n_channels), (np.arange(n_channels), np.full(n_channels, channel_names.index(montage)))),
+            shape=(n_channels, n_channels),
+        )
+        matrix = (sparse.identity(n_channels, format='csr') + reference).tocsr()
+        matrix.eliminate_zeros()
+    else:
+        print(f'The given montage is not a viable option or a channel of the raw_internal object, no montage applied')
+        matrix = sparse.identity(n_channels, format='csr')
+
+    compiled = CompiledMontage(channel_names, names, matrix, fingerprint)
+    _compiled_montages[fingerprint] = compiled
+    return compiled
+
+
+def derivation_matrix(channel_names: List[str], montage: Montage) -> Tuple[np.ndarray, List[str]]:
+    """
+    Expresses a montage as a dense matrix which maps the channels of a recording to the channels of the montage.
+
+    Args:
+        channel_names (list): Names of the channels of the recording.
+        montage (str or dict): The montage, see compile_montage.
+
+    Returns:
+        tuple:
+            - matrix (np.ndarray): Array of shape (n_montage_channels, n_channels).
+            - names (list): Names of the montage channels.
+    """
+    compiled = compile_montage(channel_names, montage)
+    return compiled.matrix.toarray(), list(compiled.channel_names)
@@ -0,0 +1,239 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Intra-file parallelism for EEG analysis.
+
+This module splits the metric computation of one epoch tensor into (metric x channel block x epoch range) tasks, runs
+them longest-first on a process pool and merges the results in order. The signal is shared with the workers through
+shared memory. The pool is shared by all Array_processors of the process and kept for a whole experiment, so every
+worker sets up the metrics (e.g. starts a MATLAB engine) once, not once per file.
+"""
+
+import multiprocessing
+import multiprocessing.util
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from eeganalyzer.core.metric_registry import MetricSet, metric_registry
+from eeganalyzer.core.scheduler import longest_first, plan_metric_tasks
+from eeganalyzer.core.shared_signal import SharedSignal
+
+# Array_processor instances of a worker process, one per (metric_path, metric_name, sfreq)
+_worker_processors: Dict[Tuple[str, str, float], Any] = {}
+# Shared signals a worker process is attached to, by the name of their shared memory block
+_attached_signals: Dict[str, SharedSignal] = {}
+# The process pool of the main process and its number of workers
+_worker_pool: Optional[ProcessPoolExecutor] = None
+_worker_pool_size = 0
+
+
+def get_worker_pool(n_jobs: int) -> ProcessPoolExecutor:
+    """
+    Returns the process pool with n_jobs workers, started on first use.
+
+    The pool is reused for every block of epochs and every file until shutdown_worker_pool is called (e.g. at the end
+    of process_experiment), a request for another number of workers replaces it.
+
+    Args:
+        n_jobs (int): Number of worker processes.
+
+    Returns:
+        ProcessPoolExecutor: The process pool.
+    """
+    global _worker_pool, _worker_pool_size
+    if _worker_pool is not None and _worker_pool_size != n_jobs:
+        shutdown_worker_pool()
+    if _worker_pool is None:
+        _worker_pool = ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context(),
+                                           initializer=init_worker)
+        _worker_pool_size = n_jobs
+    return _worker_pool
+
+
+def shutdown_worker_pool() -> None:
+    """
+    Shuts down the process pool, if one was started. The workers tear down their metric sets when they exit.
+    """
+    global _worker_pool, _worker_pool_size
+    if _worker_pool is not None:
+        _worker_pool.shutdown()
+        _worker_pool, _worker_pool_size = None, 0
+
+
+def init_worker() -> None:
+    """
+    Initializer of the worker processes of a pool.
+
+    A forked worker inherits the resolved metric sets of its parent together with the resources setup_metrics created
+    for them (e.g. a MATLAB engine), which belong to the parent. The worker forgets them, so it sets up every metric
+    set itself on the first lookup, and registers its own teardown, as forked processes drop the finalizers of their
+    parent.
+    """
+    metric_registry.forget()
+    _worker_processors.clear()
+    _attached_signals.clear()
+    multiprocessing.util.Finalize(metric_registry, metric_registry.teardown, exitpriority=10)
+
+
+def _get_worker_processor(metric_path: str, metric_name: str, sfreq: float):
+    key = (metric_path, metric_name, sfreq)
+    if key not in _worker_processors:
+        # imported here as array_processor imports this module
+        from eeganalyzer.core.array_processor import Array_processor
+        _worker_processors[key] = Array_processor(metric_name=metric_name, metric_path=metric_path, sfreq=sfreq)
+    return _worker_processors[key]
+
+
+def _get_attached_signal(descriptor: Dict[str, Any]) -> SharedSignal:
+    name = descriptor['name']
+    if name not in _attached_signals:
+        # The workers are reused for the next tensors, the signals of earlier tensors are no longer needed
+        for signal in _attached_signals.values():
+            signal.close()
+        _attached_signals.clear()
+        _attached_signals[name] = SharedSignal.attach(descriptor)
+    return _attached_signals[name]
+
+
+def compute_epoch_task(metric_path: str, metric_name: str, sfreq: float, metric_names: List[str],
+                       descriptor: Dict[str, Any], layout: Tuple[int, Tuple[int, ...], Tuple[int, ...]],
+                       function_idx: int, epoch_start: int, epoch_stop: int, channel_start: int,
+                       channel_stop: int) -> Tuple[int, int, int, np.ndarray, float]:
+    """
+    Computes one metric function for a block of channels and a range of epochs. Runs inside a worker process.
+
+    The worker attaches to the shared signal and rebuilds the epoch tensor as a view on it, so only the descriptor
+    and the layout of the tensor are transferred.
+
+    Args:
+        metric_path (str): Path to the metrics file.
+        metric_name (str): Name of the metric set.
+        sfreq (float): Sampling frequency of the data.
+        metric_names (list[str]): Names of the metric set in the parent process, which the worker's set has to match.
+        descriptor (dict): Descriptor of the SharedSignal holding the data.
+        layout (tuple): (offset, shape, strides) of the epoch tensor within the shared signal.
+        function_idx (int): Index of the metric function within the metric set.
+        epoch_start (int): Index of the first epoch of the task.
+        epoch_stop (int): Index after the last epoch of the task.
+        channel_start (int): Index of the first channel of the task.
+        channel_stop (int): Index after the last channel of the task.
+
+    Returns:
+        tuple: (function_idx, epoch_start, channel_start, values, seconds) with values of shape
+               (n_epochs, n_metrics, n_channels) and the runtime of the metric function in seconds.
+    """
+    processor = _get_worker_processor(metric_path, metric_name, sfreq)
+    if metric_registry.get_metric_set(metric_path, metric_name).names != list(metric_names):
+        raise RuntimeError(f"The metric set '{metric_name}' of the worker differs from the one of the main process, "
+                           f"select_metrics has to return the same set whether setup_metrics was called or not.")
+    epoch_tensor = _get_attached_signal(descriptor).get_view(*layout)
+    timings = {}
+    values = processor.calc_metric_values(epoch_tensor[epoch_start:epoch_stop, channel_start:channel_stop],
+                                          verbose=False, function_indices=[function_idx], timings=timings)
+    return function_idx, epoch_start, channel_start, values, timings[function_idx]
+
+
+def run_epoch_tasks(processor, epoch_tensor: np.ndarray, metric_set: MetricSet, n_jobs: int,
+                    function_indices: Optional[List[int]] = None) -> np.ndarray:
+    """
+    Computes the metrics of an epoch tensor on the process pool (see get_worker_pool).
+
+    The work is split into (metric x channel block x epoch range) tasks of similar predicted cost, which are submitted
+    longest-first. The measured runtimes update the cost model of the processor, and the predicted and actual
+    runtimes are reported.
+
+    If the tensor is a view on the shared channel buffer of the processor, the workers rebuild it from shared memory.
+    Any other tensor is copied once into a temporary shared memory block.
+
+    Args:
+        processor (Array_processor): The processor holding the metric set, sampling frequency and cost model.
+        epoch_tensor (np.ndarray): Tensor of shape (n_epochs, n_channels, n_samples).
+        metric_set (MetricSet): The metric set to compute.
+        n_jobs (int): Number of worker processes, used to plan the tasks.
+        function_indices (list[int], optional): Indices of the metric functions to compute, defaults to all.
+
+    Returns:
+        np.ndarray: Results of shape (n_epochs, n_metrics, n_channels), NaN for metrics which were not computed.
+    """
+    n_epochs, n_channels, n_samples = epoch_tensor.shape
+    values = np.full((n_epochs, len(metric_set.names), n_channels), np.nan, dtype=processor.dtype)
+    metric_index = {name: i for i, name in enumerate(metric_set.names)}
+    cost_model = processor.get_cost_model()
+    identities = metric_set.identities
+    if function_indices is None:
+        function_indices = list(range(len(identities)))
+
+    call_costs = [cost_model.predict(identities[function_idx], n_samples) for function_idx in function_indices]
+    # The planned tasks refer to positions in function_indices
+    tasks = [(function_indices[task[0]],) + task[1:]
+             for task in plan_metric_tasks(call_costs, n_epochs, n_channels, n_jobs)]
+    tasks, predicted_makespan = longest_first(tasks, n_jobs)
+    print(f'Calculating {len(tasks)} tasks for {n_epochs} epochs and {n_channels} channels on {n_jobs} processes, '
+          f'predicted runtime: {predicted_makespan:.2f} seconds')
+
+    shared_signal = processor._shared_signal
+    temporary_signal = None
+    if shared_signal is None or not shared_signal.contains(epoch_tensor):
+        temporary_signal = shared_signal = SharedSignal.create(np.ascontiguousarray(epoch_tensor), sfreq=processor.sfreq)
+        epoch_tensor = shared_signal.array
+    descriptor = shared_signal.descriptor
+    layout = shared_signal.view_layout(epoch_tensor)
+
+    measured_seconds = [0.0] * len(identities)
+    measured_calls = [0] * len(identities)
+    start = time.perf_counter()
+    pool_broken = False
+    try:
+        executor = get_worker_pool(n_jobs)
+        # Tasks are taken from the queue in submission order, so the longest tasks start first
+        futures = [
+            executor.submit(compute_epoch_task, processor.metric_path, processor.metric_name, processor.sfreq,
+                            metric_set.names, descriptor, layout, function_idx, epoch_start, epoch_stop,
+                            channel_start, channel_stop)
+            for function_idx, epoch_start, epoch_stop, channel_start, channel_stop, _ in tasks
+        ]
+        # Results are merged by their indices, so the order of completion does not matter
+        for future in futures:
+            try:
+                function_idx, epoch_start, channel_start, task_values, seconds = future.result()
+            except Exception as e:
+                pool_broken = pool_broken or isinstance(e, BrokenProcessPool)
+                print(f"A parallel metric task failed. Exception: {e}")
+                continue
+            output_idx = [metric_index[name] for name in metric_set.output_names[function_idx]]
+            epochs = slice(epoch_start, epoch_start + task_values.shape[0])
+            channels = slice(channel_start, channel_start + task_values.shape[2])
+            values[epochs, output_idx, channels] = task_values[:, output_idx, :]
+            measured_seconds[function_idx] += seconds
+            measured_calls[function_idx] += task_values.shape[0] * task_values.shape[2]
+    finally:
+        if pool_broken:
+            # e.g. a worker was killed, the next tensor starts a new pool
+            shutdown_worker_pool()
+        if temporary_signal is not None:
+            temporary_signal.close()
+    actual_makespan = time.perf_counter() - start
+
+    # Report the predictions next to the measurements and learn from the measurements
+    for call_cost, function_idx in zip(call_costs, function_indices):
+        identity = identities[function_idx]
+        predicted = call_cost * n_epochs * n_channels
+        print(f'{", ".join(metric_set.output_names[function_idx])}: predicted {predicted:.2f} seconds, '
+              f'actual {measured_seconds[function_idx]:.2f} seconds (CPU time summed over processes)')
+        cost_model.record(identity, n_samples, measured_seconds[function_idx], measured_calls[function_idx])
+    print(f'Predicted runtime: {predicted_makespan:.2f} seconds, actual runtime: {actual_makespan:.2f} seconds')
+    return values
@@ -25,6 +25,7 @@ from multiprocesspandas import applyparallel
 
 from eeganalyzer.core.eeg_processor import EEG_processor
 from eeganalyzer.core.csv_processor import CSVProcessor
+from eeganalyzer.core.parallel import shutdown_worker_pool
 from eeganalyzer.utils.database import Alchemist
 
 
@@ -159,7 +160,11 @@ def get_files_dataframe(bids_folder: str, infile_ending: str, outfile_ending: st
 
 def process_file(row: pd.Series, metric_set_name: str, metric_path: str, annotations: List[str], lfreq: Optional[Union[int, float]],
                  hfreq: Optional[Union[int, float]], montage: str, ep_start: Optional[int], ep_stop: Optional[int], 
-                 ep_dur: Optional[int], ep_overlap: int, sfreq: Union[int, float], recompute: bool) -> None:
+                 ep_dur: Optional[int], ep_overlap: int, sfreq: Union[int, float], recompute: Union[bool, str],
+                 n_jobs: int = 1, metric_cache: Optional[str] = None, dtype: Optional[str] = None,
+                 chunk_duration: Optional[float] = None, signal_cache: Optional[str] = None,
+                 signal_cache_size: Optional[float] = None, lazy_montage: bool = False,
+                 filter_order: Optional[int] = None, filter_design: Optional[str] = None) -> None:
     """
     Processes a single file.
 
@@ -175,7 +180,19 @@ def process_file(row: pd.Series, metric_set_name: str, metric_path: str, annotat
         ep_dur (int): Epoch duration.
         ep_overlap (int): Overlap of epochs.
         sfreq (int or float): Sampling frequency.
-        recompute (bool): Whether to recompute metrics.
+        recompute (bool or str): Whether to recompute metrics, 'missing' only computes the results which are missing
+            in an existing output file.
+        n_jobs (int): Number of processes used to compute the metrics of the file.
+        metric_cache (str, optional): Path of the metric cache database, None disables the cache.
+        dtype (str, optional): 'float32' keeps the signal and the results in single precision, None uses float64.
+        chunk_duration (float, optional): If given, EEG files are streamed in chunks of this many seconds instead of
+            being loaded as a whole.
+        signal_cache (str, optional): Folder of the cache of preprocessed EEG signals, None disables the cache.
+        signal_cache_size (float, optional): Size budget of the signal cache in GB, None for no limit.
+        lazy_montage (bool): If True, the montage is applied per block of epochs instead of to the whole signal.
+        filter_order (int, optional): Order of the Butterworth filters, None uses the default order.
+        filter_design (str, optional): 'butterworth' for zero-phase Butterworth filters fused with polyphase
+            resampling, None filters EEG files as MNE does and CSV files with separate Butterworth filters.
     """
     file_path = row['file_path']
     outpath = row['outpath']
@@ -187,24 +204,32 @@ def process_file(row: pd.Series, metric_set_name: str, metric_path: str, annotat
 
         # Initialize EEG_processor and compute metrics
         if file_path.endswith(".fif") or file_path.endswith(".edf"):
-            eeg_processor = EEG_processor(file_path)
-            result = eeg_processor.compute_metrics(
-                metric_set_name,
-                metric_path,
-                annotations,
-                outpath,
-                lfreq,
-                hfreq,
-                montage,
-                ep_start,
-                ep_stop,
-                ep_dur,
-                ep_overlap,
-                sfreq,
-                recompute,
-            )
+            # Not preloaded, compute_metrics loads only the parts of the file which are analysed
+            eeg_processor = EEG_processor(file_path, preload=False, n_jobs=n_jobs, metric_cache=metric_cache,
+                                          dtype=dtype, chunk_duration=chunk_duration, signal_cache=signal_cache,
+                                          signal_cache_size=signal_cache_size, lazy_montage=lazy_montage,
+                                          filter_order=filter_order, filter_design=filter_design)
+            try:
+                result = eeg_processor.compute_metrics(
+                    metric_set_name,
+                    metric_path,
+                    annotations,
+                    outpath,
+                    lfreq,
+                    hfreq,
+                    montage,
+                    ep_start,
+                    ep_stop,
+                    ep_dur,
+                    ep_overlap,
+                    sfreq,
+                    recompute,
+                )
+            finally:
+                eeg_processor.close()
         elif file_path.endswith(".csv"):
-            csv_processor = CSVProcessor(file_path, sfreq=sfreq)
+            csv_processor = CSVProcessor(file_path, sfreq=sfreq, n_jobs=n_jobs, metric_cache=metric_cache,
+                                         dtype=dtype, filter_order=filter_order, filter_design=filter_design)
             result = csv_processor.compute_metrics(
                 metric_set_name,
                 metric_path,
@@ -225,14 +250,111 @@ def process_file(row: pd.Series, metric_set_name: str, metric_path: str, annotat
         print(f"Skipping already processed file: {file_path}")
 
 
-def process_experiment(config: Dict[str, Any], log_file: Optional[str], num_processes: int = 4) -> None:
+def preprocessing_order(run: Dict[str, Any]) -> tuple:
+    """
+    Sort key which orders runs by filter band, sampling frequency and montage, the levels of the preprocessing tree.
+    """
+    return tuple(str(run[key]) for key in ('lfreq', 'hfreq', 'sfreq', 'montage'))
+
+
+def process_file_runs(row: pd.Series, metric_set_name: str, metric_path: str, annotations: List[str],
+                      ep_start: Optional[int], ep_stop: Optional[int], ep_dur: Optional[int], ep_overlap: int,
+                      recompute: Union[bool, str], n_jobs: int = 1, metric_cache: Optional[str] = None,
+                      dtype: Optional[str] = None, chunk_duration: Optional[float] = None,
+                      signal_cache: Optional[str] = None, signal_cache_size: Optional[float] = None,
+                      lazy_montage: bool = False, filter_order: Optional[int] = None,
+                      filter_design: Optional[str] = None) -> None:
+    """
+    Processes all runs of an experiment on a single file.
+
+    EEG files are opened and decoded once for all runs. The runs are ordered by filter band, sampling frequency and
+    montage, so every filter band and every downsampled signal is computed once and shared by the runs below it in
+    this preprocessing tree. Other files are processed run by run with process_file.
+
+    Args:
+        row (pd.Series): Row with the 'file_path' and the 'runs' of the file. Every run is a dictionary with
+            run_name, outpath, already_processed, lfreq, hfreq, sfreq and montage.
+        For the other arguments see process_file.
+    """
+    file_path = row['file_path']
+    runs = [run for run in row['runs'] if not run['already_processed'] or recompute]
+    for run in row['runs']:
+        if run['already_processed'] and not recompute:
+            print(f"Skipping already processed file: {file_path} for run {run['run_name']}")
+    if not runs:
+        return
+
+    if file_path.endswith(".fif") or file_path.endswith(".edf"):
+        print(f"Processing file: {file_path} for {len(runs)} run(s)")
+        eeg_processor = EEG_processor(file_path, preload=False, n_jobs=n_jobs, metric_cache=metric_cache,
+                                      dtype=dtype, chunk_duration=chunk_duration, signal_cache=signal_cache,
+                                      signal_cache_size=signal_cache_size, share_preprocessing=True,
+                                      lazy_montage=lazy_montage, filter_order=filter_order,
+                                      filter_design=filter_design)
+        try:
+            for run in sorted(runs, key=preprocessing_order):
+                print(f"Run: {run['run_name']}, Output path: {run['outpath']}")
+                result = eeg_processor.compute_metrics(
+                    metric_set_name,
+                    metric_path,
+                    annotations,
+                    run['outpath'],
+                    run['lfreq'],
+                    run['hfreq'],
+                    run['montage'],
+                    ep_start,
+                    ep_stop,
+                    ep_dur,
+                    ep_overlap,
+                    run['sfreq'],
+                    recompute,
+                )
+                print(f"Result: {result}")
+        finally:
+            eeg_processor.close()
+    else:
+        for run in runs:
+            process_file(
+                pd.Series({'file_path': file_path, 'outpath': run['outpath'], 'already_processed': False}),
+                metric_set_name, metric_path, annotations, run['lfreq'], run['hfreq'], run['montage'], ep_start,
+                ep_stop, ep_dur, ep_overlap, run['sfreq'], recompute, n_jobs=n_jobs, metric_cache=metric_cache,
+                dtype=dtype, chunk_duration=chunk_duration, signal_cache=signal_cache,
+                signal_cache_size=signal_cache_size, lazy_montage=lazy_montage, filter_order=filter_order,
+                filter_design=filter_design,
+            )
+
+
+def resolve_n_jobs(n_jobs: Optional[int]) -> int:
+    """
+    Validates the number of processes used within one file and resolves -1 to the number of CPUs.
+
+    Args:
+        n_jobs (int, optional): Number of processes, None (or empty) computes serially, -1 uses all CPUs.
+
+    Returns:
+        int: The number of processes, at least 1.
+    """
+    if n_jobs is None:
+        return 1
+    if isinstance(n_jobs, bool) or not isinstance(n_jobs, int) or (n_jobs < 1 and n_jobs != -1):
+        raise ValueError(f"n_jobs must be a positive integer or -1, got {n_jobs!r}.")
+    if n_jobs == -1:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def process_experiment(config: Dict[str, Any], log_file: Optional[str], num_processes: int = 4,
+                       n_jobs: Optional[int] = None) -> None:
     """
     Processes experiments and their respective runs as specified in the YAML configuration.
 
     Args:
         config (dict): The dictionary representation of the YAML configuration file.
         log_file (str): The path to the log file where outputs and logs will be saved.
-        num_processes (int): Number of processes to use for parallel processing.
+        num_processes (int): Number of processes to use for parallel processing of files.
+        n_jobs (int, optional): Number of processes used within one file (epochs x channels). Overrides the n_jobs of
+                                the experiments in the configuration. If larger than 1, files are processed one
+                                after the other instead of in parallel.
     """
     # Redirect all print outputs to the log file
     if log_file:
@@ -260,25 +382,33 @@ def process_experiment(config: Dict[str, Any], log_file: Optional[str], num_proc
             )
             metric_set_name = experiment['metric_set_name']
             metric_path = experiment['metric_path']
+            file_n_jobs = resolve_n_jobs(n_jobs if n_jobs is not None else experiment.get('n_jobs'))
+            metric_cache = experiment.get('metric_cache')
+            dtype = experiment.get('dtype')
+            chunk_duration = experiment.get('chunk_duration')
+            signal_cache = experiment.get('signal_cache')
+            signal_cache_size = experiment.get('signal_cache_size')
+            lazy_montage = bool(experiment.get('lazy_montage'))
+            filter_order = experiment.get('filter_order')
+            filter_design = experiment.get('filter_design')
 
             # add or update dataset in sqlite database
             dataset_id = add_or_update_dataset(session, experiment)
             print(f"Using dataset ID: {dataset_id}")
 
-            # Iterate through runs for each experiment
+            # Register every run and collect the runs which have to be computed for each file
+            experiment_objects = []
+            file_runs = {}
             for run in experiment['runs']:
                 # Extract run-level configuration
                 run_name = run['name']
-                lfreq = run['filter']['l_freq']
-                hfreq = run['filter']['h_freq']
-                sfreq = run['sfreq']
-                montage = run['montage']
                 folder_extensions = run['metrics_prefix']
 
                 print(
-                    f'{"#" * 20} Running experiment "{exp_name}" and run "{run_name}" on folder "{bids_folder}" {"#" * 20}\n')
+                    f'{"#" * 20} Preparing experiment "{exp_name}" and run "{run_name}" on folder "{bids_folder}" {"#" * 20}\n')
 
                 experiment_object = add_or_update_experiment(session, experiment, run)
+                experiment_objects.append(experiment_object)
                 # create first experiment, then files df and add experiment to each eeg
                 # Create DataFrame of valid files to process (also adds the eegs to the database)
                 files_df = get_files_dataframe(bids_folder, input_file_ending, outfile_ending, folder_extensions,
@@ -286,29 +416,62 @@ def process_experiment(config: Dict[str, Any], log_file: Optional[str], num_proc
                 print(f"Generated DataFrame with {len(files_df)} files:")
                 # print(files_df.head())
 
-
-                n_chunks = max(len(files_df) // num_processes, 1)
+                for _, row in files_df.iterrows():
+                    file_runs.setdefault(row['file_path'], []).append(dict(
+                        run_name=run_name,
+                        outpath=row['outpath'],
+                        already_processed=row['already_processed'],
+                        lfreq=run['filter']['l_freq'],
+                        hfreq=run['filter']['h_freq'],
+                        sfreq=run['sfreq'],
+                        montage=run['montage'],
+                    ))
+            plan_df = pd.DataFrame([{'file_path': file_path, 'runs': runs} for file_path, runs in file_runs.items()],
+                                   columns=['file_path', 'runs'])
+
+            print(f'{"#" * 20} Running experiment "{exp_name}" with {len(experiment["runs"])} runs on '
+                  f'{len(plan_df)} files {"#" * 20}\n')
+            file_kwargs = dict(
+                metric_set_name=metric_set_name,
+                metric_path=metric_path,
+                annotations=annotations,
+                ep_start=ep_start,
+                ep_stop=ep_stop,
+                ep_dur=ep_dur,
+                ep_overlap=ep_overlap,
+                recompute=recompute,
+                n_jobs=file_n_jobs,
+                metric_cache=metric_cache,
+                dtype=dtype,
+                chunk_duration=chunk_duration,
+                signal_cache=signal_cache,
+                signal_cache_size=signal_cache_size,
+                lazy_montage=lazy_montage,
+                filter_order=filter_order,
+                filter_design=filter_design,
+            )
+            if plan_df.empty:
+                print('No files to process.')
+            elif file_n_jobs > 1:
+                # The processes are used within each file, so the files are processed one after the other. All files
+                # share one process pool, so the workers set up the metrics once per experiment
+                try:
+                    plan_df.apply(process_file_runs, axis=1, **file_kwargs)
+                finally:
+                    shutdown_worker_pool()
+            else:
+                n_chunks = max(len(plan_df) // num_processes, 1)
                 num_processes = min(n_chunks, num_processes)
-                files_df.apply_parallel(
-                    process_file,
-                    metric_set_name=metric_set_name,
-                    metric_path=metric_path,
-                    annotations=annotations,
-                    lfreq=lfreq,
-                    hfreq=hfreq,
-                    montage=montage,
-                    ep_start=ep_start,
-                    ep_stop=ep_stop,
-                    ep_dur=ep_dur,
-                    ep_overlap=ep_overlap,
-                    sfreq=sfreq,
-                    recompute=recompute,
+                plan_df.apply_parallel(
+                    process_file_runs,
+                    **file_kwargs,
                     axis=0,
                     num_processes=num_processes,
                     n_chunks=n_chunks,
                 )
 
-                # Add the computed result frames to the database by iterating over the eegs of the experiment
+            # Add the computed result frames to the database by iterating over the eegs of the experiments
+            for experiment_object in experiment_objects:
                 populate_data_tables(session, experiment_object)
 
     # Print a final message indicating completion
@@ -0,0 +1,293 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Resampling and filtering stage for EEG analysis.
+
+This module provides the ResampleFilterStage class, which filters and downsamples a signal in the same way for the
+EEG_processor, the StreamReader and the CSVProcessor. There are two filter designs:
+
+- 'mne' (default) filters and resamples as raw.filter and raw.resample of MNE do, with MNE's zero-phase FIR filter and
+  FFT resampling. Parts of a signal (see StreamReader) are resampled with a polyphase filter instead, as the FFT
+  resampling of a part does not match the resampling of the whole signal.
+- 'butterworth' filters with zero-phase Butterworth filters in second-order sections and resamples polyphase with the
+  ratio reduced to its smallest terms. When the signal is downsampled to a rate whose Nyquist frequency is close above
+  the upper cutoff frequency, the low-pass is not applied as a filter of its own, but is the anti-aliasing filter of
+  the polyphase resampling. The high-pass of a downsampled signal is applied after the resampling at the lower rate.
+
+The designs give different signals, so results computed with one design are not comparable with results of the other.
+Filter designs are cached per sampling frequency, band and order.
+"""
+
+from fractions import Fraction
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import mne
+import numpy as np
+from scipy.signal import butter, firwin, resample_poly, sosfilt, sosfiltfilt
+
+# Designs of the filters and the resampling, see the module docstring
+FILTER_DESIGNS = ('mne', 'butterworth')
+DEFAULT_FILTER_DESIGN = 'mne'
+
+# Order of the Butterworth filters, zero-phase filtering doubles the attenuation
+DEFAULT_FILTER_ORDER = 4
+
+# The low-pass is fused with the anti-aliasing filter if its cutoff is at least this fraction of the Nyquist frequency
+# of the output rate. Lower cutoffs need longer polyphase filters, which cost more than a separate low-pass.
+FUSED_MIN_CUTOFF = 0.5
+
+# Relative size of the impulse response below which a filter is considered settled, see settling_samples
+_SETTLED = 1e-12
+
+
+def resampling_factors(sfreq: float, resamp_freq: Optional[float]) -> Tuple[int, int]:
+    """
+    Works out the polyphase factors for resampling from sfreq to resamp_freq, reduced by their greatest common
+    divisor (e.g. 256 Hz to 100 Hz is up 25, down 64). Frequencies which are not integers are approximated by
+    fractions.
+
+    Args:
+        sfreq (float): Sampling frequency of the signal.
+        resamp_freq (float): Frequency the signal is downsampled to, None for no resampling.
+
+    Returns:
+        tuple: (up, down), (1, 1) if the signal is not downsampled.
+    """
+    if not resamp_freq or resamp_freq >= sfreq:
+        return 1, 1
+    # Fractions are always in their smallest terms
+    ratio = Fraction(resamp_freq).limit_denominator() / Fraction(sfreq).limit_denominator()
+    return ratio.numerator, ratio.denominator
+
+
+@lru_cache(maxsize=None)
+def design_sos(sfreq: float, l_freq: Optional[float] = None, h_freq: Optional[float] = None,
+               order: int = DEFAULT_FILTER_ORDER) -> Optional[np.ndarray]:
+    """
+    Designs a Butterworth filter in second-order sections, cached per sampling frequency, band and order.
+
+    The band follows the filter settings of the runs: l_freq and h_freq give a band-pass, only l_freq a high-pass,
+    only h_freq a low-pass and l_freq above h_freq a band-stop between h_freq and l_freq. Cutoffs which are not
+    positive or not below the Nyquist frequency are ignored.
+
+    Returns:
+        np.ndarray or None: Array of shape (n_sections, 6), shared by all callers and not to be modified, None if
+                           nothing is filtered.
+    """
+    nyquist = sfreq / 2
+    l_freq = l_freq if l_freq and 0 < l_freq < nyquist else None
+    h_freq = h_freq if h_freq and 0 < h_freq < nyquist else None
+    if l_freq and h_freq:
+        if l_freq < h_freq:
+            sos = butter(order, [l_freq, h_freq], btype='bandpass', fs=sfreq, output='sos')
+        else:
+            sos = butter(order, [h_freq, l_freq], btype='bandstop', fs=sfreq, output='sos')
+    elif l_freq:
+        sos = butter(order, l_freq, btype='highpass', fs=sfreq, output='sos')
+    elif h_freq:
+        sos = butter(order, h_freq, btype='lowpass', fs=sfreq, output='sos')
+    else:
+        return None
+    return sos
+
+
+@lru_cache(maxsize=None)
+def design_fir(sfreq: float, l_freq: Optional[float] = None, h_freq: Optional[float] = None) -> Optional[np.ndarray]:
+    """
+    Designs the zero-phase FIR filter MNE designs for raw.filter with its default settings, cached per sampling
+    frequency and band. The band follows the filter settings of the runs, as for design_sos.
+
+    Returns:
+        np.ndarray or None: Filter coefficients, shared by all callers and not to be modified, None if nothing is
+                           filtered.
+    """
+    nyquist = sfreq / 2
+    l_freq = l_freq if l_freq and 0 < l_freq < nyquist else None
+    h_freq = h_freq if h_freq and 0 < h_freq < nyquist else None
+    if not l_freq and not h_freq:
+        return None
+    return mne.filter.create_filter(None, sfreq, l_freq, h_freq, verbose=False)
+
+
+@lru_cache(maxsize=None)
+def design_resampling_window(up: int, down: int, cutoff: Optional[float] = None) -> np.ndarray:
+    """
+    Designs the FIR low-pass of the polyphase resampling, the Kaiser window resample_poly uses by default. A lower
+    cutoff lengthens the filter, so its transition band stays in proportion to the cutoff.
+
+    Args:
+        up (int): Upsampling factor.
+        down (int): Downsampling factor.
+        cutoff (float, optional): Cutoff relative to the Nyquist frequency of the input signal, defaults to the
+                                  Nyquist frequency of the output signal.
+
+    Returns:
+        np.ndarray: Filter coefficients, shared by all callers and not to be modified.
+    """
+    # Relative to the Nyquist frequency of the upsampled signal
+    f_c = 1. / max(up, down) if cutoff is None else min(cutoff / up, 1. / max(up, down))
+    half_len = int(np.ceil(10 / f_c - 1e-9))
+    return firwin(2 * half_len + 1, f_c, window=('kaiser', 5.0))
+
+
+@lru_cache(maxsize=None)
+def settling_samples(sfreq: float, l_freq: Optional[float] = None, h_freq: Optional[float] = None,
+                     order: int = DEFAULT_FILTER_ORDER) -> int:
+    """
+    Number of samples after which the impulse response of the filter (see design_sos) has decayed, so parts of a
+    signal which are filtered with this much context on both sides match the filtered signal as a whole.
+    """
+    sos = design_sos(sfreq, l_freq, h_freq, order)
+    if sos is None:
+        return 0
+    n_samples = int(sfreq)
+    while True:
+        impulse = np.zeros(n_samples)
+        impulse[0] = 1
+        response = np.abs(sosfilt(sos, impulse))
+        above = np.flatnonzero(response > _SETTLED * response.max())
+        # The last quarter has to be settled, otherwise slowly decaying responses could be cut off early
+        if above[-1] < 3 * n_samples // 4:
+            return int(above[-1]) + 1
+        n_samples *= 2
+
+
+class ResampleFilterStage:
+    """
+    Filters and downsamples signals of shape (..., n_samples).
+
+    The stage consists of up to three steps, all of them zero-phase: a filter at the input rate (prefilter), the
+    resampling and a filter at the output rate (postfilter). With the 'mne' design the whole band is filtered at the
+    input rate and there is no postfilter. With the 'butterworth' design the whole band is filtered at the input rate
+    if the signal is not resampled. With resampling the high-pass is filtered at the output rate and the low-pass, if
+    it is close below the Nyquist frequency of the output rate (see FUSED_MIN_CUTOFF), is the low-pass of the
+    polyphase filter (fused), otherwise it is filtered at the input rate.
+
+    Attributes:
+        design (str): The filter design, one of FILTER_DESIGNS.
+        raw_sfreq (float): Sampling frequency of the input signal.
+        sfreq (float): Sampling frequency of the output signal.
+        up (int): Upsampling factor of the polyphase resampling.
+        down (int): Downsampling factor of the polyphase resampling.
+        fused (bool): True if the low-pass is the anti-aliasing filter of the resampling.
+        pre_band (tuple): (l_freq, h_freq) of the prefilter, None if there is none.
+        pre_sos (np.ndarray): Butterworth prefilter, None if there is none.
+        pre_fir (np.ndarray): FIR prefilter of the 'mne' design, None if there is none.
+        pre_context (int): Input samples needed on both sides of a part of the signal for the prefilter.
+        window (np.ndarray): FIR filter of the polyphase resampling, None if the signal is not resampled.
+        resample_context (int): Input samples needed on both sides of a part of the signal for the resampling.
+        post_sos (np.ndarray): Postfilter, None if there is none.
+        post_context (int): Output samples needed on both sides of a part of the signal for the postfilter.
+    """
+
+    def __init__(self, sfreq: float, l_freq: Optional[float] = None, h_freq: Optional[float] = None,
+                 resamp_freq: Optional[float] = None, order: Optional[int] = None, design: Optional[str] = None):
+        """
+        Args:
+            sfreq (float): Sampling frequency of the input signal.
+            l_freq (float, optional): Lower cutoff frequency, None for no high-pass.
+            h_freq (float, optional): Upper cutoff frequency, None for no low-pass. Below l_freq, the band between
+                                      h_freq and l_freq is stopped.
+            resamp_freq (float, optional): Frequency the signal is downsampled to, ignored if it is not lower than
+                                           sfreq.
+            order (int, optional): Order of the Butterworth filters, defaults to DEFAULT_FILTER_ORDER.
+            design (str, optional): One of FILTER_DESIGNS, defaults to DEFAULT_FILTER_DESIGN.
+        """
+        design = design or DEFAULT_FILTER_DESIGN
+        if design not in FILTER_DESIGNS:
+            raise ValueError(f"Unknown filter design '{design}', valid designs are: {', '.join(FILTER_DESIGNS)}.")
+        order = order or DEFAULT_FILTER_ORDER
+        l_freq = l_freq if l_freq and l_freq > 0 else None
+        h_freq = h_freq if h_freq and h_freq < sfreq / 2 else None
+        self.design = design
+        self.raw_sfreq = sfreq
+        self.up, self.down = resampling_factors(sfreq, resamp_freq)
+        resampling = self.up != self.down
+        # MNE resamples to exactly the requested frequency
+        self.sfreq = float(resamp_freq) if resampling and design == 'mne' else sfreq * self.up / self.down
+        band_stop = bool(l_freq and h_freq and l_freq >= h_freq)
+
+        self.fused = bool(design == 'butterworth' and resampling and h_freq and not band_stop
+                          and FUSED_MIN_CUTOFF * self.sfreq / 2 <= h_freq <= self.sfreq / 2)
+        self.pre_band, post_l_freq = (l_freq, h_freq), None
+        if design == 'butterworth' and resampling and not band_stop:
+            self.pre_band, post_l_freq = (None, None if self.fused else h_freq), l_freq
+        self.pre_sos, self.pre_fir = None, None
+        if design == 'mne':
+            self.pre_fir = design_fir(sfreq, *self.pre_band)
+            self.pre_context = 0 if self.pre_fir is None else (len(self.pre_fir) - 1) // 2
+        else:
+            self.pre_sos = design_sos(sfreq, *self.pre_band, order)
+            self.pre_context = settling_samples(sfreq, *self.pre_band, order)
+        if self.pre_sos is None and self.pre_fir is None:
+            self.pre_band = None
+
+        self.window, self.resample_context = None, 0
+        if resampling:
+            cutoff = h_freq / (sfreq / 2) if self.fused else None
+            self.window = design_resampling_window(self.up, self.down, cutoff)
+            # The polyphase filter reaches half its length of upsampled samples to both sides
+            self.resample_context = (len(self.window) - 1) // 2 // self.up + 2
+
+        self.post_sos = design_sos(self.sfreq, post_l_freq, None, order)
+        self.post_context = settling_samples(self.sfreq, post_l_freq, None, order)
+
+    def output_length(self, n_samples: int) -> int:
+        """
+        Number of output samples of the polyphase resampling for n_samples input samples.
+        """
+        return -(-n_samples * self.up // self.down)
+
+    def prefilter(self, x: np.ndarray) -> np.ndarray:
+        """
+        Applies the prefilter along the last axis.
+        """
+        if self.pre_fir is not None:
+            # As raw.filter, including its padding at the ends of the signal
+            return mne.filter.filter_data(np.asarray(x, dtype=np.float64), self.raw_sfreq, *self.pre_band,
+                                          verbose=False)
+        return x if self.pre_sos is None else sosfiltfilt(self.pre_sos, x, axis=-1)
+
+    def resample(self, x: np.ndarray) -> np.ndarray:
+        """
+        Resamples a whole signal along the last axis, with the 'mne' design as raw.resample does.
+        """
+        if self.window is not None and self.design == 'mne':
+            return mne.filter.resample(x, up=self.sfreq, down=self.raw_sfreq, npad='auto', axis=-1, verbose=False)
+        return self.resample_polyphase(x)
+
+    def resample_polyphase(self, x: np.ndarray) -> np.ndarray:
+        """
+        Resamples along the last axis with the polyphase filter, which also resamples parts of a signal as they are
+        resampled in the whole signal.
+        """
+        return x if self.window is None else resample_poly(x, self.up, self.down, axis=-1, window=self.window)
+
+    def postfilter(self, x: np.ndarray) -> np.ndarray:
+        """
+        Applies the postfilter along the last axis.
+        """
+        return x if self.post_sos is None else sosfiltfilt(self.post_sos, x, axis=-1)
+
+    def apply(self, x: np.ndarray) -> np.ndarray:
+        """
+        Filters and resamples a whole signal along its last axis.
+
+        Args:
+            x (np.ndarray): Signal at the input rate.
+
+        Returns:
+            np.ndarray: Signal at the output rate, in float64.
+        """
+        return self.postfilter(self.resample(self.prefilter(x)))
@@ -0,0 +1,250 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Result accumulator for EEG analysis.
+
+This module provides the ResultAccumulator class which collects the metric results of all epochs of a file in one
+preallocated array and converts them into the metrics dataframe layout in a single step, together with helpers to
+read previously saved results and merge new results into them. The preprocessing settings of the results are saved
+next to them, so results of different preprocessing are not merged.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from typing import Any, List, Optional, Sequence, Union
+
+
+class ResultAccumulator:
+    """
+    Columnar container for metric results of shape (n_epochs, n_metrics, n_channels).
+
+    The label, start and duration of each epoch are kept in parallel arrays. Missing or failed results are NaN.
+
+    Attributes:
+        metric_names (list[str]): Names of the metrics along the second axis.
+        channel_names (list): Names of the channels along the third axis.
+        values (np.ndarray): The preallocated result array.
+        labels (np.ndarray): Label of each epoch.
+        starts (np.ndarray): Start of each epoch in seconds.
+        durations (np.ndarray): Duration of each epoch in seconds.
+    """
+
+    def __init__(self, n_epochs: int, metric_names: List[str], channel_names: Sequence[Union[str, int]],
+                 dtype: Union[str, np.dtype] = np.float64):
+        self.metric_names: List[str] = list(metric_names)
+        self.channel_names: List[Union[str, int]] = list(channel_names)
+        self.metric_index = {name: i for i, name in enumerate(self.metric_names)}
+        self.values: np.ndarray = np.full((n_epochs, len(self.metric_names), len(self.channel_names)), np.nan,
+                                          dtype=dtype)
+        self.labels: np.ndarray = np.full(n_epochs, '<missing>', dtype=object)
+        self.starts: np.ndarray = np.zeros(n_epochs, dtype=object)
+        self.durations: np.ndarray = np.zeros(n_epochs, dtype=object)
+
+    @property
+    def n_epochs(self) -> int:
+        return self.values.shape[0]
+
+    def set_epoch(self, epoch: int, label: Union[str, int, float], start: float, duration: float) -> None:
+        """
+        Sets the label, start and duration of an epoch.
+
+        Parameters:
+            epoch (int): Index of the epoch.
+            label (str): Label associated with the epoch.
+            start (float): Start time of the epoch in seconds.
+            duration (float): Duration of the epoch in seconds.
+        """
+        self.labels[epoch] = label
+        self.starts[epoch] = start
+        self.durations[epoch] = duration
+
+    def set_value(self, epoch: int, metric: Union[int, str], channel: int, value: Any) -> None:
+        """
+        Stores a single result, values which can not be converted to a float are stored as NaN.
+
+        Parameters:
+            epoch (int): Index of the epoch.
+            metric (int or str): Index or name of the metric.
+            channel (int): Index of the channel.
+            value: The result of the metric.
+        """
+        if isinstance(metric, str):
+            metric = self.metric_index[metric]
+        try:
+            self.values[epoch, metric, channel] = np.nan if value is None else value
+        except (TypeError, ValueError):
+            print(f"Result {value} of metric '{self.metric_names[metric]}' is not numeric, storing NaN instead.")
+            self.values[epoch, metric, channel] = np.nan
+
+    def fill_from_dataframe(self, frame: Optional[pd.DataFrame]) -> np.ndarray:
+        """
+        Copies the results of a previously computed metrics dataframe (e.g. a saved metrics CSV) into the
+        accumulator. Rows are matched by label, startDataRecord, duration and metric, columns by channel name.
+
+        Parameters:
+            frame (pd.DataFrame): A dataframe in the layout of to_dataframe.
+
+        Returns:
+            np.ndarray: Boolean array of the shape of values, True where a non-NaN result was copied.
+        """
+        found = np.zeros(self.values.shape, dtype=bool)
+        if frame is None or frame.empty or self.n_epochs == 0:
+            return found
+        frame_columns = {str(column): position for position, column in enumerate(frame.columns)}
+        channel_positions = [(channel_idx, frame_columns[str(channel)])
+                             for channel_idx, channel in enumerate(self.channel_names) if str(channel) in frame_columns]
+        if not channel_positions:
+            return found
+        channel_idx, column_idx = (np.array(positions) for positions in zip(*channel_positions))
+        rows = {_row_key(*key): row for row, key in enumerate(frame.index)}
+        frame_values = frame.to_numpy(dtype=float, na_value=np.nan)
+        for epoch_idx in range(self.n_epochs):
+            for metric_idx, metric in enumerate(self.metric_names):
+                row = rows.get(_row_key(self.labels[epoch_idx], self.starts[epoch_idx], self.durations[epoch_idx],
+                                        metric))
+                if row is None:
+                    continue
+                row_values = frame_values[row, column_idx]
+                self.values[epoch_idx, metric_idx, channel_idx] = row_values
+                found[epoch_idx, metric_idx, channel_idx] = ~np.isnan(row_values)
+        return found
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Converts the accumulated results into the metrics dataframe layout.
+
+        Returns:
+            pd.DataFrame: A dataframe with one column per channel and a multi-index on label, startDataRecord,
+                          duration and metric.
+        """
+        if self.n_epochs == 0:
+            return pd.DataFrame()
+        n_metrics = len(self.metric_names)
+        index = pd.MultiIndex.from_arrays(
+            [
+                np.repeat(self.labels, n_metrics).tolist(),
+                np.repeat(self.starts, n_metrics).tolist(),
+                np.repeat(self.durations, n_metrics).tolist(),
+                self.metric_names * self.n_epochs,
+            ],
+            names=['label', 'startDataRecord', 'duration', 'metric'],
+        )
+        # (n_epochs, n_metrics, n_channels) -> (n_epochs * n_metrics, n_channels) is a view, no copy
+        return pd.DataFrame(self.values.reshape(-1, len(self.channel_names)), index=index,
+                            columns=self.channel_names, copy=False)
+
+
+def _row_key(label: Any, start: Any, duration: Any, metric: Any) -> tuple:
+    # labels and metrics are read back as strings and times as floats from a CSV file
+    return str(label), float(start), float(duration), str(metric)
+
+
+def read_result_frame(path: str) -> Optional[pd.DataFrame]:
+    """
+    Reads a metrics CSV file written from a dataframe of to_dataframe.
+
+    Parameters:
+        path (str): Path of the CSV file.
+
+    Returns:
+        pd.DataFrame or None: The metrics dataframe, None if the file can not be read.
+    """
+    try:
+        return pd.read_csv(path, index_col=[0, 1, 2, 3])
+    except Exception as e:
+        print(f"Could not read existing results from {path}. Error: {e}")
+        return None
+
+
+def merge_result_frames(existing: Optional[pd.DataFrame], new: pd.DataFrame) -> pd.DataFrame:
+    """
+    Merges newly computed results into previously saved ones.
+
+    Rows of the new dataframe replace rows of the existing dataframe with the same label, startDataRecord,
+    duration and metric. Existing rows which were not requested again are kept.
+
+    Parameters:
+        existing (pd.DataFrame): The previously saved results.
+        new (pd.DataFrame): The newly computed results.
+
+    Returns:
+        pd.DataFrame: The merged results.
+    """
+    if existing is None or existing.empty:
+        return new
+    if new.empty:
+        return existing
+    new_keys = {_row_key(*key) for key in new.index}
+    kept = existing[[_row_key(*key) not in new_keys for key in existing.index]]
+    if kept.empty:
+        return new
+    kept = kept.rename(columns={column: channel for channel in new.columns for column in kept.columns
+                                if str(column) == str(channel)})
+    return pd.concat([kept, new], axis=0)
+
+
+def preprocessing_settings_path(path: str) -> str:
+    """
+    Returns the path of the file which records the preprocessing settings of a metrics CSV file.
+    """
+    return f'{path}.preprocessing.json'
+
+
+def write_preprocessing_settings(path: str, settings: dict) -> None:
+    """
+    Records the preprocessing settings (filter, resampling, montage) of a metrics CSV file next to it.
+
+    Parameters:
+        path (str): Path of the CSV file.
+        settings (dict): JSON serialisable preprocessing settings.
+    """
+    try:
+        with open(preprocessing_settings_path(path), 'w') as stream:
+            json.dump(settings, stream, sort_keys=True, indent=2)
+    except OSError as e:
+        print(f"Could not record the preprocessing settings of {path}. Error: {e}")
+
+
+def check_preprocessing_settings(path: str, settings: dict) -> bool:
+    """
+    Checks that the results of a metrics CSV file were computed with the given preprocessing settings, so new
+    results can be merged into them.
+
+    Parameters:
+        path (str): Path of the CSV file.
+        settings (dict): JSON serialisable preprocessing settings of the new results.
+
+    Returns:
+        bool: False if the recorded settings differ, True if they match or were not recorded.
+    """
+    settings_path = preprocessing_settings_path(path)
+    if not os.path.exists(settings_path):
+        print(f"The preprocessing settings of {path} were not recorded, merging assumes they match the current ones.")
+        return True
+    try:
+        with open(settings_path) as stream:
+            recorded = json.load(stream)
+    except (OSError, ValueError) as e:
+        print(f"Could not read the preprocessing settings of {path}. Error: {e}")
+        return False
+    # Compared as they are recorded, e.g. tuples become lists
+    current = json.loads(json.dumps(settings))
+    differences = [f"{name}: {recorded.get(name)!r} (existing) != {current.get(name)!r} (current)"
+                   for name in sorted(set(recorded) | set(current)) if recorded.get(name) != current.get(name)]
+    if differences:
+        print(f"The existing results in {path} were preprocessed differently:\n  " + '\n  '.join(differences))
+        return False
+    return True
@@ -0,0 +1,216 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Cost model and scheduler for EEG analysis.
+
+This module provides the CostModel class, which learns the runtime of every metric as a function of the epoch length
+and persists it between runs, and functions to plan and order (metric x channel block x epoch range) tasks
+longest-first.
+"""
+
+import heapq
+import json
+import math
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_COST_MODEL_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'eeganalyzer', 'cost_model.json')
+
+# Predicted seconds per call for metrics that were never measured
+DEFAULT_CALL_COST = 1e-3
+
+# Smallest planned task in seconds, about the overhead of submitting a task and returning its results
+MIN_TASK_COST = 0.05
+
+
+class CostModel:
+    """
+    Learns the cost of one metric call (one channel of one epoch) as a power law of the epoch length in samples.
+
+    For every metric the mean runtime per call is kept for each observed epoch length. Predictions interpolate
+    these observations with a fit of t = a * n_samples ** b in log-log space, or scale linearly if only one epoch
+    length was observed so far.
+
+    Attributes:
+        path (str): JSON file the model is persisted to, None keeps it in memory only.
+        observations (dict): {metric identity: {n_samples: [n_calls, mean seconds per call]}}
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_COST_MODEL_PATH):
+        self.path = path
+        self.observations: Dict[str, Dict[int, List[float]]] = {}
+        # Measurements since the last load or save as {metric: {n_samples: [n_calls, total seconds]}}
+        self._pending: Dict[str, Dict[int, List[float]]] = {}
+        self.load()
+
+    def read(self) -> Dict[str, Dict[int, List[float]]]:
+        """
+        Reads the persisted observations, a missing or unreadable file gives no observations.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as stream:
+                raw_observations = json.load(stream)
+            return {metric: {int(n): list(value) for n, value in per_length.items()}
+                    for metric, per_length in raw_observations.items()}
+        except (OSError, ValueError) as e:
+            print(f"Could not load cost model from {self.path}, starting a new one. Error: {e}")
+            return {}
+
+    def load(self) -> None:
+        """
+        Loads the persisted observations and adds the measurements which were not saved yet.
+        """
+        self.observations = self.read()
+        for metric, per_length in self._pending.items():
+            for n_samples, (n_calls, seconds) in per_length.items():
+                self._add(self.observations, metric, n_samples, seconds, n_calls)
+
+    def save(self) -> None:
+        """
+        Merges the new measurements into the JSON file and replaces it atomically.
+
+        The file is read again right before it is replaced, so measurements which other processes saved in the
+        meantime are kept. Nothing is written if there are no new measurements.
+        """
+        if not self.path or not self._pending:
+            return
+        try:
+            self.load()
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as stream:
+                json.dump({metric: {str(n): value for n, value in per_length.items()}
+                           for metric, per_length in self.observations.items()}, stream)
+            os.replace(temp_path, self.path)
+            self._pending = {}
+        except OSError as e:
+            print(f"Could not save cost model to {self.path}. Error: {e}")
+
+    @staticmethod
+    def _add(observations: Dict[str, Dict[int, List[float]]], metric: str, n_samples: int, seconds: float,
+             n_calls: int) -> None:
+        # Updates the mean seconds per call with n_calls calls which took seconds in total
+        per_length = observations.setdefault(metric, {})
+        count, mean = per_length.get(int(n_samples), [0, 0.0])
+        new_count = count + n_calls
+        per_length[int(n_samples)] = [new_count, (count * mean + seconds) / new_count]
+
+    def record(self, metric: str, n_samples: int, seconds: float, n_calls: int = 1) -> None:
+        """
+        Adds a measurement of n_calls calls of a metric on epochs of n_samples samples.
+
+        Args:
+            metric (str): Identity of the metric, see metric_registry.metric_identity.
+            n_samples (int): Length of the epochs in samples.
+            seconds (float): Total runtime of all calls.
+            n_calls (int): Number of calls (channels x epochs) the runtime was measured for.
+        """
+        if n_calls <= 0:
+            return
+        self._add(self.observations, metric, n_samples, seconds, n_calls)
+        pending = self._pending.setdefault(metric, {}).setdefault(int(n_samples), [0, 0.0])
+        pending[0] += n_calls
+        pending[1] += seconds
+
+    def predict(self, metric: str, n_samples: int) -> float:
+        """
+        Predicts the runtime of one call of a metric on an epoch of n_samples samples.
+
+        Args:
+            metric (str): Identity of the metric.
+            n_samples (int): Length of the epoch in samples.
+
+        Returns:
+            float: Predicted seconds per call.
+        """
+        per_length = self.observations.get(metric)
+        if not per_length:
+            return DEFAULT_CALL_COST
+        if int(n_samples) in per_length:
+            return per_length[int(n_samples)][1]
+        lengths = np.array(sorted(per_length), dtype=float)
+        costs = np.array([max(per_length[int(n)][1], 1e-9) for n in lengths])
+        if len(lengths) == 1:
+            return float(costs[0] * n_samples / lengths[0])
+        exponent, intercept = np.polyfit(np.log(lengths), np.log(costs), 1)
+        return float(math.exp(intercept) * n_samples ** exponent)
+
+
+def plan_metric_tasks(call_costs: Sequence[float], n_epochs: int, n_channels: int, n_jobs: int,
+                      tasks_per_job: int = 4,
+                      min_task_cost: float = MIN_TASK_COST) -> List[Tuple[int, int, int, int, int, float]]:
+    """
+    Splits the computation into (metric x channel block x epoch range) tasks of similar predicted cost.
+
+    Every task should cost about total_cost / (n_jobs * tasks_per_job). Tasks keep all channels as long as possible,
+    so batch metrics and shared intermediates work on whole blocks in the workers as well: the epochs are split
+    first, expensive metrics into many small epoch ranges and cheap metrics into few large ones. Only if a single
+    epoch of all channels costs more than the target, the channels are split into blocks, down to single channels
+    for the most expensive metrics.
+
+    The target is at least min_task_cost, so negligible metrics are not split into tasks which cost less than their
+    overhead: a metric whose calls cost less than min_task_cost in total becomes a single task.
+
+    Args:
+        call_costs (list[float]): Predicted seconds per call for each metric function.
+        n_epochs (int): Number of epochs.
+        n_channels (int): Number of channels.
+        n_jobs (int): Number of worker processes.
+        tasks_per_job (int): Targeted number of tasks per worker.
+        min_task_cost (float): Smallest predicted seconds per task.
+
+    Returns:
+        list: Tasks as (function_index, epoch_start, epoch_stop, channel_start, channel_stop, predicted_seconds)
+              tuples.
+    """
+    total_cost = sum(call_costs) * n_epochs * n_channels
+    target_cost = max(total_cost / max(1, n_jobs * tasks_per_job), min_task_cost)
+    tasks = []
+    for function_idx, call_cost in enumerate(call_costs):
+        # Number of (epoch, channel) calls which fit into the target cost
+        calls_per_task = n_epochs * n_channels if call_cost <= 0 else max(1, int(target_cost // call_cost))
+        if calls_per_task >= n_channels:
+            channels_per_task, epochs_per_task = n_channels, min(n_epochs, calls_per_task // n_channels)
+        else:
+            channels_per_task, epochs_per_task = calls_per_task, 1
+        for channel_start in range(0, n_channels, channels_per_task):
+            channel_stop = min(channel_start + channels_per_task, n_channels)
+            for epoch_start in range(0, n_epochs, epochs_per_task):
+                epoch_stop = min(epoch_start + epochs_per_task, n_epochs)
+                tasks.append((function_idx, epoch_start, epoch_stop, channel_start, channel_stop,
+                              call_cost * (epoch_stop - epoch_start) * (channel_stop - channel_start)))
+    return tasks
+
+
+def longest_first(tasks: List[Tuple], n_jobs: int, cost_position: int = -1) -> Tuple[List[Tuple], float]:
+    """
+    Orders tasks longest-first (LPT scheduling) and predicts the resulting makespan.
+
+    Args:
+        tasks (list): Tasks whose predicted cost is stored at cost_position.
+        n_jobs (int): Number of worker processes.
+        cost_position (int): Index of the predicted cost within a task.
+
+    Returns:
+        tuple: (ordered tasks, predicted makespan in seconds)
+    """
+    ordered = sorted(tasks, key=lambda task: task[cost_position], reverse=True)
+    # Every task goes to the worker that becomes free first
+    worker_loads = [0.0] * max(1, n_jobs)
+    for task in ordered:
+        heapq.heapreplace(worker_loads, worker_loads[0] + task[cost_position])
+    return ordered, max(worker_loads)
@@ -0,0 +1,189 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Shared-memory signal buffer for EEG analysis.
+
+This module provides the SharedSignal class which places the preprocessed signal of a file once into a
+multiprocessing.shared_memory block. Worker processes attach to the block read-only by name and rebuild any strided
+view (e.g. an epoch tensor) on it, so no signal bytes have to be pickled into the workers.
+"""
+
+import weakref
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+try:
+    from numpy.lib.array_utils import byte_bounds
+except ImportError:  # numpy < 2.0
+    from numpy import byte_bounds
+
+
+def _release(shm: shared_memory.SharedMemory, unlink: bool) -> None:
+    try:
+        shm.close()
+    except BufferError:
+        # numpy views on the block are still alive, the mapping is released together with them
+        pass
+    if unlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedSignal:
+    """
+    A signal array of shape (n_channels, n_samples) in shared memory together with its channel names and sampling
+    frequency.
+
+    The creating process owns the block and unlinks it when the SharedSignal is closed or garbage collected.
+    Attached instances only close their own mapping.
+
+    Attributes:
+        array (np.ndarray): The signal, writable for the owner and read-only for attached instances.
+        channel_names (list): Names of the channels along the first axis.
+        sfreq (float): Sampling frequency of the signal.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype: Union[str, np.dtype],
+                 channel_names: Optional[List[Union[str, int]]], sfreq: Optional[float], owner: bool):
+        self._shm = shm
+        self.array: np.ndarray = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        if not owner:
+            self.array.flags.writeable = False
+        self.channel_names = channel_names
+        self.sfreq = sfreq
+        self.owner = owner
+        self._finalizer = weakref.finalize(self, _release, shm, owner)
+
+    @classmethod
+    def create(cls, data: np.ndarray, channel_names: Optional[List[Union[str, int]]] = None,
+               sfreq: Optional[float] = None) -> 'SharedSignal':
+        """
+        Copies an array into a new shared memory block.
+
+        Args:
+            data (np.ndarray): The signal, usually of shape (n_channels, n_samples).
+            channel_names (list, optional): Names of the channels along the first axis.
+            sfreq (float, optional): Sampling frequency of the signal.
+
+        Returns:
+            SharedSignal: The owning instance.
+        """
+        shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+        shared_signal = cls(shm, data.shape, data.dtype, channel_names, sfreq, owner=True)
+        shared_signal.array[...] = data
+        return shared_signal
+
+    @classmethod
+    def empty(cls, shape: Tuple[int, ...], dtype: Union[str, np.dtype] = np.float64,
+              channel_names: Optional[List[Union[str, int]]] = None, sfreq: Optional[float] = None) -> 'SharedSignal':
+        """
+        Creates a new, uninitialised shared memory block, so the signal can be written into it directly.
+
+        Args:
+            shape (tuple): Shape of the signal.
+            dtype (np.dtype): Data type of the signal.
+            channel_names (list, optional): Names of the channels along the first axis.
+            sfreq (float, optional): Sampling frequency of the signal.
+
+        Returns:
+            SharedSignal: The owning instance.
+        """
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        return cls(shm, shape, dtype, channel_names, sfreq, owner=True)
+
+    @classmethod
+    def attach(cls, descriptor: Dict[str, Any]) -> 'SharedSignal':
+        """
+        Attaches read-only to an existing shared memory block.
+
+        Args:
+            descriptor (dict): The descriptor of the owning instance.
+
+        Returns:
+            SharedSignal: The attached instance.
+        """
+        shm = shared_memory.SharedMemory(name=descriptor['name'])
+        return cls(shm, descriptor['shape'], descriptor['dtype'], descriptor['channel_names'], descriptor['sfreq'],
+                   owner=False)
+
+    @property
+    def descriptor(self) -> Dict[str, Any]:
+        """
+        A small picklable description which is sent to worker processes instead of the signal.
+        """
+        return {'name': self._shm.name, 'shape': self.array.shape, 'dtype': self.array.dtype.str,
+                'channel_names': self.channel_names, 'sfreq': self.sfreq}
+
+    def contains(self, view: np.ndarray) -> bool:
+        """
+        Checks if an array is a view whose memory lies within the shared block.
+
+        Args:
+            view (np.ndarray): The array to check.
+
+        Returns:
+            bool: True if view_layout can describe the array.
+        """
+        if view.dtype != self.array.dtype or view.size == 0:
+            return False
+        start = self.array.__array_interface__['data'][0]
+        view_start = view.__array_interface__['data'][0]
+        low, high = byte_bounds(view)
+        return start <= low and high <= start + self.array.nbytes and (view_start - start) % view.itemsize == 0
+
+    def view_layout(self, view: np.ndarray) -> Tuple[int, Tuple[int, ...], Tuple[int, ...]]:
+        """
+        Describes a view on the shared block by its offset, shape and strides.
+
+        Args:
+            view (np.ndarray): A view whose memory lies within the shared block, see contains.
+
+        Returns:
+            tuple: (offset in bytes, shape, strides), which can be passed to get_view.
+        """
+        offset = view.__array_interface__['data'][0] - self.array.__array_interface__['data'][0]
+        return offset, view.shape, view.strides
+
+    def get_view(self, offset: int, shape: Tuple[int, ...], strides: Tuple[int, ...]) -> np.ndarray:
+        """
+        Rebuilds a view described by view_layout, no data is copied.
+
+        Args:
+            offset (int): Offset of the view in bytes.
+            shape (tuple): Shape of the view.
+            strides (tuple): Strides of the view in bytes.
+
+        Returns:
+            np.ndarray: The read-only view.
+        """
+        flat = self.array.reshape(-1)
+        return np.lib.stride_tricks.as_strided(flat[offset // flat.itemsize:], shape=shape, strides=strides,
+                                               writeable=False)
+
+    def close(self) -> None:
+        """
+        Releases the shared memory, the owner also removes the block.
+        """
+        self.array = None
+        self._finalizer()
+
+    def __enter__(self) -> 'SharedSignal':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
@@ -0,0 +1,229 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Persistent cache of preprocessed signals for EEG analysis.
+
+This module provides the SignalCache class, which stores the filtered, resampled and re-referenced signal of a
+recording as a .npy file that is opened as memory map, together with its channel names and sampling frequency. The
+key is built from a fingerprint of the recording and all preprocessing parameters, so runs and invocations which
+preprocess a file in the same way share one entry. The cache has a size budget and evicts the least recently used
+signals.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import eeganalyzer
+
+# Bytes hashed at the beginning and the end of a recording for its fingerprint
+_FINGERPRINT_BYTES = 1 << 20
+
+
+def file_fingerprint(path: str) -> str:
+    """
+    Fingerprints a recording by its size and the bytes at its beginning and end.
+
+    The fingerprint does not depend on the path or the modification time, so copies and moved files keep their
+    cache entries, while a changed header (e.g. a different recording start) or a truncated file changes it.
+
+    Args:
+        path (str): Path of the recording.
+
+    Returns:
+        str: Hex digest.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(_FINGERPRINT_BYTES))
+        if size > _FINGERPRINT_BYTES:
+            f.seek(max(_FINGERPRINT_BYTES, size - _FINGERPRINT_BYTES))
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class SignalCache:
+    """
+    Persistent cache of preprocessed signals, stored as memory mappable .npy files in a folder.
+
+    An sqlite index in the folder holds the channel names, sampling frequency, size and last use of every entry.
+    The folder can be shared by several processes and experiments.
+
+    Attributes:
+        path (str): Folder of the cache.
+        max_bytes (int): Size budget of all signals in bytes, None for no limit.
+    """
+
+    def __init__(self, path: str, max_size: Optional[float] = None):
+        """
+        Args:
+            path (str): Folder of the cache, created if it does not exist.
+            max_size (float, optional): Size budget in GB, the least recently used signals are evicted when it is
+                                        exceeded. None keeps all signals.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_bytes = int(max_size * 1e9) if max_size else None
+        self._connection = sqlite3.connect(os.path.join(path, 'signal_cache.sqlite'), timeout=60)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS signals (key TEXT PRIMARY KEY, channel_names TEXT NOT '
+                                 'NULL, sfreq REAL NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)')
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(datapath: str, l_freq: Optional[float], h_freq: Optional[float], sfreq: Optional[float],
+                 montage: Optional[str], bads: Iterable[str], dtype: str, method: str) -> str:
+        """
+        Creates the key of a preprocessed signal.
+
+        Args:
+            datapath (str): Path of the recording, only its fingerprint enters the key.
+            l_freq (float): Lower cutoff frequency of the filter.
+            h_freq (float): Upper cutoff frequency of the filter.
+            sfreq (float): Frequency the signal is resampled to.
+            montage (str): The montage.
+            bads (list): Channels which are excluded.
+            dtype (str): Data type of the signal.
+            method (str): Identifies the implementation of the preprocessing (e.g. how the signal is resampled).
+
+        Returns:
+            str: Hex digest.
+        """
+        parameters = {
+            'file': file_fingerprint(datapath),
+            'l_freq': l_freq, 'h_freq': h_freq, 'sfreq': sfreq, 'montage': montage,
+            'bads': sorted(bads), 'dtype': str(np.dtype(dtype)), 'method': method,
+            'version': eeganalyzer.__version__,
+        }
+        return hashlib.blake2b(json.dumps(parameters, sort_keys=True).encode(), digest_size=20).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f'{key}.npy')
+
+    def get(self, key: str) -> Optional[Tuple[List[str], np.ndarray, float]]:
+        """
+        Opens a cached signal.
+
+        Args:
+            key (str): The key, see make_key.
+
+        Returns:
+            tuple or None: (channel names, read-only memory map of shape (n_channels, n_samples), sampling frequency),
+                           None if the signal is not cached.
+        """
+        row = self._connection.execute('SELECT channel_names, sfreq FROM signals WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            data = np.load(self._file(key), mmap_mode='r')
+        except (OSError, ValueError):
+            # e.g. removed by hand, the entry is dropped
+            self._remove(key)
+            return None
+        with self._connection:
+            self._connection.execute('UPDATE signals SET last_used = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0]), data, row[1]
+
+    def store_chunks(self, key: str, channel_names: List[str], sfreq: float, shape: Tuple[int, int],
+                     dtype: str, chunks: Iterable[Tuple[int, np.ndarray]]) -> bool:
+        """
+        Stores a signal which is written chunk by chunk, so it never has to be in memory as a whole.
+
+        Args:
+            key (str): The key, see make_key.
+            channel_names (list): Names of the channels.
+            sfreq (float): Sampling frequency of the signal.
+            shape (tuple): (n_channels, n_samples) of the signal.
+            dtype (str): Data type of the signal.
+            chunks (iterable): (first sample, array of shape (n_channels, n_chunk_samples)) pairs covering the signal.
+
+        Returns:
+            bool: True if the signal was stored.
+        """
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if self.max_bytes is not None and size > self.max_bytes:
+            print(f'The preprocessed signal ({size / 1e9:.2f} GB) exceeds the size of the signal cache, it is not '
+                  f'cached.')
+            return False
+        # Written to a temporary file first, so other processes never open a partial signal
+        temporary_file = os.path.join(self.path, f'{key}.{os.getpid()}.tmp.npy')
+        try:
+            try:
+                data = np.lib.format.open_memmap(temporary_file, mode='w+', dtype=dtype, shape=tuple(shape))
+                for start, chunk in chunks:
+                    data[:, start:start + chunk.shape[1]] = chunk
+                data.flush()
+                data = None
+                os.replace(temporary_file, self._file(key))
+            finally:
+                # Also if reading the chunks fails, no partial file is left behind
+                data = None
+                if os.path.exists(temporary_file):
+                    os.remove(temporary_file)
+            with self._connection:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO signals (key, channel_names, sfreq, size, last_used) VALUES (?, ?, ?, ?, ?)',
+                    (key, json.dumps(list(channel_names)), float(sfreq), size, time.time()),
+                )
+        except (OSError, sqlite3.Error) as e:
+            print(f"Could not store the signal in the signal cache {self.path}. Error: {e}")
+            return False
+        self.evict(keep=key)
+        return True
+
+    def put(self, key: str, channel_names: List[str], sfreq: float, data: np.ndarray) -> bool:
+        """
+        Stores a signal of shape (n_channels, n_samples) which is in memory.
+
+        Returns:
+            bool: True if the signal was stored.
+        """
+        return self.store_chunks(key, channel_names, sfreq, data.shape, data.dtype, [(0, data)])
+
+    def _remove(self, key: str) -> None:
+        with self._connection:
+            self._connection.execute('DELETE FROM signals WHERE key = ?', (key,))
+        if os.path.exists(self._file(key)):
+            # Processes which still map the file keep their data until they close it
+            os.remove(self._file(key))
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """
+        Removes the least recently used signals until the cache fits its size budget.
+
+        Args:
+            keep (str, optional): Key which is never evicted, e.g. the signal which was just stored.
+        """
+        if self.max_bytes is None:
+            return
+        rows = self._connection.execute('SELECT key, size FROM signals ORDER BY last_used').fetchall()
+        total = sum(size for _, size in rows)
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self._remove(key)
+            total -= size
+
+    def close(self) -> None:
+        """
+        Closes the database connection.
+        """
+        self._connection.close()
@@ -0,0 +1,126 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Overlap-aware computation of decomposable metrics for EEG analysis.
+
+For overlapping epochs, this module computes metrics with a SlidingSpec (see eeganalyzer.metrics.sliding) from
+summaries of non-overlapping blocks of g = gcd(epoch length, hop) samples. Every sample is processed once, no matter
+how large the overlap is. It also provides epoch_view, which takes the epochs of a signal as such a sliding window
+view.
+"""
+
+import math
+from typing import Any, Dict, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided, sliding_window_view
+
+from eeganalyzer.metrics.sliding import SlidingSpec
+
+
+def epoch_view(signal: np.ndarray, onset_samples: np.ndarray, n_samples: int) -> np.ndarray:
+    """
+    Takes the epochs of a channel-major signal as a read-only tensor of shape (n_epochs, n_channels, n_samples).
+
+    No samples are copied as long as the onsets are evenly spaced. Every epoch of a channel (tensor[e, c]) is a
+    contiguous 1-D array if the signal is C-contiguous.
+
+    Args:
+        signal (np.ndarray): Array of shape (n_channels, n_signal_samples).
+        onset_samples (np.ndarray): Onsets of the epochs in samples, every epoch has to lie within the signal.
+        n_samples (int): Length of the epochs in samples.
+
+    Returns:
+        np.ndarray: The epoch tensor.
+    """
+    onset_samples = np.asarray(onset_samples, dtype=int)
+    if len(onset_samples) == 0 or n_samples <= 0:
+        return np.empty((0, signal.shape[0], max(n_samples, 0)), dtype=signal.dtype)
+    # shape (n_channels, n_windows, n_samples), every window start is a possible epoch onset
+    windows = sliding_window_view(signal, n_samples, axis=1)
+    hops = np.diff(onset_samples)
+    if len(hops) == 0 or np.all(hops == hops[0]):
+        # Evenly spaced onsets can be taken by basic slicing, which keeps the tensor a view
+        hop = int(hops[0]) if len(hops) else 1
+        epochs = windows[:, onset_samples[0]:onset_samples[-1] + 1:hop, :]
+    else:
+        # Irregular onsets (non-integer sampling frequency) need fancy indexing which copies the epochs
+        epochs = windows[:, onset_samples, :]
+    return epochs.transpose(1, 0, 2)
+
+
+def epoch_hop(epoch_tensor: np.ndarray) -> Optional[int]:
+    """
+    Returns the hop in samples between the epochs of an epoch tensor, if the epochs overlap in memory.
+
+    This is the case for the sliding window views of Array_processor.create_epoch_tensor with overlap > 0.
+
+    Args:
+        epoch_tensor (np.ndarray): Tensor of shape (n_epochs, n_channels, n_samples).
+
+    Returns:
+        int or None: The hop, None if the epochs do not share samples.
+    """
+    n_epochs, _, n_samples = epoch_tensor.shape
+    itemsize = epoch_tensor.itemsize
+    epoch_stride, _, sample_stride = epoch_tensor.strides
+    if n_epochs < 2 or sample_stride != itemsize or epoch_stride % itemsize != 0:
+        return None
+    hop = epoch_stride // itemsize
+    if hop <= 0 or hop >= n_samples:
+        return None
+    return hop
+
+
+def calc_sliding_metric(epoch_tensor: np.ndarray, spec: SlidingSpec,
+                        kwargs: Optional[Dict[str, Any]] = None) -> Optional[np.ndarray]:
+    """
+    Computes a decomposable metric for all epochs of an overlapping epoch tensor from block summaries.
+
+    Args:
+        epoch_tensor (np.ndarray): Tensor of shape (n_epochs, n_channels, n_samples).
+        spec (SlidingSpec): The decomposition of the metric.
+        kwargs (dict, optional): Additional arguments of the metric.
+
+    Returns:
+        np.ndarray or None: Results of shape (n_epochs, n_channels), None if the epochs do not overlap or the
+                            decomposition does not support the block size. The metric then has to be computed
+                            directly.
+    """
+    kwargs = kwargs or {}
+    hop = epoch_hop(epoch_tensor)
+    if hop is None:
+        return None
+    n_epochs, n_channels, n_samples = epoch_tensor.shape
+    block_size = math.gcd(hop, n_samples)
+    if spec.supports is not None and not spec.supports(block_size, n_samples, **kwargs):
+        return None
+
+    # The samples covered by all epochs, as (n_channels, n_signal_samples) view on the same memory
+    n_signal_samples = (n_epochs - 1) * hop + n_samples
+    signal = as_strided(epoch_tensor, shape=(n_channels, n_signal_samples),
+                        strides=(epoch_tensor.strides[1], epoch_tensor.itemsize), writeable=False)
+    blocks = signal.reshape(n_channels, n_signal_samples // block_size, block_size)
+    blocks_per_epoch = n_samples // block_size
+    step = hop // block_size
+
+    # (n_channels, n_blocks, k) -> (n_channels, n_epochs, blocks_per_epoch, k), views on the block summaries
+    block_stats = spec.block(blocks, **kwargs)
+    epoch_block_stats = sliding_window_view(block_stats, blocks_per_epoch, axis=1)[:, ::step].swapaxes(-1, -2)
+    epoch_seam_stats = None
+    if spec.seam is not None:
+        seam_stats = spec.seam(blocks[:, :-1], blocks[:, 1:], **kwargs)
+        epoch_seam_stats = sliding_window_view(seam_stats, blocks_per_epoch - 1, axis=1)[:, ::step].swapaxes(-1, -2)
+
+    results = spec.finalize(epoch_block_stats, epoch_seam_stats, block_size, **kwargs)
+    return np.asarray(results).T
@@ -0,0 +1,223 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Out-of-core streaming reader for EEG analysis.
+
+This module provides the StreamReader class, which reads a recording that is not preloaded in chunks of bounded
+size, filters, resamples and re-references every chunk and yields the epochs of the preprocessed signal block by
+block. Every chunk is read with enough context on both sides for the filters to settle and for the resampling, so the
+chunks join without edge effects and the peak memory depends on the chunk size and not on the length of the recording.
+"""
+
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+import mne
+import numpy as np
+from scipy.signal import fftconvolve, sosfiltfilt
+
+from eeganalyzer.core.montage import Montage, compile_montage
+from eeganalyzer.core.resampling import ResampleFilterStage
+from eeganalyzer.core.sliding_window import epoch_view
+
+
+def _filtfilt_part(sos: Optional[np.ndarray], context: int, n_total: int, source: Callable[[int, int], np.ndarray],
+                   start: int, stop: int) -> np.ndarray:
+    """
+    Returns the samples start to stop of a signal filtered as a whole with sosfiltfilt. The samples are taken from
+    source with context samples on both sides, in which the filter settles. At the ends of the signal, sosfiltfilt
+    pads the part as it pads the whole signal.
+    """
+    if sos is None:
+        return source(start, stop)
+    read_start, read_stop = max(0, start - context), min(n_total, stop + context)
+    y = sosfiltfilt(sos, source(read_start, read_stop), axis=1)
+    return y[:, start - read_start:stop - read_start]
+
+
+def _reflect_limited_pad(x: np.ndarray, left: int, right: int) -> np.ndarray:
+    """
+    Pads the samples of every channel by odd reflection at the first and last sample, as MNE pads before filtering
+    ('reflect_limited'). Padding longer than the signal continues with zeros.
+    """
+    n_samples = x.shape[1]
+    left_reflection = 2 * x[:, :1] - x[:, min(left, n_samples - 1):0:-1]
+    right_reflection = 2 * x[:, -1:] - x[:, -2:max(-right - 2, -n_samples - 1):-1]
+    return np.concatenate([
+        np.zeros((x.shape[0], left - left_reflection.shape[1]), dtype=x.dtype), left_reflection, x,
+        right_reflection, np.zeros((x.shape[0], right - right_reflection.shape[1]), dtype=x.dtype),
+    ], axis=1)
+
+
+class StreamReader:
+    """
+    Reads, filters, resamples and re-references a recording in chunks.
+
+    Filtering and resampling is the ResampleFilterStage of the EEG_processor (see eeganalyzer.core.resampling), the
+    zero-phase filters are applied with the context in which they settle (Butterworth) or which their length spans
+    (FIR, padded at the ends of the recording as MNE pads), the resampling is always polyphase, and the montage is
+    applied as a compiled derivation matrix (see eeganalyzer.core.montage). All samples are in µV, like the signal of
+    the EEG_processor.
+
+    Attributes:
+        raw (mne.io.BaseRaw): The recording, usually not preloaded.
+        picks (list): Names of the channels which are read from the recording.
+        raw_sfreq (float): Sampling frequency of the recording.
+        sfreq (float): Sampling frequency of the preprocessed signal.
+        stage (ResampleFilterStage): Filters and resampling.
+        montage (CompiledMontage): The montage, compiled for the picked channels.
+        channel_names (list): Names of the channels of the preprocessed signal.
+        n_samples (int): Number of samples of the preprocessed signal.
+        chunk_samples (int): Number of samples of the preprocessed signal per chunk.
+        dtype (np.dtype): Data type of the preprocessed signal.
+    """
+
+    def __init__(self, raw: mne.io.BaseRaw, picks: Optional[List[str]] = None, l_freq: Optional[float] = None,
+                 h_freq: Optional[float] = None, resamp_freq: Optional[float] = None, montage: Montage = None,
+                 chunk_duration: float = 600, dtype: Union[str, np.dtype, None] = None,
+                 filter_order: Optional[int] = None, filter_design: Optional[str] = None):
+        """
+        Args:
+            raw (mne.io.BaseRaw): The recording.
+            picks (list, optional): Names of the channels to read, defaults to all channels.
+            l_freq (float, optional): Lower cutoff frequency of the filter, None for no high-pass.
+            h_freq (float, optional): Upper cutoff frequency of the filter, None for no low-pass.
+            resamp_freq (float, optional): Frequency the signal is downsampled to, ignored if it is not lower than
+                                           the sampling frequency of the recording.
+            montage (str or dict, optional): Montage, see eeganalyzer.core.montage.compile_montage.
+            chunk_duration (float): Duration of the chunks in seconds of the preprocessed signal.
+            dtype (str or np.dtype, optional): Data type of the preprocessed signal, defaults to float64.
+            filter_order (int, optional): Order of the Butterworth filters, see ResampleFilterStage.
+            filter_design (str, optional): Design of the filters, see ResampleFilterStage.
+        """
+        self.raw = raw
+        self.picks = list(picks) if picks is not None else list(raw.ch_names)
+        self.raw_sfreq = raw.info['sfreq']
+        self.n_raw_samples = raw.n_times
+        self.dtype = np.dtype(np.float64 if dtype is None else dtype)
+
+        if resamp_freq and resamp_freq >= self.raw_sfreq:
+            print(f"Resampling frequency {resamp_freq} must be lower than the current sampling frequency "
+                  f"{self.raw_sfreq}.")
+        self.stage = ResampleFilterStage(self.raw_sfreq, l_freq, h_freq, resamp_freq, filter_order, filter_design)
+        self.up, self.down = self.stage.up, self.stage.down
+        self.sfreq = self.stage.sfreq
+        self.n_samples = self.stage.output_length(self.n_raw_samples)
+
+        self.montage = compile_montage(self.picks, montage)
+        self.channel_names = list(self.montage.channel_names)
+        self.chunk_samples = max(1, int(chunk_duration * self.sfreq))
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """
+        Reads samples of the picked channels of the recording in µV.
+        """
+        return self.raw.get_data(picks=self.picks, start=start, stop=stop, units='uV')
+
+    def filtered(self, start: int, stop: int) -> np.ndarray:
+        """
+        Returns the samples start to stop of the recording filtered by the prefilter of the stage, at its sampling
+        frequency.
+        """
+        fir = self.stage.pre_fir
+        if fir is not None:
+            half = self.stage.pre_context
+            read_start, read_stop = max(0, start - half), min(self.n_raw_samples, stop + half)
+            x = self.read(read_start, read_stop)
+            # Context beyond the ends of the recording is padded as MNE pads the whole recording
+            left, right = half - (start - read_start), half - (read_stop - stop)
+            if left or right:
+                x = _reflect_limited_pad(x, left, right)
+            return fftconvolve(x, fir[np.newaxis, :], mode='valid', axes=1)
+        return _filtfilt_part(self.stage.pre_sos, self.stage.pre_context, self.n_raw_samples, self.read, start, stop)
+
+    def resampled(self, start: int, stop: int) -> np.ndarray:
+        """
+        Returns the prefiltered and resampled samples start to stop, at the sampling frequency of the stream.
+        """
+        if self.up == self.down:
+            return self.filtered(start, stop)
+        # Segments start at a multiple of down, so their output samples fall on the output samples of the whole
+        # recording
+        context = self.stage.resample_context
+        segment_start = max(0, (start * self.down // self.up - context) // self.down * self.down)
+        segment_stop = min(self.n_raw_samples, -(-stop * self.down // self.up) + context)
+        y = self.stage.resample_polyphase(self.filtered(segment_start, segment_stop))
+        offset = segment_start * self.up // self.down
+        return y[:, start - offset:stop - offset]
+
+    def preprocessed(self, start: int, stop: int) -> np.ndarray:
+        """
+        Returns the samples start to stop filtered and resampled by the whole stage, at the sampling frequency of the
+        stream.
+        """
+        return _filtfilt_part(self.stage.post_sos, self.stage.post_context, self.n_samples, self.resampled, start,
+                              stop)
+
+    def chunk(self, start: int, stop: int) -> np.ndarray:
+        """
+        Returns the preprocessed samples start to stop of all montage channels.
+
+        Args:
+            start (int): First sample, at the sampling frequency of the stream.
+            stop (int): Sample after the last sample.
+
+        Returns:
+            np.ndarray: C-contiguous array of shape (n_channels, stop - start).
+        """
+        return self.montage.apply(self.preprocessed(start, stop)).astype(self.dtype, copy=False)
+
+    def chunks(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Yields the preprocessed signal from start to stop in chunks of chunk_samples samples.
+
+        Yields:
+            tuple: (first sample of the chunk, chunk of shape (n_channels, n_chunk_samples)).
+        """
+        stop = self.n_samples if stop is None else min(stop, self.n_samples)
+        for chunk_start in range(max(0, start), stop, self.chunk_samples):
+            yield chunk_start, self.chunk(chunk_start, min(chunk_start + self.chunk_samples, stop))
+
+    def epochs(self, onset_samples: np.ndarray, n_samples: int) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Yields the epochs of the preprocessed signal block by block, as soon as the chunks covering them are read.
+
+        Only the samples from the first onset to the end of the last epoch are read. The yielded tensors are views
+        on an internal buffer, which is reused after the next block is requested.
+
+        Args:
+            onset_samples (np.ndarray): Sorted onsets of the epochs in samples, every epoch has to end within the
+                                        signal.
+            n_samples (int): Length of the epochs in samples.
+
+        Yields:
+            tuple: (index of the first epoch of the block, tensor of shape (n_block_epochs, n_channels, n_samples)).
+        """
+        onset_samples = np.asarray(onset_samples, dtype=int)
+        if len(onset_samples) == 0:
+            return
+        epoch_stops = onset_samples + n_samples
+        buffer = None
+        buffer_start = int(onset_samples[0])
+        next_epoch = 0
+        for _, chunk in self.chunks(int(onset_samples[0]), int(epoch_stops[-1])):
+            buffer = chunk if buffer is None else np.concatenate([buffer, chunk], axis=1)
+            buffer_stop = buffer_start + buffer.shape[1]
+            n_ready = int(np.searchsorted(epoch_stops, buffer_stop, side='right'))
+            if n_ready > next_epoch:
+                yield next_epoch, epoch_view(buffer, onset_samples[next_epoch:n_ready] - buffer_start, n_samples)
+                next_epoch = n_ready
+            # Only the samples of epochs which are not complete yet are kept
+            keep_from = onset_samples[next_epoch] if next_epoch < len(onset_samples) else buffer_stop
+            keep_from = min(int(keep_from), buffer_stop) - buffer_start
+            buffer = buffer[:, keep_from:]
+            buffer_start += keep_from
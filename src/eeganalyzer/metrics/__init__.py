@@ -0,0 +1,11 @@
+"""
+Built-in metrics for EEG analysis.
+
+This package contains the batch, decomposable and shared intermediate metric protocols and metric functions that can be used in any
+select_metrics set.
+"""
+
+from eeganalyzer.metrics.batch import BatchSpec, batch_metric, get_batch_spec
+from eeganalyzer.metrics.calling import call_convention, get_call_convention
+from eeganalyzer.metrics.intermediates import Intermediate, get_intermediates, intermediate, uses_intermediates
+from eeganalyzer.metrics.sliding import SlidingSpec, get_sliding_spec, sliding_metric
@@ -0,0 +1,106 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Batch metric protocol for EEG analysis.
+
+A metric function used in a select_metrics set normally receives one 1-D channel of one epoch and returns a scalar.
+Decorating it with batch_metric declares that it accepts arrays of shape (channels, samples) or
+(epochs, channels, samples) and returns one value per time series, i.e. an array of shape (channels,) or
+(epochs, channels). The Array_processor then calls it once for a whole block of epochs instead of once per channel
+and epoch. Decorated functions still accept 1-D input, so they also work in the per-channel code path.
+"""
+
+import functools
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+
+BATCH_ATTRIBUTE = '__eeganalyzer_batch__'
+
+
+@dataclass(frozen=True)
+class BatchSpec:
+    """
+    Describes how a batch metric can be called.
+
+    Attributes:
+        ndim (int): The highest number of dimensions the function accepts, 2 for (channels, samples) or
+            3 for (epochs, channels, samples).
+        needs_sfreq (bool): If True, the sampling frequency is passed as the keyword argument sfreq.
+        single_precision (bool): If True, the function computes directly on float32 input. Otherwise a float32
+            signal is converted to float64 block by block before it is passed to the function.
+    """
+    ndim: int = 3
+    needs_sfreq: bool = False
+    single_precision: bool = False
+
+
+def batch_metric(func: Optional[Callable] = None, *, ndim: int = 3, needs_sfreq: bool = False,
+                 single_precision: bool = False) -> Callable:
+    """
+    Declares a metric function as a batch metric.
+
+    The decorated function has to reduce the last axis (samples) of its input, for an input of shape
+    (..., samples) it returns an array of shape (...). Can be used with or without arguments:
+
+        @batch_metric
+        def variance(x): ...
+
+        @batch_metric(ndim=2, needs_sfreq=True)
+        def band_power(x, sfreq, band=(8, 12)): ...
+
+    Args:
+        func (callable): The metric function.
+        ndim (int): Highest dimensionality the function accepts, 2 or 3. Inputs with more dimensions are split
+            along the leading axis.
+        needs_sfreq (bool): If True, the Array_processor passes its sampling frequency as keyword argument sfreq.
+        single_precision (bool): If True, the function gets float32 signals (see the dtype of the Array_processor)
+            without conversion. Only set it for functions which are accurate in single precision.
+
+    Returns:
+        callable: The wrapped function, which also accepts 1-D time series and then returns a scalar.
+    """
+    if ndim not in (2, 3):
+        raise ValueError("ndim of a batch metric must be 2 or 3.")
+
+    def decorator(metric_func: Callable) -> Callable:
+        @functools.wraps(metric_func)
+        def wrapper(data, *args, **kwargs):
+            data = np.asarray(data)
+            if data.ndim == 1:
+                return metric_func(data[np.newaxis, :], *args, **kwargs)[0]
+            if data.ndim > ndim:
+                return np.stack([wrapper(block, *args, **kwargs) for block in data])
+            return metric_func(data, *args, **kwargs)
+
+        setattr(wrapper, BATCH_ATTRIBUTE, BatchSpec(ndim=ndim, needs_sfreq=needs_sfreq,
+                                                       single_precision=single_precision))
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def get_batch_spec(func: Callable) -> Optional[BatchSpec]:
+    """
+    Returns the BatchSpec of a metric function, or None if it only supports 1-D time series.
+
+    Args:
+        func (callable): The metric function.
+
+    Returns:
+        BatchSpec or None
+    """
+    return getattr(func, BATCH_ATTRIBUTE, None)
@@ -0,0 +1,65 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Calling conventions of metric functions for EEG analysis.
+
+A metric function gets the time series as first argument and the entries of its kwargs dictionary either as
+keyword arguments ('keyword') or, in the order of the dictionary, as positional arguments ('positional'). The
+convention is determined once per metric set from the signature of the function. Functions without an inspectable
+signature (e.g. functions of a MATLAB engine) can declare it explicitly:
+
+    metrics_functions = [call_convention(ml_engine.chaos_modified, 'positional')]
+"""
+
+import functools
+from typing import Callable, Optional
+
+CALL_ATTRIBUTE = '__eeganalyzer_call__'
+KEYWORD = 'keyword'
+POSITIONAL = 'positional'
+
+
+def call_convention(func: Callable, convention: str) -> Callable:
+    """
+    Declares how a metric function receives its kwargs.
+
+    Args:
+        func (callable): The metric function.
+        convention (str): 'keyword' or 'positional'.
+
+    Returns:
+        callable: A thin wrapper which carries the convention. The function itself is not modified, so the same
+                  (e.g. third-party) function can be declared differently in several metric sets.
+    """
+    if convention not in (KEYWORD, POSITIONAL):
+        raise ValueError(f"convention must be '{KEYWORD}' or '{POSITIONAL}', not {convention}.")
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+
+    setattr(wrapper, CALL_ATTRIBUTE, convention)
+    return wrapper
+
+
+def get_call_convention(func: Callable) -> Optional[str]:
+    """
+    Returns the declared calling convention of a metric function, None if it has to be inspected.
+
+    Args:
+        func (callable): The metric function.
+
+    Returns:
+        str or None
+    """
+    return getattr(func, CALL_ATTRIBUTE, None)
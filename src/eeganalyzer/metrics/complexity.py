@@ -0,0 +1,360 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Complexity metrics for EEG analysis.
+
+This module provides batched implementations of the Lempel-Ziv complexity (LZ76) and of the largest Lyapunov
+exponent after Rosenstein et al. (1993) of neurokit2 (nk.complexity_lempelziv without permutation and
+nk.complexity_lyapunov).
+
+- For the Lempel-Ziv complexity, all time series of a block are binarised at once and stored bit-packed. The phrase
+  parsing of all series runs in lockstep: in every step, each series finds the longest earlier match of its current
+  phrase by comparing 64 bits at a time against all earlier positions.
+- For the Lyapunov exponent, the nearest neighbours of the delay embedding are found with a KD-tree instead of the
+  full distance matrix, and the divergence curves of all series of a block are computed and fitted together.
+"""
+
+from typing import Optional, Union
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from eeganalyzer.metrics.batch import batch_metric
+from eeganalyzer.metrics.entropy import embed
+from eeganalyzer.metrics.intermediates import uses_intermediates
+
+# Maximum number of 64 bit words compared in one step of the phrase parsing
+LEMPEL_ZIV_BLOCK_ELEMENTS = 2 ** 20
+
+
+def binarize(data: np.ndarray, symbolize: str = 'mean') -> np.ndarray:
+    """
+    Binarises each time series at its mean or median, as nk.complexity_symbolize.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        symbolize (str): Threshold, 'mean' (or 'A') or 'median'.
+
+    Returns:
+        np.ndarray: Boolean array of the same shape, True above the threshold.
+    """
+    method = symbolize.lower()
+    if method in ('a', 'mean'):
+        return data > np.nanmean(data, axis=-1, keepdims=True)
+    if method == 'median':
+        return data > np.nanmedian(data, axis=-1, keepdims=True)
+    raise ValueError(f"symbolize must be 'mean' or 'median', not {symbolize}.")
+
+
+def bit_windows(bits: np.ndarray) -> np.ndarray:
+    """
+    The 64 bits starting at every position of bit-packed binary sequences.
+
+    Args:
+        bits (np.ndarray): Boolean array of shape (n_series, samples).
+
+    Returns:
+        np.ndarray: uint64 array of shape (n_series, samples). Element p holds the bits p ... p + 63 of its
+                    sequence with the first bit as most significant bit, bits behind the end are zero.
+    """
+    n_series, n_samples = bits.shape
+    n_bytes = -(-n_samples // 8)
+    # one zero word behind the end, so every window can read 9 bytes
+    packed = np.zeros((n_series, n_bytes + 9), dtype=np.uint8)
+    packed[:, :n_bytes] = np.packbits(bits, axis=-1)
+    # big endian words at every byte offset, read from the packed bytes without copying
+    byte_words = np.ndarray((n_series, n_bytes), dtype='>u8', buffer=packed,
+                            strides=(packed.strides[0], 1)).astype(np.uint64)
+    next_bytes = packed[:, 8:n_bytes + 8].astype(np.uint64)
+
+    windows = np.empty((n_series, n_bytes * 8), dtype=np.uint64)
+    windows[:, 0::8] = byte_words
+    for shift in range(1, 8):
+        windows[:, shift::8] = (byte_words << np.uint64(shift)) | (next_bytes >> np.uint64(8 - shift))
+    return windows[:, :n_samples]
+
+
+def _leading_equal_bits(xor: np.ndarray) -> np.ndarray:
+    """
+    Number of leading zero bits of uint64 values, 64 for zero.
+    """
+    # frexp of the 32 bit halves is exact and gives the position of their highest set bit
+    _, high_bits = np.frexp((xor >> np.uint64(32)).astype(np.float64))
+    _, low_bits = np.frexp((xor & np.uint64(0xFFFFFFFF)).astype(np.float64))
+    return 64 - np.where(high_bits > 0, high_bits + 32, low_bits)
+
+
+def _longest_previous_match(windows: np.ndarray, rows: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """
+    For some series, the length of the longest match of the sequence starting at their position with a sequence
+    starting at any earlier position. Matches may overlap the position and are limited by the end of the sequence.
+
+    The number of leading equal bits of two windows decreases with their XOR, so the longest match of each series
+    is found with the minimum XOR over all earlier windows. Only windows which match completely are compared
+    further, word by word.
+
+    Args:
+        windows (np.ndarray): Bit windows of shape (n_series, samples), see bit_windows.
+        rows (np.ndarray): Indices of the series.
+        positions (np.ndarray): Position of each of these series, >= 1.
+
+    Returns:
+        np.ndarray: The match length of each of these series.
+    """
+    n_samples = windows.shape[-1]
+    width = int(positions.max())
+    xor = windows[rows, :width] ^ windows[rows, positions][:, None]
+    np.putmask(xor, np.arange(width) >= positions[:, None], np.uint64(2 ** 64 - 1))
+    lengths = _leading_equal_bits(xor.min(axis=-1))
+
+    # Extend the matches which cover whole words, until they end or reach the end of the sequence
+    series, starts = np.nonzero(xor == 0)
+    offset = 64
+    while series.size:
+        extend = positions[series] + offset < n_samples
+        series, starts = series[extend], starts[extend]
+        xor = windows[rows[series], starts + offset] ^ windows[rows[series], positions[series] + offset]
+        smallest = np.full(len(rows), np.uint64(2 ** 64 - 1))
+        np.minimum.at(smallest, series, xor)
+        extended = np.unique(series)
+        lengths[extended] += _leading_equal_bits(smallest[extended])
+        series, starts = series[xor == 0], starts[xor == 0]
+        offset += 64
+    return np.minimum(lengths, n_samples - positions)
+
+
+def lempel_ziv_count(bits: np.ndarray) -> np.ndarray:
+    """
+    Number of phrases of the Lempel-Ziv (1976) parsing of binary sequences, as counted by neurokit2.
+
+    Starting with a first phrase of one symbol, every phrase is the shortest continuation that has not occurred
+    before, i.e. the longest earlier match plus one symbol. All sequences are parsed in lockstep.
+
+    Args:
+        bits (np.ndarray): Boolean array of shape (n_series, samples), samples >= 2.
+
+    Returns:
+        np.ndarray: The number of phrases of each sequence.
+    """
+    n_series, n_samples = bits.shape
+    counts = np.ones(n_series, dtype=np.int64)
+    group_size = max(1, LEMPEL_ZIV_BLOCK_ELEMENTS // n_samples)
+    for start in range(0, n_series, group_size):
+        windows = bit_windows(bits[start:start + group_size])
+        group_counts = counts[start:start + group_size]
+        positions = np.ones(windows.shape[0], dtype=np.int64)
+        active = np.arange(windows.shape[0])
+        while active.size:
+            match_lengths = _longest_previous_match(windows, active, positions[active])
+            group_counts[active] += 1
+            # A phrase which reaches the end of the sequence is the last one
+            positions[active] += match_lengths + 1
+            active = active[positions[active] < n_samples]
+    return counts
+
+
+@batch_metric(single_precision=True)
+def lempel_ziv(data: np.ndarray, symbolize: str = 'mean') -> np.ndarray:
+    """
+    Normalised Lempel-Ziv complexity of each binarised time series, c * log2(n) / n with the number of phrases c.
+
+    The permutation variant of nk.complexity_lempelziv, which parses ordinal patterns instead of bits, is not
+    supported.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        symbolize (str): Binarisation threshold, 'mean' (default, as neurokit2) or 'median'.
+
+    Returns:
+        np.ndarray: The Lempel-Ziv complexity of each time series.
+    """
+    bits = binarize(data, symbolize)
+    n_samples = bits.shape[-1]
+    counts = lempel_ziv_count(bits.reshape(-1, n_samples)).reshape(bits.shape[:-1])
+    return counts * np.log2(n_samples) / n_samples
+
+
+def mean_period(data: np.ndarray) -> np.ndarray:
+    """
+    Mean period of each time series in samples, the reciprocal of the mean frequency of its power spectrum.
+
+    This is the automatic Theiler window of nk.complexity_lyapunov, including its frequency grid and lower frequency
+    limit, so the results agree.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+
+    Returns:
+        np.ndarray: Integer array of shape (...).
+    """
+    n_samples = data.shape[-1]
+    power = np.abs(np.fft.rfft(data - np.mean(data, axis=-1, keepdims=True), axis=-1)) ** 2
+    # neurokit2 uses a nominal sampling rate of 1000 Hz, which cancels out
+    freqs = np.linspace(0, 500, power.shape[-1])
+    in_range = freqs >= 4000 / n_samples
+    mean_freq = np.sum(power[..., in_range] * freqs[in_range], axis=-1) / np.sum(power[..., in_range], axis=-1)
+    return np.ceil(1000 / mean_freq).astype(np.int64)
+
+
+def reference_points(n_points: int, max_reference_points: Optional[int] = None) -> np.ndarray:
+    """
+    Indices of the reference points whose nearest neighbours are followed, evenly spaced if limited.
+
+    Args:
+        n_points (int): Number of points available.
+        max_reference_points (int, optional): Largest number of reference points, None for all points.
+
+    Returns:
+        np.ndarray: Sorted indices.
+    """
+    if max_reference_points is None or max_reference_points >= n_points:
+        return np.arange(n_points)
+    return np.unique(np.round(np.linspace(0, n_points - 1, max_reference_points)).astype(np.int64))
+
+
+def nearest_neighbours(points: np.ndarray, reference: np.ndarray, separation: int) -> np.ndarray:
+    """
+    Nearest neighbour of each reference point that is more than separation samples apart in time.
+
+    The neighbours are queried from a KD-tree. The number of queried neighbours starts small and is only increased
+    for the reference points whose neighbours all lie inside the Theiler window. At most 2 * separation + 1 points
+    can be inside it, so 2 * separation + 2 neighbours always suffice. Like the argmin of neurokit2, ties are
+    resolved to the lowest index.
+
+    Args:
+        points (np.ndarray): Embedding vectors of shape (n_points, dimension).
+        reference (np.ndarray): Indices of the reference points.
+        separation (int): Theiler window, the minimal temporal separation of neighbours.
+
+    Returns:
+        np.ndarray: Index of the neighbour of each reference point, 0 if there is none.
+    """
+    n_points = len(points)
+    tree = cKDTree(points)
+    neighbours = np.zeros(len(reference), dtype=np.int64)
+    pending = np.arange(len(reference))
+    n_queried = min(8, n_points)
+    while pending.size:
+        distances, indices = tree.query(points[reference[pending]], k=n_queried)
+        distances = distances.reshape(len(pending), -1)
+        indices = indices.reshape(len(pending), -1)
+        distances[np.abs(indices - reference[pending, None]) <= separation] = np.inf
+        closest = distances.min(axis=-1)
+        found = np.isfinite(closest)
+        ties = np.where(distances == closest[:, None], indices, n_points)
+        neighbours[pending[found]] = ties[found].min(axis=-1)
+        if n_queried >= min(2 * separation + 2, n_points):
+            break
+        pending = pending[~found]
+        n_queried = min(4 * n_queried, 2 * separation + 2, n_points)
+    return neighbours
+
+
+def divergence_curves(embedded: np.ndarray, reference: np.ndarray, neighbours: np.ndarray,
+                      len_trajectory: int) -> np.ndarray:
+    """
+    Mean logarithmic distance of the neighbour pairs along their trajectories, for a batch of embeddings.
+
+    Args:
+        embedded (np.ndarray): Embeddings of shape (n_series, n_points, dimension).
+        reference (np.ndarray): Indices of the reference points, the same for all series.
+        neighbours (np.ndarray): Neighbour of each reference point, shape (n_series, n_references).
+        len_trajectory (int): Number of steps the pairs are followed.
+
+    Returns:
+        np.ndarray: Array of shape (n_series, len_trajectory), -inf where all distances are zero.
+    """
+    series = np.arange(embedded.shape[0])[:, None]
+    curves = np.empty((embedded.shape[0], len_trajectory))
+    for step in range(len_trajectory):
+        distances = np.linalg.norm(embedded[series, reference + step] - embedded[series, neighbours + step], axis=-1)
+        nonzero = distances != 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_distances = np.log(np.where(nonzero, distances, 1.0))
+            curves[:, step] = np.sum(log_distances, axis=-1) / np.sum(nonzero, axis=-1)
+        curves[~np.any(nonzero, axis=-1), step] = -np.inf
+    return curves
+
+
+def _divergence_slopes(curves: np.ndarray) -> np.ndarray:
+    """
+    Least squares slopes of divergence curves over the steps 1, 2, ..., leaving out non-finite steps as neurokit2.
+    """
+    slopes = np.empty(curves.shape[0])
+    finite = np.isfinite(curves)
+    complete = np.all(finite, axis=-1)
+    steps = np.arange(1, curves.shape[-1] + 1) - (curves.shape[-1] + 1) / 2
+    slopes[complete] = (curves[complete] @ steps) / np.sum(steps ** 2)
+    for row in np.flatnonzero(~complete):
+        values = curves[row, finite[row]]
+        slopes[row] = np.polyfit(np.arange(1, len(values) + 1), values, 1)[0] if len(values) > 1 else np.nan
+    return slopes
+
+
+@batch_metric
+@uses_intermediates(embedded=('embedding', 'dimension', 'delay'))
+def lyapunov(data: np.ndarray, delay: int = 1, dimension: int = 2, separation: Union[str, int] = 'auto',
+             len_trajectory: int = 20, max_reference_points: Optional[int] = None,
+             embedded: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Largest Lyapunov exponent of each time series after Rosenstein et al. (1993), as nk.complexity_lyapunov.
+
+    Every point of the delay embedding (except the last len_trajectory - 1) is paired with its nearest neighbour
+    outside the Theiler window, the pairs are followed for len_trajectory steps, and the exponent is the slope of
+    the mean logarithmic distance over the steps.
+
+    With all reference points the results agree with neurokit2 up to the rounding of its distance matrix and the
+    resolution of exact distance ties, the relative difference on noise and EEG-like test signals was below 1e-11.
+    Limiting the reference points trades accuracy for speed. On epochs of 2500 samples, following 1000 evenly spaced
+    points changed the exponent by about 1 % of its value on average (at most 3.5 %) and following 500 points by
+    about 2 % (at most 5 %).
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        delay (int): Delay of the embedding in samples.
+        dimension (int): Embedding dimension.
+        separation (str or int): Theiler window in samples, 'auto' for the mean period of each time series.
+        len_trajectory (int): Number of steps the neighbour pairs are followed.
+        max_reference_points (int, optional): Largest number of followed pairs, None (default) to follow all.
+        embedded (np.ndarray, optional): The embedding of the data, shared by the Array_processor.
+
+    Returns:
+        np.ndarray: The largest Lyapunov exponent of each time series, per sample, NaN for time series with
+                    non-finite values.
+    """
+    n_samples = data.shape[-1]
+    series = data.reshape(-1, n_samples)
+    finite = np.all(np.isfinite(series), axis=-1)
+    if not np.all(finite):
+        # Time series with NaN (e.g. bad channels) have no exponent, the others are computed without them
+        exponents = np.full(len(series), np.nan)
+        if np.any(finite):
+            exponents[finite] = lyapunov(series[finite], delay, dimension, separation, len_trajectory,
+                                         max_reference_points)
+        return exponents.reshape(data.shape[:-1])
+    if separation == 'auto':
+        separations = mean_period(series)
+    elif isinstance(separation, (int, np.integer)):
+        separations = np.full(len(series), separation, dtype=np.int64)
+    else:
+        raise ValueError("separation must be 'auto' or an integer.")
+
+    if embedded is None:
+        embedded = embed(data, dimension, delay)
+    embedded = embedded.reshape((-1,) + embedded.shape[-2:])
+    n_trajectories = embedded.shape[-2] - len_trajectory + 1
+    reference = reference_points(n_trajectories, max_reference_points)
+    neighbours = np.stack([nearest_neighbours(np.ascontiguousarray(points[:n_trajectories]), reference, width)
+                           for points, width in zip(embedded, separations)])
+    curves = divergence_curves(embedded, reference, neighbours, len_trajectory)
+    return _divergence_slopes(curves).reshape(data.shape[:-1])
@@ -0,0 +1,366 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Entropy metrics for EEG analysis.
+
+This module provides batched implementations of the permutation, sample and multiscale entropies of neurokit2
+(nk.entropy_permutation, nk.entropy_sample and nk.entropy_multiscale with the methods MSEn, MSPEn and MSWPEn).
+
+- Ordinal patterns of all time series are built in one vectorized pass from pairwise comparisons of the embedding
+  coordinates. Only embedding vectors with equal coordinates are sorted, so ties are ranked as in neurokit2.
+- Coarse-grained series are computed once per scale for a whole block. The coarse graining is a shared intermediate,
+  so the sample and permutation variants of the multiscale entropy of the same block of epochs share them.
+- Sample entropy compares all pairs of embedding vectors of all time series of a block lag by lag, so the
+  comparisons of the m and m + 1 dimensional vectors are shared.
+"""
+
+import math
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from eeganalyzer.metrics.batch import batch_metric
+from eeganalyzer.metrics.intermediates import intermediate, uses_intermediates
+
+# Maximum number of pairwise comparisons held in memory by the sample entropy
+LAG_BLOCK_ELEMENTS = 2 ** 19
+
+
+@intermediate('embedding')
+def embed(data: np.ndarray, dimension: int, delay: int = 1) -> np.ndarray:
+    """
+    Time-delay embedding of each time series as a view.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        dimension (int): Embedding dimension.
+        delay (int): Delay between the coordinates in samples.
+
+    Returns:
+        np.ndarray: Array of shape (..., samples - (dimension - 1) * delay, dimension).
+    """
+    return sliding_window_view(data, (dimension - 1) * delay + 1, axis=-1)[..., ::delay]
+
+
+@intermediate('ordinal_patterns', requires={'embedded': ('embedding', 'dimension', 'delay')})
+def ordinal_patterns(data: np.ndarray, dimension: int = 3, delay: int = 1,
+                     embedded: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Codes of the ordinal patterns of each time series.
+
+    The code of an embedding vector is its inversion table (for every coordinate, the number of later coordinates
+    with a smaller value) in the factorial number system. Vectors with equal coordinates are ranked by the argsort
+    of neurokit2 (quicksort), which does not always keep the temporal order of equal values, so they get the same
+    patterns as in neurokit2.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        dimension (int): Embedding dimension.
+        delay (int): Delay between the coordinates in samples.
+        embedded (np.ndarray, optional): The embedding of the data, see embed.
+
+    Returns:
+        np.ndarray: Integer codes in [0, dimension!) of shape (..., samples - (dimension - 1) * delay).
+    """
+    if embedded is None:
+        embedded = embed(data, dimension, delay)
+    codes = np.zeros(embedded.shape[:-1], dtype=np.int64)
+    tied = np.zeros(codes.shape, dtype=bool)
+    for i in range(dimension - 1):
+        coordinate = embedded[..., i]
+        inversions = np.zeros(codes.shape, dtype=np.int64)
+        for j in range(i + 1, dimension):
+            inversions += embedded[..., j] < coordinate
+            tied |= embedded[..., j] == coordinate
+        codes += inversions * math.factorial(dimension - 1 - i)
+    if tied.any():
+        codes[tied] = _sorted_codes(embedded[tied])
+    return codes
+
+
+def _sorted_codes(vectors: np.ndarray) -> np.ndarray:
+    """
+    Codes of the ordinal patterns of embedding vectors of shape (n_vectors, dimension), ranked by the argsort of
+    neurokit2.
+    """
+    dimension = vectors.shape[-1]
+    order = vectors.argsort(axis=-1, kind='quicksort')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(dimension), axis=-1)
+    codes = np.zeros(len(vectors), dtype=np.int64)
+    for i in range(dimension - 1):
+        inversions = np.count_nonzero(ranks[:, i + 1:] < ranks[:, i:i + 1], axis=-1)
+        codes += inversions * math.factorial(dimension - 1 - i)
+    return codes
+
+
+def _shannon_of_counts(counts: np.ndarray) -> np.ndarray:
+    """
+    Shannon entropy in bits of the (weighted) counts along the last axis.
+    """
+    total = np.sum(counts, axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probabilities = counts / total
+        terms = np.where(probabilities > 0, probabilities * np.log2(probabilities), 0.0)
+    return -np.sum(terms, axis=-1)
+
+
+def _permutation_entropy(data: np.ndarray, dimension: int, delay: int, corrected: bool, weighted: bool,
+                         patterns: Optional[np.ndarray] = None, embedded: Optional[np.ndarray] = None) -> np.ndarray:
+    if embedded is None:
+        embedded = embed(data, dimension, delay)
+    codes = ordinal_patterns(data, dimension, delay, embedded) if patterns is None else patterns
+    n_patterns = math.factorial(dimension)
+    n_series = int(np.prod(data.shape[:-1]))
+    flat_codes = (np.arange(n_series).reshape(data.shape[:-1] + (1,)) * n_patterns + codes).ravel()
+    weights = np.var(embedded, axis=-1).ravel() if weighted else None
+    counts = np.bincount(flat_codes, weights=weights, minlength=n_series * n_patterns)
+    entropy = _shannon_of_counts(counts.reshape(data.shape[:-1] + (n_patterns,)))
+    if corrected:
+        entropy = entropy / np.log2(n_patterns)
+    return entropy
+
+
+@batch_metric
+@uses_intermediates(patterns=('ordinal_patterns', 'dimension', 'delay'), embedded=('embedding', 'dimension', 'delay'))
+def permutation_entropy(data: np.ndarray, delay: int = 1, dimension: int = 3, corrected: bool = True,
+                        weighted: bool = False, patterns: Optional[np.ndarray] = None,
+                        embedded: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Permutation entropy of each time series, as nk.entropy_permutation.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        delay (int): Delay between the coordinates of the ordinal patterns in samples.
+        dimension (int): Length of the ordinal patterns.
+        corrected (bool): If True, the entropy is normalised by log2(dimension!).
+        weighted (bool): If True, every pattern is weighted by the variance of its embedding vector.
+        patterns (np.ndarray, optional): The ordinal patterns of the data, shared by the Array_processor.
+        embedded (np.ndarray, optional): The embedding of the data, shared by the Array_processor.
+
+    Returns:
+        np.ndarray: The permutation entropy of each time series.
+    """
+    return _permutation_entropy(data, dimension, delay, corrected, weighted, patterns, embedded)
+
+
+def _tolerance(data: np.ndarray, tolerance: Union[str, float]) -> np.ndarray:
+    if isinstance(tolerance, str):
+        if tolerance.lower() not in ('sd', 'std', 'traditional', 'default'):
+            raise ValueError(f"Only the tolerance 'sd' or a number is supported, not {tolerance}.")
+        return 0.2 * np.std(data, axis=-1, ddof=1)
+    return np.full(data.shape[:-1], float(tolerance))
+
+
+def _count_matches(series: np.ndarray, dimension: int, delay: int,
+                   tolerance: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int, int]:
+    """
+    Counts the pairs of embedding vectors within the tolerance (chebyshev distance) for the dimensions m and m + 1.
+
+    As in neurokit2, the m dimensional embedding without its last vector and the whole m + 1 dimensional embedding
+    are compared, with a delay above 1 the m dimensional embedding has more vectors.
+
+    The pairs are enumerated by their lag: for a block of lags, the absolute differences of every series and its
+    shifted copies are compared with the tolerance once, and the comparisons of all coordinates are combined.
+    """
+    n_series, n_samples = series.shape
+    n_vectors_m = n_samples - (dimension - 1) * delay - 1
+    n_vectors_m1 = n_samples - dimension * delay
+    pairs_m = np.zeros(n_series)
+    pairs_m1 = np.zeros(n_series)
+    if n_vectors_m1 < 2:
+        return pairs_m, pairs_m1, n_vectors_m, n_vectors_m1
+    # shifted[:, lag, i] = series[:, i + lag], NaN beyond the end never matches
+    padded = np.concatenate([series, np.full((n_series, n_vectors_m), np.nan)], axis=-1)
+    shifted = sliding_window_view(padded, n_samples, axis=-1)
+    radius = tolerance.reshape(-1, 1, 1)
+    vector_idx = np.arange(n_vectors_m)
+    lags_per_block = max(1, LAG_BLOCK_ELEMENTS // (n_series * n_samples))
+    for first_lag in range(1, n_vectors_m, lags_per_block):
+        last_lag = min(first_lag + lags_per_block, n_vectors_m)
+        lags = np.arange(first_lag, last_lag)
+        differences = shifted[:, first_lag:last_lag, :] - series[:, np.newaxis, :]
+        np.abs(differences, out=differences)
+        with np.errstate(invalid='ignore'):
+            close = differences <= radius
+        # both vectors of a pair have to be vectors of the embedding
+        later_idx = vector_idx[np.newaxis, :] + lags[:, np.newaxis]
+        match = close[..., :n_vectors_m] & (later_idx < n_vectors_m)
+        for coordinate in range(1, dimension):
+            match &= close[..., coordinate * delay:coordinate * delay + n_vectors_m]
+        pairs_m += np.count_nonzero(match, axis=(1, 2))
+        match = match[..., :n_vectors_m1] & (later_idx[:, :n_vectors_m1] < n_vectors_m1)
+        match &= close[..., dimension * delay:dimension * delay + n_vectors_m1]
+        pairs_m1 += np.count_nonzero(match, axis=(1, 2))
+    return pairs_m, pairs_m1, n_vectors_m, n_vectors_m1
+
+
+def _sample_entropy(data: np.ndarray, dimension: int, delay: int, tolerance: np.ndarray) -> np.ndarray:
+    """
+    Sample entropy of each time series with a tolerance per time series.
+    """
+    batch_shape = data.shape[:-1]
+    pairs_m, pairs_m1, n_vectors_m, n_vectors_m1 = _count_matches(data.reshape(-1, data.shape[-1]), dimension,
+                                                                  delay, tolerance.reshape(-1))
+    if n_vectors_m1 < 2:
+        return np.full(batch_shape, np.nan)
+    # the share of other vectors within the tolerance, as neurokit2 computes it
+    phi_m = 2 * pairs_m / (n_vectors_m * (n_vectors_m - 1))
+    phi_m1 = 2 * pairs_m1 / (n_vectors_m1 * (n_vectors_m1 - 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        division = phi_m1 / phi_m
+        entropy = -np.log(division)
+    # the special cases of neurokit2
+    entropy = np.where(division < 0, np.nan, entropy)
+    entropy = np.where(np.isclose(division, 0), np.inf, entropy)
+    entropy = np.where(np.isclose(phi_m, 0), -np.inf, entropy)
+    return entropy.reshape(batch_shape)
+
+
+@batch_metric
+def sample_entropy(data: np.ndarray, delay: int = 1, dimension: int = 2,
+                   tolerance: Union[str, float] = 'sd') -> np.ndarray:
+    """
+    Sample entropy of each time series, as nk.entropy_sample with the chebyshev distance.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        delay (int): Delay between the coordinates of the embedding in samples.
+        dimension (int): Embedding dimension.
+        tolerance (str or float): 'sd' for 0.2 times the standard deviation of each time series, or a number.
+
+    Returns:
+        np.ndarray: The sample entropy of each time series.
+    """
+    return _sample_entropy(data, dimension, delay, _tolerance(data, tolerance))
+
+
+class CoarseGraining:
+    """
+    Non-overlapping coarse-grained versions of a block of time series for any number of scales.
+
+    The coarse series of a scale is computed once and reused by all entropies of the block.
+
+    Attributes:
+        data (np.ndarray): The time series of shape (..., samples).
+        series (dict): {scale: coarse series of shape (..., samples // scale)}
+    """
+
+    def __init__(self, data: np.ndarray):
+        self.data = data
+        self.series: Dict[int, np.ndarray] = {}
+
+    def get(self, scale: int) -> np.ndarray:
+        """
+        Returns the coarse-grained series of a scale, the means of consecutive non-overlapping windows.
+
+        Args:
+            scale (int): Length of the windows, 1 returns the time series themselves.
+
+        Returns:
+            np.ndarray: Array of shape (..., samples // scale).
+        """
+        if scale <= 1:
+            return self.data
+        if scale not in self.series:
+            n_windows = self.data.shape[-1] // scale
+            windows = self.data[..., :n_windows * scale].reshape(self.data.shape[:-1] + (n_windows, scale))
+            # the same summation as neurokit2, so ties between the means are kept for the ordinal patterns
+            self.series[scale] = np.mean(windows, axis=-1)
+        return self.series[scale]
+
+
+@intermediate('coarse_graining')
+def coarse_graining(data: np.ndarray) -> CoarseGraining:
+    """
+    CoarseGraining of a block of time series, whose coarse series are filled in as the scales are requested.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+
+    Returns:
+        CoarseGraining: The coarse graining of the block, in double precision like the entropies themselves.
+    """
+    return CoarseGraining(np.ascontiguousarray(data, dtype=np.float64))
+
+
+def _scales(n_samples: int, scale: Union[str, int, list, None], dimension: int) -> np.ndarray:
+    # the default scales of neurokit2
+    if scale is None or scale == 'max':
+        return np.arange(1, n_samples // 2)
+    if scale == 'default':
+        return np.arange(1, int(n_samples / (dimension + 10)))
+    if isinstance(scale, (int, np.integer)):
+        return np.arange(1, scale + 1)
+    return np.asarray(scale)
+
+
+def _area_under_finite(values: np.ndarray) -> np.ndarray:
+    """
+    np.trapz of the finite values along the last axis divided by their number, for every time series at once.
+    """
+    finite = np.isfinite(values)
+    n_finite = np.count_nonzero(finite, axis=-1)
+    total = np.sum(np.where(finite, values, 0.0), axis=-1)
+    first = np.take_along_axis(values, np.argmax(finite, axis=-1)[..., np.newaxis], axis=-1)[..., 0]
+    last_idx = values.shape[-1] - 1 - np.argmax(finite[..., ::-1], axis=-1)
+    last = np.take_along_axis(values, last_idx[..., np.newaxis], axis=-1)[..., 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        area = (total - (first + last) / 2) / n_finite
+    return np.where(n_finite > 0, area, np.nan)
+
+
+@batch_metric
+@uses_intermediates(coarse=('coarse_graining',))
+def multiscale_entropy(data: np.ndarray, scale: Union[str, int, list] = 'default', dimension: int = 3,
+                       tolerance: Union[str, float] = 'sd', method: str = 'MSEn',
+                       coarse: Optional[CoarseGraining] = None) -> np.ndarray:
+    """
+    Multiscale entropy of each time series, as nk.entropy_multiscale.
+
+    The entropy is computed on the non-overlapping coarse-grained series of every scale and summarised by the
+    area under the finite values divided by their number.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        scale (str, int or list): 'default' (1 to samples / (dimension + 10)), 'max', the largest scale or a list.
+        dimension (int): Embedding dimension.
+        tolerance (str or float): Tolerance of the sample entropy, computed once on the original time series.
+        method (str): 'MSEn' (sample entropy), 'MSPEn' (permutation entropy) or 'MSWPEn' (weighted permutation
+                      entropy).
+        coarse (CoarseGraining, optional): The coarse graining of the data, shared by the Array_processor.
+
+    Returns:
+        np.ndarray: The multiscale entropy of each time series.
+    """
+    if method not in ('MSEn', 'SampEn', 'MSPEn', 'PEn', 'MSWPEn', 'WPEn'):
+        raise ValueError(f"method must be 'MSEn', 'MSPEn' or 'MSWPEn', not {method}.")
+    scales = _scales(data.shape[-1], scale, dimension)
+    if coarse is None:
+        coarse = coarse_graining(data)
+    tolerances = _tolerance(data, tolerance)
+
+    values = np.full(data.shape[:-1] + (len(scales),), np.nan)
+    for scale_idx, current_scale in enumerate(scales):
+        coarse_series = coarse.get(int(current_scale))
+        if coarse_series.shape[-1] == 0:
+            continue
+        if method in ('MSEn', 'SampEn'):
+            values[..., scale_idx] = _sample_entropy(coarse_series, dimension, 1, tolerances)
+        else:
+            if coarse_series.shape[-1] < dimension:
+                continue
+            values[..., scale_idx] = _permutation_entropy(coarse_series, dimension, 1, corrected=True,
+                                                          weighted=method in ('MSWPEn', 'WPEn'))
+    return _area_under_finite(values)
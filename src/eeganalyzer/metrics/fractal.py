@@ -0,0 +1,133 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Fractal dimension metrics for EEG analysis.
+
+This module provides numpy implementations of the Katz, Higuchi and Petrosian fractal dimensions as batch metrics.
+They follow the definitions of neurokit2 (nk.fractal_katz, nk.fractal_higuchi and nk.fractal_petrosian) and agree
+with them up to floating point precision, but compute whole blocks of epochs and channels in one call. Like every
+batch metric they also accept a single 1-D time series and can be used in any select_metrics set.
+"""
+
+import numpy as np
+
+from eeganalyzer.metrics.batch import batch_metric
+
+
+@batch_metric(single_precision=True)
+def katz(data: np.ndarray) -> np.ndarray:
+    """
+    Katz fractal dimension of each time series, log10(L / a) / log10(d / a) with the curve length L, the mean
+    distance of consecutive samples a and the largest distance d from the first sample.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+
+    Returns:
+        np.ndarray: The Katz fractal dimension of each time series.
+    """
+    distances = np.abs(np.diff(data, axis=-1))
+    length = np.sum(distances, axis=-1)
+    mean_distance = np.mean(distances, axis=-1)
+    diameter = np.max(np.abs(data - data[..., :1]), axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log10(length / mean_distance) / np.log10(diameter / mean_distance)
+
+
+def higuchi_curve_lengths(data: np.ndarray, k_max: int = 10) -> np.ndarray:
+    """
+    Average normalised curve lengths L(k) of the Higuchi method for k = 1 ... k_max.
+
+    For every k, the differences x[t + k] - x[t] of all time series are computed in one array, and the curve
+    lengths of all k offsets m are obtained by folding this array into rows of length k.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        k_max (int): Largest interval k.
+
+    Returns:
+        np.ndarray: Array of shape (..., k_max) with L(k).
+    """
+    n_samples = data.shape[-1]
+    curve_lengths = np.empty(data.shape[:-1] + (k_max,))
+    for k in range(1, k_max + 1):
+        distances = np.abs(data[..., k:] - data[..., :-k])
+        # pad to a multiple of k, then distances[..., i * k + m] belongs to offset m
+        n_rows = -(-distances.shape[-1] // k)
+        padding = [(0, 0)] * (distances.ndim - 1) + [(0, n_rows * k - distances.shape[-1])]
+        offset_lengths = np.sum(np.pad(distances, padding).reshape(data.shape[:-1] + (n_rows, k)), axis=-2)
+        # the normalisation of neurokit2, which counts the offsets from 1 to k
+        offsets = np.arange(1, k + 1)
+        normalization = (n_samples - 1) / (np.floor((n_samples - offsets) / k) * k)
+        curve_lengths[..., k - 1] = np.sum(offset_lengths * normalization, axis=-1) / k / k
+    return curve_lengths
+
+
+@batch_metric(single_precision=True)
+def higuchi(data: np.ndarray, k_max: int = 10) -> np.ndarray:
+    """
+    Higuchi fractal dimension of each time series, the negative slope of log(L(k)) over log(k).
+
+    Unlike nk.fractal_higuchi, k_max has to be given as an integer, the optimisation of k_max is not supported.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        k_max (int): Largest interval k.
+
+    Returns:
+        np.ndarray: The Higuchi fractal dimension of each time series.
+    """
+    if not isinstance(k_max, (int, np.integer)) or k_max < 2:
+        raise ValueError("k_max of the Higuchi fractal dimension must be an integer >= 2.")
+    log_k = np.log(np.arange(1, k_max + 1))
+    log_lengths = np.log(higuchi_curve_lengths(data, int(k_max)))
+    # Least squares slope of all time series at once
+    centered_log_k = log_k - np.mean(log_k)
+    slopes = np.sum(centered_log_k * (log_lengths - np.mean(log_lengths, axis=-1, keepdims=True)), axis=-1)
+    return -slopes / np.sum(centered_log_k ** 2)
+
+
+def _petrosian_symbols(data: np.ndarray, symbolize: str) -> np.ndarray:
+    method = symbolize.lower()
+    if method in ('c', 'sign'):
+        return np.signbit(np.diff(data, axis=-1))
+    if method in ('a', 'mean'):
+        return data > np.mean(data, axis=-1, keepdims=True)
+    if method == 'median':
+        return data > np.median(data, axis=-1, keepdims=True)
+    if method == 'b':
+        mean = np.mean(data, axis=-1, keepdims=True)
+        sd = np.std(data, axis=-1, ddof=1, keepdims=True)
+        return (data < mean - sd) | (data > mean + sd)
+    if method == 'd':
+        return np.abs(np.diff(data, axis=-1)) > np.std(data, axis=-1, ddof=1, keepdims=True)
+    raise ValueError(f"symbolize must be one of 'A', 'B', 'C', 'D' or 'median', not {symbolize}.")
+
+
+@batch_metric(single_precision=True)
+def petrosian(data: np.ndarray, symbolize: str = 'C') -> np.ndarray:
+    """
+    Petrosian fractal dimension of each time series, based on the number of changes of a binary symbolisation.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        symbolize (str): Binarisation as in neurokit2: 'C' (sign of the differences, default), 'A' (above the mean),
+                         'median', 'B' (outside mean +- sd) or 'D' (differences larger than sd).
+
+    Returns:
+        np.ndarray: The Petrosian fractal dimension of each time series.
+    """
+    symbols = _petrosian_symbols(data, symbolize)
+    n_inversions = np.count_nonzero(symbols[..., 1:] != symbols[..., :-1], axis=-1)
+    n = symbols.shape[-1]
+    return np.log10(n) / (np.log10(n) + np.log10(n / (n + 0.4 * n_inversions)))
@@ -0,0 +1,175 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Shared intermediate results protocol for EEG analysis.
+
+Several metrics of a set often start from the same intermediate result, e.g. the delay embedding or the power
+spectral density of an epoch. An intermediate is a named function of the data and some parameters, registered with
+the intermediate decorator. It can itself depend on other intermediates, so the intermediates form a DAG:
+
+    @intermediate('embedding')
+    def embedding(data, dimension, delay): ...
+
+    @intermediate('ordinal_patterns', requires={'embedded': ('embedding', 'dimension', 'delay')})
+    def ordinal_patterns(data, dimension, delay, embedded): ...
+
+A metric function declares the intermediates it consumes with uses_intermediates. Each dependency maps the keyword
+argument the metric receives it as to the name of the intermediate and the names of the metric arguments which are
+its parameters:
+
+    @batch_metric
+    @uses_intermediates(patterns=('ordinal_patterns', 'dimension', 'delay'))
+    def permutation_entropy(data, delay=1, dimension=3, patterns=None): ...
+
+The Array_processor computes every intermediate once per block of data and passes it to all consumers, and frees it
+as soon as its last consumer is done. Called directly, the metric gets no intermediate and computes it itself.
+"""
+
+import functools
+import inspect
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+INTERMEDIATES_ATTRIBUTE = '__eeganalyzer_intermediates__'
+
+# A dependency: (name of the intermediate, names of the arguments which are its parameters)
+Dependency = Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class Intermediate:
+    """
+    Identifies an intermediate result by its name and parameters.
+
+    Attributes:
+        name (str): Name of the registered intermediate.
+        params (tuple): Sorted (name, value) pairs of its parameters.
+    """
+    name: str
+    params: Tuple[Tuple[str, Any], ...] = ()
+
+    @property
+    def kwargs(self) -> Dict[str, Any]:
+        return dict(self.params)
+
+
+@dataclass(frozen=True)
+class Producer:
+    """
+    A registered intermediate.
+
+    Attributes:
+        func (callable): Computes the intermediate from the data, its parameters and its own dependencies.
+        requires (dict): Dependencies on other intermediates, by keyword argument.
+        needs_sfreq (bool): Whether the function gets the sampling frequency as keyword argument sfreq.
+    """
+    func: Callable
+    requires: Dict[str, Dependency] = field(default_factory=dict)
+    needs_sfreq: bool = False
+
+
+_producers: Dict[str, Producer] = {}
+
+
+def intermediate(name: str, requires: Optional[Dict[str, Dependency]] = None, needs_sfreq: bool = False) -> Callable:
+    """
+    Registers a function as the intermediate with the given name.
+
+    Args:
+        name (str): Name of the intermediate, has to be unique.
+        requires (dict, optional): Other intermediates the function consumes, see uses_intermediates.
+        needs_sfreq (bool): If True, the function gets the sampling frequency as keyword argument sfreq.
+
+    Returns:
+        callable: A decorator which registers the function and returns it unchanged.
+    """
+    def decorator(func: Callable) -> Callable:
+        _producers[name] = Producer(func=func, requires=dict(requires or {}), needs_sfreq=needs_sfreq)
+        return func
+
+    return decorator
+
+
+def get_producer(name: str) -> Producer:
+    """
+    Returns the registered intermediate with the given name.
+
+    Args:
+        name (str): Name of the intermediate.
+
+    Returns:
+        Producer
+
+    Raises:
+        KeyError: If no intermediate with this name is registered.
+    """
+    if name not in _producers:
+        raise KeyError(f"No intermediate named '{name}' is registered.")
+    return _producers[name]
+
+
+def uses_intermediates(**dependencies: Dependency) -> Callable:
+    """
+    Declares the intermediates a metric function consumes.
+
+    Args:
+        **dependencies: For every keyword argument of the metric which receives an intermediate, a tuple of the
+                        name of the intermediate and the names of the metric arguments which are its parameters.
+
+    Returns:
+        callable: A decorator which attaches the dependencies to the metric function.
+    """
+    def decorator(metric_func: Callable) -> Callable:
+        setattr(metric_func, INTERMEDIATES_ATTRIBUTE, dict(dependencies))
+        return metric_func
+
+    return decorator
+
+
+def resolve(dependency: Dependency, arguments: Dict[str, Any]) -> Intermediate:
+    """
+    Creates the Intermediate of a dependency from the arguments of its consumer.
+
+    Args:
+        dependency (tuple): Name of the intermediate and names of the arguments which are its parameters.
+        arguments (dict): Arguments of the consumer, including defaults.
+
+    Returns:
+        Intermediate
+    """
+    name, *param_names = dependency
+    return Intermediate(name, tuple(sorted((param, arguments[param]) for param in param_names)))
+
+
+@functools.lru_cache(maxsize=None)
+def _default_arguments(func: Callable) -> Tuple[Tuple[str, Any], ...]:
+    parameters = inspect.signature(func).parameters.values()
+    return tuple((p.name, p.default) for p in parameters if p.default is not inspect.Parameter.empty)
+
+
+def get_intermediates(func: Callable, kwargs: Optional[Dict[str, Any]] = None) -> Dict[str, Intermediate]:
+    """
+    Returns the intermediates a metric function consumes with the given arguments.
+
+    Args:
+        func (callable): The metric function.
+        kwargs (dict, optional): Additional arguments of the function.
+
+    Returns:
+        dict: The Intermediate for every keyword argument that receives one, empty for ordinary metrics.
+    """
+    dependencies = getattr(func, INTERMEDIATES_ATTRIBUTE, None)
+    if not dependencies:
+        return {}
+    arguments = {**dict(_default_arguments(func)), **(kwargs or {})}
+    return {argument: resolve(dependency, arguments) for argument, dependency in dependencies.items()}
@@ -0,0 +1,97 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Decomposable metric protocol for EEG analysis.
+
+With overlapping epochs every sample belongs to several epochs. A decomposable metric can be computed from partial
+results of non-overlapping blocks: the signal is cut into blocks of g = gcd(epoch length, hop) samples, every block
+is summarised once, and the summaries of the blocks of an epoch are combined into its result. Decorating a metric
+function with sliding_metric declares such a decomposition. The Array_processor uses it automatically for
+overlapping epochs and calls the metric directly otherwise.
+
+A decomposition consists of
+    block(blocks, **kwargs): summaries of shape (..., n_blocks, k) for blocks of shape (..., n_blocks, g).
+    seam(left, right, **kwargs), optional: summaries of shape (..., n_seams, k_seam) of the borders between
+        neighbouring blocks, for contributions which cross block borders (e.g. the difference of two neighbouring
+        samples). left and right have the shape (..., n_seams, g) and hold the blocks before and after each border.
+    finalize(block_stats, seam_stats, block_size, **kwargs): the results of shape (...) from the summaries of the
+        blocks of each epoch (..., n_blocks_per_epoch, k) and of the seams inside it (..., n_blocks_per_epoch - 1,
+        k_seam), or None if there is no seam function.
+    supports(block_size, n_samples, **kwargs), optional: whether the decomposition is exact for a block size and
+        epoch length, e.g. a Welch segment has to fit into the blocks.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+SLIDING_ATTRIBUTE = '__eeganalyzer_sliding__'
+
+
+@dataclass(frozen=True)
+class SlidingSpec:
+    """
+    Describes how a metric decomposes into block summaries, see the module documentation.
+
+    Attributes:
+        block (callable): Summaries of non-overlapping blocks.
+        finalize (callable): Combines the summaries of the blocks of each epoch into its result.
+        seam (callable): Summaries of the borders between neighbouring blocks, None if not needed.
+        supports (callable): Checks if the decomposition is exact for a block size, None if it always is.
+    """
+    block: Callable
+    finalize: Callable
+    seam: Optional[Callable] = None
+    supports: Optional[Callable] = None
+
+
+def sliding_metric(block: Callable, finalize: Callable, seam: Optional[Callable] = None,
+                   supports: Optional[Callable] = None) -> Callable:
+    """
+    Declares a metric function as decomposable into block summaries.
+
+    The metric itself stays unchanged and is still used for non-overlapping epochs. Decorate the outermost
+    function, e.g. above batch_metric:
+
+        @sliding_metric(block=_sum_block, finalize=_mean_finalize)
+        @batch_metric
+        def mean(data): ...
+
+    Args:
+        block (callable): Summaries of non-overlapping blocks.
+        finalize (callable): Combines the summaries of the blocks of each epoch into its result.
+        seam (callable, optional): Summaries of the borders between neighbouring blocks.
+        supports (callable, optional): Checks if the decomposition is exact for a block size.
+
+    Returns:
+        callable: A decorator which attaches the SlidingSpec to the metric function.
+    """
+    spec = SlidingSpec(block=block, finalize=finalize, seam=seam, supports=supports)
+
+    def decorator(metric_func: Callable) -> Callable:
+        setattr(metric_func, SLIDING_ATTRIBUTE, spec)
+        return metric_func
+
+    return decorator
+
+
+def get_sliding_spec(func: Callable) -> Optional[SlidingSpec]:
+    """
+    Returns the SlidingSpec of a metric function, or None if it has to be computed directly on every epoch.
+
+    Args:
+        func (callable): The metric function.
+
+    Returns:
+        SlidingSpec or None
+    """
+    return getattr(func, SLIDING_ATTRIBUTE, None)
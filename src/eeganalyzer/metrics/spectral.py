@@ -0,0 +1,345 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Spectral metrics for EEG analysis.
+
+This module provides spectral metrics as batch metrics, which get the sampling frequency from the Array_processor.
+
+The spectral metric family (band_power, relative_band_power, spectral_edge, spectral_entropy, peak_frequency and
+aperiodic_slope) is derived from one power spectral density, the shared intermediate 'psd'. Within a metric set,
+the Welch or multitaper PSD of each block of epochs is computed once in a single batched call and used by all
+metrics with the same PSD parameters.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.signal import welch
+from scipy.signal.windows import dpss
+
+from eeganalyzer.metrics.batch import batch_metric
+from eeganalyzer.metrics.intermediates import intermediate, uses_intermediates
+from eeganalyzer.metrics.sliding import sliding_metric
+
+
+def _band_power(psd: np.ndarray, freqs: np.ndarray, band: Tuple[float, float]) -> np.ndarray:
+    """
+    Integrates a power spectral density of shape (..., freqs) over a frequency band.
+    """
+    in_band = (freqs >= band[0]) & (freqs <= band[1])
+    return np.sum(psd[..., in_band], axis=-1) * (freqs[1] - freqs[0])
+
+
+@intermediate('welch_psd', needs_sfreq=True)
+def welch_psd(data: np.ndarray, sfreq: float, nperseg: int = 256) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Welch power spectral density of each time series, with half-overlapping hann windowed segments.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        sfreq (float): Sampling frequency.
+        nperseg (int): Length of the segments in samples, limited to the length of the time series.
+
+    Returns:
+        tuple: (frequencies, power spectral densities of shape (..., frequencies)).
+    """
+    nperseg = min(nperseg, data.shape[-1])
+    return welch(data, fs=sfreq, nperseg=nperseg, noverlap=nperseg // 2, axis=-1)
+
+
+def multitaper_psd(data: np.ndarray, sfreq: float, nw: float = 4.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Multitaper power spectral density of each time series with 2 * nw - 1 DPSS tapers over the whole series.
+
+    Every taper is applied to all time series at once, so the tensor is transformed with one batched FFT per taper.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        sfreq (float): Sampling frequency.
+        nw (float): Time half bandwidth product, the frequency resolution is 2 * nw / duration.
+
+    Returns:
+        tuple: (frequencies, one-sided power spectral densities of shape (..., frequencies)).
+    """
+    n_samples = data.shape[-1]
+    n_tapers = max(1, int(2 * nw) - 1)
+    tapers = dpss(n_samples, nw, n_tapers).reshape(n_tapers, n_samples)
+    centered = data - np.mean(data, axis=-1, keepdims=True)
+    psd = np.zeros(data.shape[:-1] + (n_samples // 2 + 1,))
+    for taper in tapers:
+        psd += np.abs(np.fft.rfft(centered * taper, axis=-1)) ** 2
+    # mean over the tapers, one-sided density without doubling the DC and Nyquist frequencies
+    psd *= 2 / (n_tapers * sfreq)
+    psd[..., 0] /= 2
+    if n_samples % 2 == 0:
+        psd[..., -1] /= 2
+    return np.fft.rfftfreq(n_samples, 1 / sfreq), psd
+
+
+@intermediate('psd', needs_sfreq=True)
+def power_spectrum(data: np.ndarray, sfreq: float, method: str = 'welch', nperseg: int = 256,
+                   nw: float = 4.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Power spectral density of each time series, shared by the spectral metric family.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        sfreq (float): Sampling frequency.
+        method (str): 'welch' or 'multitaper'.
+        nperseg (int): Length of the Welch segments in samples.
+        nw (float): Time half bandwidth product of the multitaper method.
+
+    Returns:
+        tuple: (frequencies, power spectral densities of shape (..., frequencies)).
+    """
+    if method == 'welch':
+        return welch_psd(data, sfreq, nperseg)
+    if method == 'multitaper':
+        return multitaper_psd(data, sfreq, nw)
+    raise ValueError(f"method must be 'welch' or 'multitaper', not {method}.")
+
+
+def _spectrum(data: np.ndarray, sfreq: float, method: str, nperseg: int, nw: float,
+              psd: Optional[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    return power_spectrum(data, sfreq, method, nperseg, nw) if psd is None else psd
+
+
+def _in_range(freqs: np.ndarray, freq_range: Optional[Tuple[float, float]]) -> np.ndarray:
+    if freq_range is None:
+        return np.ones(len(freqs), dtype=bool)
+    return (freqs >= freq_range[0]) & (freqs <= freq_range[1])
+
+
+def _where_finite(values: np.ndarray, power: np.ndarray) -> np.ndarray:
+    # NaN for time series with a non-finite PSD (e.g. bad channels), which comparisons and argmax would hide
+    return np.where(np.all(np.isfinite(power), axis=-1), values, np.nan)
+
+
+def _welch_supports(block_size: int, n_samples: int, sfreq: float = None, band: Tuple[float, float] = (8.0, 13.0),
+                    nperseg: int = 256) -> bool:
+    # Segments overlap by half, so every segment either lies in a block or is centered on a block border
+    return nperseg % 2 == 0 and nperseg <= n_samples and block_size % nperseg == 0
+
+
+def _welch_block(blocks: np.ndarray, sfreq: float, band: Tuple[float, float] = (8.0, 13.0),
+                 nperseg: int = 256) -> np.ndarray:
+    _, psd = welch(blocks, fs=sfreq, nperseg=nperseg, noverlap=nperseg // 2, axis=-1)
+    # The sum of the segment periodograms, Welch returns their mean
+    n_segments = 2 * blocks.shape[-1] // nperseg - 1
+    return psd * n_segments
+
+
+def _welch_seam(left: np.ndarray, right: np.ndarray, sfreq: float, band: Tuple[float, float] = (8.0, 13.0),
+                nperseg: int = 256) -> np.ndarray:
+    half = nperseg // 2
+    segment = np.concatenate([left[..., -half:], right[..., :half]], axis=-1)
+    _, psd = welch(segment, fs=sfreq, nperseg=nperseg, noverlap=0, axis=-1)
+    return psd
+
+
+def _welch_finalize(block_stats: np.ndarray, seam_stats: np.ndarray, block_size: int, sfreq: float,
+                    band: Tuple[float, float] = (8.0, 13.0), nperseg: int = 256) -> np.ndarray:
+    n_samples = block_stats.shape[-2] * block_size
+    n_segments = 2 * n_samples // nperseg - 1
+    psd = (np.sum(block_stats, axis=-2) + np.sum(seam_stats, axis=-2)) / n_segments
+    return _band_power(psd, np.fft.rfftfreq(nperseg, 1 / sfreq), band)
+
+
+@sliding_metric(block=_welch_block, seam=_welch_seam, finalize=_welch_finalize, supports=_welch_supports)
+@batch_metric(needs_sfreq=True, single_precision=True)
+@uses_intermediates(psd=('welch_psd', 'nperseg'))
+def welch_band_power(data: np.ndarray, sfreq: float, band: Tuple[float, float] = (8.0, 13.0),
+                     nperseg: int = 256, psd: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    """
+    Absolute power of each time series in a frequency band, from a Welch power spectral density.
+
+    The Welch segments (hann window, constant detrending) overlap by half. If an epoch is shorter than nperseg,
+    the whole epoch is used as one segment.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        sfreq (float): Sampling frequency, passed by the Array_processor.
+        band (tuple): (lowest, highest) frequency of the band in Hz.
+        nperseg (int): Length of the Welch segments in samples.
+        psd (tuple, optional): The result of welch_psd for the data, shared by the Array_processor.
+
+    Returns:
+        np.ndarray: The band power of each time series in unit**2.
+    """
+    freqs, psd = welch_psd(data, sfreq, nperseg) if psd is None else psd
+    return _band_power(psd, freqs, band)
+
+
+@batch_metric(needs_sfreq=True, single_precision=True)
+@uses_intermediates(psd=('psd', 'method', 'nperseg', 'nw'))
+def band_power(data: np.ndarray, sfreq: float, band: Tuple[float, float] = (8.0, 13.0), method: str = 'welch',
+               nperseg: int = 256, nw: float = 4.0, psd: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    """
+    Absolute power of each time series in a frequency band.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        sfreq (float): Sampling frequency, passed by the Array_processor.
+        band (tuple): (lowest, highest) frequency of the band in Hz.
+        method (str): PSD estimate, 'welch' or 'multitaper'.
+        nperseg (int): Length of the Welch segments in samples.
+        nw (float): Time half bandwidth product of the multitaper method.
+        psd (tuple, optional): The result of power_spectrum for the data, shared by the Array_processor.
+
+    Returns:
+        np.ndarray: The band power of each time series in unit**2.
+    """
+    freqs, power = _spectrum(data, sfreq, method, nperseg, nw, psd)
+    return _band_power(power, freqs, band)
+
+
+@batch_metric(needs_sfreq=True, single_precision=True)
+@uses_intermediates(psd=('psd', 'method', 'nperseg', 'nw'))
+def relative_band_power(data: np.ndarray, sfreq: float, band: Tuple[float, float] = (8.0, 13.0),
+                        total_band: Optional[Tuple[float, float]] = (1.0, 45.0), method: str = 'welch',
+                        nperseg: int = 256, nw: float = 4.0,
+                        psd: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    """
+    Power of each time series in a frequency band, relative to its power in a total band.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        sfreq (float): Sampling frequency, passed by the Array_processor.
+        band (tuple): (lowest, highest) frequency of the band in Hz.
+        total_band (tuple, optional): (lowest, highest) frequency of the reference power, None for all frequencies.
+        method (str): PSD estimate, 'welch' or 'multitaper'.
+        nperseg (int): Length of the Welch segments in samples.
+        nw (float): Time half bandwidth product of the multitaper method.
+        psd (tuple, optional): The result of power_spectrum for the data, shared by the Array_processor.
+
+    Returns:
+        np.ndarray: The relative band power of each time series.
+    """
+    freqs, power = _spectrum(data, sfreq, method, nperseg, nw, psd)
+    total = np.sum(power[..., _in_range(freqs, total_band)], axis=-1) * (freqs[1] - freqs[0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _band_power(power, freqs, band) / total
+
+
+@batch_metric(needs_sfreq=True, single_precision=True)
+@uses_intermediates(psd=('psd', 'method', 'nperseg', 'nw'))
+def spectral_edge(data: np.ndarray, sfreq: float, edge: float = 0.95,
+                  freq_range: Optional[Tuple[float, float]] = (1.0, 45.0), method: str = 'welch', nperseg: int = 256,
+                  nw: float = 4.0, psd: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    """
+    Spectral edge frequency of each time series, the lowest frequency below which a fraction edge of the power lies.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        sfreq (float): Sampling frequency, passed by the Array_processor.
+        edge (float): Fraction of the power, e.g. 0.95 for the SEF95.
+        freq_range (tuple, optional): (lowest, highest) frequency considered, None for all frequencies.
+        method (str): PSD estimate, 'welch' or 'multitaper'.
+        nperseg (int): Length of the Welch segments in samples.
+        nw (float): Time half bandwidth product of the multitaper method.
+        psd (tuple, optional): The result of power_spectrum for the data, shared by the Array_processor.
+
+    Returns:
+        np.ndarray: The spectral edge frequency of each time series in Hz.
+    """
+    freqs, power = _spectrum(data, sfreq, method, nperseg, nw, psd)
+    in_range = _in_range(freqs, freq_range)
+    cumulative = np.cumsum(power[..., in_range], axis=-1)
+    edge_idx = np.sum(cumulative < edge * cumulative[..., -1:], axis=-1)
+    return _where_finite(freqs[in_range][np.minimum(edge_idx, cumulative.shape[-1] - 1)], cumulative)
+
+
+@batch_metric(needs_sfreq=True, single_precision=True)
+@uses_intermediates(psd=('psd', 'method', 'nperseg', 'nw'))
+def spectral_entropy(data: np.ndarray, sfreq: float, freq_range: Optional[Tuple[float, float]] = (1.0, 45.0),
+                     normalize: bool = True, method: str = 'welch', nperseg: int = 256, nw: float = 4.0,
+                     psd: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    """
+    Spectral entropy of each time series, the Shannon entropy in bits of its PSD normalised to a distribution.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        sfreq (float): Sampling frequency, passed by the Array_processor.
+        freq_range (tuple, optional): (lowest, highest) frequency considered, None for all frequencies.
+        normalize (bool): If True, the entropy is divided by log2 of the number of frequencies.
+        method (str): PSD estimate, 'welch' or 'multitaper'.
+        nperseg (int): Length of the Welch segments in samples.
+        nw (float): Time half bandwidth product of the multitaper method.
+        psd (tuple, optional): The result of power_spectrum for the data, shared by the Array_processor.
+
+    Returns:
+        np.ndarray: The spectral entropy of each time series.
+    """
+    freqs, power = _spectrum(data, sfreq, method, nperseg, nw, psd)
+    power = power[..., _in_range(freqs, freq_range)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distribution = power / np.sum(power, axis=-1, keepdims=True)
+        entropy = -np.sum(np.where(distribution > 0, distribution * np.log2(distribution), 0.0), axis=-1)
+    if normalize:
+        entropy = entropy / np.log2(power.shape[-1])
+    return _where_finite(entropy, power)
+
+
+@batch_metric(needs_sfreq=True, single_precision=True)
+@uses_intermediates(psd=('psd', 'method', 'nperseg', 'nw'))
+def peak_frequency(data: np.ndarray, sfreq: float, freq_range: Optional[Tuple[float, float]] = (1.0, 45.0),
+                   method: str = 'welch', nperseg: int = 256, nw: float = 4.0,
+                   psd: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    """
+    Frequency of the largest PSD value of each time series, e.g. the individual alpha frequency for (7, 14).
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        sfreq (float): Sampling frequency, passed by the Array_processor.
+        freq_range (tuple, optional): (lowest, highest) frequency searched, None for all frequencies.
+        method (str): PSD estimate, 'welch' or 'multitaper'.
+        nperseg (int): Length of the Welch segments in samples.
+        nw (float): Time half bandwidth product of the multitaper method.
+        psd (tuple, optional): The result of power_spectrum for the data, shared by the Array_processor.
+
+    Returns:
+        np.ndarray: The peak frequency of each time series in Hz.
+    """
+    freqs, power = _spectrum(data, sfreq, method, nperseg, nw, psd)
+    in_range = _in_range(freqs, freq_range)
+    return _where_finite(freqs[in_range][np.argmax(power[..., in_range], axis=-1)], power[..., in_range])
+
+
+@batch_metric(needs_sfreq=True, single_precision=True)
+@uses_intermediates(psd=('psd', 'method', 'nperseg', 'nw'))
+def aperiodic_slope(data: np.ndarray, sfreq: float, freq_range: Tuple[float, float] = (1.0, 40.0),
+                    method: str = 'welch', nperseg: int = 256, nw: float = 4.0,
+                    psd: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    """
+    Slope of the aperiodic (1/f) component of each time series, the least squares slope of log10(PSD) over
+    log10(frequency). The aperiodic exponent is its negative.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        sfreq (float): Sampling frequency, passed by the Array_processor.
+        freq_range (tuple): (lowest, highest) frequency of the fit, the lowest has to be above 0 Hz.
+        method (str): PSD estimate, 'welch' or 'multitaper'.
+        nperseg (int): Length of the Welch segments in samples.
+        nw (float): Time half bandwidth product of the multitaper method.
+        psd (tuple, optional): The result of power_spectrum for the data, shared by the Array_processor.
+
+    Returns:
+        np.ndarray: The aperiodic slope of each time series.
+    """
+    freqs, power = _spectrum(data, sfreq, method, nperseg, nw, psd)
+    in_range = _in_range(freqs, freq_range) & (freqs > 0)
+    log_freqs = np.log10(freqs[in_range])
+    centered_log_freqs = log_freqs - np.mean(log_freqs)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_power = np.log10(power[..., in_range])
+    return np.sum(centered_log_freqs * log_power, axis=-1) / np.sum(centered_log_freqs ** 2)
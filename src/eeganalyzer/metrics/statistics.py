@@ -0,0 +1,134 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Statistical metrics for EEG analysis.
+
+This module provides cheap statistical metrics as batch metrics. All functions reduce the last axis of their input
+and can be used in any select_metrics set. They are decomposable into block summaries, so overlapping epochs are
+computed from one pass over the signal.
+"""
+
+import numpy as np
+
+from eeganalyzer.metrics.batch import batch_metric
+from eeganalyzer.metrics.sliding import sliding_metric
+
+
+def _sum_block(blocks: np.ndarray) -> np.ndarray:
+    return np.sum(blocks, axis=-1, keepdims=True)
+
+
+def _mean_finalize(block_stats: np.ndarray, seam_stats, block_size: int) -> np.ndarray:
+    return np.sum(block_stats[..., 0], axis=-1) / (block_stats.shape[-2] * block_size)
+
+
+@sliding_metric(block=_sum_block, finalize=_mean_finalize)
+@batch_metric(single_precision=True)
+def mean(data: np.ndarray) -> np.ndarray:
+    """
+    Mean of each time series.
+    """
+    return np.mean(data, axis=-1)
+
+
+def _moments_block(blocks: np.ndarray) -> np.ndarray:
+    block_mean = np.mean(blocks, axis=-1)
+    return np.stack([block_mean, np.sum((blocks - block_mean[..., np.newaxis]) ** 2, axis=-1)], axis=-1)
+
+
+def _variance_finalize(block_stats: np.ndarray, seam_stats, block_size: int) -> np.ndarray:
+    # Law of total variance for blocks of equal size, no cancellation as only centered sums are added
+    block_means, block_m2 = block_stats[..., 0], block_stats[..., 1]
+    deviations = block_means - np.mean(block_means, axis=-1, keepdims=True)
+    m2 = np.sum(block_m2, axis=-1) + block_size * np.sum(deviations ** 2, axis=-1)
+    return m2 / (block_stats.shape[-2] * block_size)
+
+
+@sliding_metric(block=_moments_block, finalize=_variance_finalize)
+@batch_metric(single_precision=True)
+def variance(data: np.ndarray) -> np.ndarray:
+    """
+    Variance of each time series.
+    """
+    return np.var(data, axis=-1)
+
+
+def _line_length_block(blocks: np.ndarray) -> np.ndarray:
+    return np.sum(np.abs(np.diff(blocks, axis=-1)), axis=-1, keepdims=True)
+
+
+def _line_length_seam(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    return np.abs(right[..., :1] - left[..., -1:])
+
+
+def _line_length_finalize(block_stats: np.ndarray, seam_stats: np.ndarray, block_size: int) -> np.ndarray:
+    return np.sum(block_stats[..., 0], axis=-1) + np.sum(seam_stats[..., 0], axis=-1)
+
+
+@sliding_metric(block=_line_length_block, seam=_line_length_seam, finalize=_line_length_finalize)
+@batch_metric(single_precision=True)
+def line_length(data: np.ndarray) -> np.ndarray:
+    """
+    Line length (sum of absolute differences between consecutive samples) of each time series.
+    """
+    return np.sum(np.abs(np.diff(data, axis=-1)), axis=-1)
+
+
+def _histogram_counts(data: np.ndarray, bins: int, value_range: tuple) -> np.ndarray:
+    """
+    Counts the samples of every time series in bins of fixed edges, samples outside the range go to the edge bins.
+    """
+    low, high = value_range
+    bin_idx = np.clip(np.floor((data - low) * (bins / (high - low))), 0, bins - 1).astype(np.intp)
+    series_idx = np.arange(int(np.prod(data.shape[:-1]))).reshape(data.shape[:-1] + (1,))
+    counts = np.bincount((series_idx * bins + bin_idx).ravel(), minlength=series_idx.size * bins)
+    return counts.reshape(data.shape[:-1] + (bins,))
+
+
+def _entropy_from_counts(counts: np.ndarray, base: float) -> np.ndarray:
+    probabilities = counts / np.sum(counts, axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(probabilities > 0, probabilities * np.log(probabilities), 0.0)
+    return -np.sum(terms, axis=-1) / np.log(base)
+
+
+def _shannon_block(blocks: np.ndarray, bins: int = 64, value_range: tuple = (-200.0, 200.0),
+                   base: float = 2) -> np.ndarray:
+    return _histogram_counts(blocks, bins, value_range)
+
+
+def _shannon_finalize(block_stats: np.ndarray, seam_stats, block_size: int, bins: int = 64,
+                      value_range: tuple = (-200.0, 200.0), base: float = 2) -> np.ndarray:
+    return _entropy_from_counts(np.sum(block_stats, axis=-2), base)
+
+
+@sliding_metric(block=_shannon_block, finalize=_shannon_finalize)
+@batch_metric(single_precision=True)
+def shannon_entropy(data: np.ndarray, bins: int = 64, value_range: tuple = (-200.0, 200.0),
+                    base: float = 2) -> np.ndarray:
+    """
+    Shannon entropy of the amplitude distribution of each time series.
+
+    The amplitudes are counted in a histogram with fixed edges, so the results of different epochs and recordings
+    are comparable. Samples outside value_range are counted in the first or last bin.
+
+    Args:
+        data (np.ndarray): Time series of shape (..., samples).
+        bins (int): Number of histogram bins.
+        value_range (tuple): (lowest, highest) edge of the histogram, in the unit of the data (µV for EEG files).
+        base (float): Base of the logarithm, 2 gives the entropy in bits.
+
+    Returns:
+        np.ndarray: The entropy of each time series.
+    """
+    return _entropy_from_counts(_histogram_counts(data, bins, value_range), base)
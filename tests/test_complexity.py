@@ -0,0 +1,83 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Parity tests of the batched complexity metrics against neurokit2.
+"""
+
+import neurokit2 as nk
+import numpy as np
+import pytest
+
+from eeganalyzer.metrics import complexity
+
+
+def _signals(n_samples: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    oscillation = np.sin(2 * np.pi * 10 * np.arange(n_samples) / 256) + 0.3 * rng.standard_normal(n_samples)
+    # few distinct values, so many samples equal the threshold
+    tied = rng.integers(0, 3, n_samples).astype(float)
+    return np.stack([rng.standard_normal(n_samples), oscillation, np.cumsum(rng.standard_normal(n_samples)), tied])
+
+
+def _reference(function, signals: np.ndarray, **kwargs) -> np.ndarray:
+    return np.array([function(signal, **kwargs)[0] for signal in signals])
+
+
+# lengths below, at and above a 64 bit word
+@pytest.mark.parametrize('n_samples', [10, 64, 65, 1000])
+@pytest.mark.parametrize('symbolize', ['mean', 'median'])
+def test_lempel_ziv_matches_neurokit(n_samples, symbolize):
+    signals = _signals(n_samples)
+    np.testing.assert_allclose(complexity.lempel_ziv(signals, symbolize=symbolize),
+                               _reference(nk.complexity_lempelziv, signals, symbolize=symbolize), rtol=1e-12)
+
+
+def test_lempel_ziv_of_blocks_of_epochs():
+    epochs = np.stack([_signals(300), _signals(300)[::-1]])
+    values = complexity.lempel_ziv(epochs)
+    assert values.shape == (2, 4)
+    np.testing.assert_allclose(values, [_reference(nk.complexity_lempelziv, epoch) for epoch in epochs], rtol=1e-12)
+
+
+def test_lempel_ziv_nan_channel():
+    signals = _signals(500)
+    signals[1] = np.nan
+    np.testing.assert_allclose(complexity.lempel_ziv(signals), _reference(nk.complexity_lempelziv, signals),
+                               rtol=1e-12)
+
+
+@pytest.mark.parametrize('n_samples, len_trajectory', [(40, 10), (300, 20)])
+@pytest.mark.parametrize('delay', [1, 3])
+@pytest.mark.parametrize('dimension', [2, 4])
+def test_lyapunov_matches_neurokit(n_samples, len_trajectory, delay, dimension):
+    signals = _signals(n_samples)[:3]
+    kwargs = dict(delay=delay, dimension=dimension, len_trajectory=len_trajectory)
+    np.testing.assert_allclose(complexity.lyapunov(signals, **kwargs),
+                               _reference(nk.complexity_lyapunov, signals, **kwargs), rtol=1e-9)
+
+
+def test_lyapunov_with_fixed_separation():
+    signals = _signals(300)[:3]
+    np.testing.assert_allclose(complexity.lyapunov(signals, separation=5),
+                               _reference(nk.complexity_lyapunov, signals, separation=5), rtol=1e-9)
+
+
+def test_lyapunov_nan_channel_does_not_affect_other_channels():
+    epochs = np.stack([_signals(300)[:3], _signals(300)[:3][::-1]])
+    epochs[0, 1] = np.nan
+    epochs[1, 2, 10] = np.inf
+    values = complexity.lyapunov(epochs, delay=2, dimension=4)
+    assert np.isnan(values[0, 1]) and np.isnan(values[1, 2])
+    finite = np.isfinite(epochs).all(axis=-1)
+    np.testing.assert_allclose(values[finite], _reference(nk.complexity_lyapunov, epochs[finite], delay=2,
+                                                          dimension=4), rtol=1e-9)
@@ -0,0 +1,62 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Parity tests of the batched entropy metrics against neurokit2.
+"""
+
+import neurokit2 as nk
+import numpy as np
+import pytest
+
+from eeganalyzer.metrics import entropy
+
+
+def _signals(n_samples: int = 600) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    continuous = rng.standard_normal(n_samples)
+    # few distinct values, so many embedding vectors have equal coordinates
+    tied = rng.integers(0, 4, n_samples).astype(float)
+    return np.stack([continuous, tied, np.round(continuous * 2)])
+
+
+def _reference(function, signals: np.ndarray, **kwargs) -> np.ndarray:
+    return np.array([function(signal, **kwargs)[0] for signal in signals])
+
+
+@pytest.mark.parametrize('dimension', [2, 4])
+@pytest.mark.parametrize('delay', [1, 3])
+def test_sample_entropy_matches_neurokit(dimension, delay):
+    signals = _signals()
+    np.testing.assert_allclose(entropy.sample_entropy(signals, delay=delay, dimension=dimension),
+                               _reference(nk.entropy_sample, signals, delay=delay, dimension=dimension),
+                               rtol=1e-12)
+
+
+@pytest.mark.parametrize('dimension', [3, 4, 5, 6])
+@pytest.mark.parametrize('delay', [1, 2])
+@pytest.mark.parametrize('weighted', [False, True])
+def test_permutation_entropy_matches_neurokit_with_ties(dimension, delay, weighted):
+    signals = _signals(1500)
+    np.testing.assert_allclose(
+        entropy.permutation_entropy(signals, delay=delay, dimension=dimension, weighted=weighted),
+        _reference(nk.entropy_permutation, signals, delay=delay, dimension=dimension, weighted=weighted),
+        rtol=1e-12,
+    )
+
+
+@pytest.mark.parametrize('method', ['MSEn', 'MSPEn', 'MSWPEn'])
+def test_multiscale_entropy_matches_neurokit(method):
+    signals = _signals(1500)[1:]
+    np.testing.assert_allclose(entropy.multiscale_entropy(signals, method=method, dimension=4),
+                               _reference(nk.entropy_multiscale, signals, method=method, dimension=4),
+                               rtol=1e-12)
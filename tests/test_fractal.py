@@ -0,0 +1,66 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Parity tests of the batched fractal dimensions against neurokit2.
+"""
+
+import neurokit2 as nk
+import numpy as np
+import pytest
+
+from eeganalyzer.metrics import fractal
+
+
+def _signals(n_samples: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    oscillation = np.sin(2 * np.pi * 10 * np.arange(n_samples) / 256) + 0.3 * rng.standard_normal(n_samples)
+    return np.stack([rng.standard_normal(n_samples), oscillation, np.cumsum(rng.standard_normal(n_samples))])
+
+
+def _reference(function, signals: np.ndarray, **kwargs) -> np.ndarray:
+    return np.array([function(signal, **kwargs)[0] for signal in signals])
+
+
+@pytest.mark.parametrize('n_samples', [32, 1000])
+@pytest.mark.parametrize('metric, reference, kwargs', [
+    (fractal.katz, nk.fractal_katz, {}),
+    (fractal.higuchi, nk.fractal_higuchi, {'k_max': 10}),
+    (fractal.higuchi, nk.fractal_higuchi, {'k_max': 5}),
+    (fractal.petrosian, nk.fractal_petrosian, {'symbolize': 'C'}),
+    (fractal.petrosian, nk.fractal_petrosian, {'symbolize': 'A'}),
+    (fractal.petrosian, nk.fractal_petrosian, {'symbolize': 'B'}),
+    (fractal.petrosian, nk.fractal_petrosian, {'symbolize': 'D'}),
+])
+def test_fractal_dimensions_match_neurokit(metric, reference, kwargs, n_samples):
+    signals = _signals(n_samples)
+    np.testing.assert_allclose(metric(signals, **kwargs), _reference(reference, signals, **kwargs), rtol=1e-12)
+
+
+def test_blocks_of_epochs_match_single_series():
+    epochs = np.stack([_signals(500), _signals(500)[::-1]])
+    for metric in (fractal.katz, fractal.higuchi, fractal.petrosian):
+        values = metric(epochs)
+        assert values.shape == (2, 3)
+        np.testing.assert_allclose(values, [[metric(series) for series in epoch] for epoch in epochs], rtol=1e-12)
+
+
+@pytest.mark.parametrize('metric, reference, kwargs', [
+    (fractal.katz, nk.fractal_katz, {}),
+    (fractal.higuchi, nk.fractal_higuchi, {'k_max': 10}),
+])
+def test_nan_channel_does_not_affect_other_channels(metric, reference, kwargs):
+    signals = _signals(500)
+    signals[1] = np.nan
+    values = metric(signals, **kwargs)
+    assert np.isnan(values[1])
+    np.testing.assert_allclose(values[[0, 2]], _reference(reference, signals[[0, 2]], **kwargs), rtol=1e-12)
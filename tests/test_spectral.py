@@ -0,0 +1,137 @@
+"""
+Copyright (C) <2025>  <Soenke van Loh>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+Parity tests of the batched spectral metrics against per time series scipy spectra.
+"""
+
+import numpy as np
+import pytest
+from scipy.signal import periodogram, welch
+from scipy.signal.windows import dpss
+from scipy.stats import entropy
+
+from eeganalyzer.metrics import spectral
+
+SFREQ = 256.0
+
+
+def _signals(n_samples: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    times = np.arange(n_samples) / SFREQ
+    alpha = np.sin(2 * np.pi * 10 * times) + 0.5 * rng.standard_normal(n_samples)
+    beta = np.sin(2 * np.pi * 20 * times) + 0.5 * rng.standard_normal(n_samples)
+    return np.stack([rng.standard_normal(n_samples), alpha, beta, np.cumsum(rng.standard_normal(n_samples))])
+
+
+def _psd(signal: np.ndarray, method: str) -> tuple:
+    if method == 'welch':
+        nperseg = min(256, len(signal))
+        return welch(signal, fs=SFREQ, nperseg=nperseg, noverlap=nperseg // 2)
+    tapers = dpss(len(signal), 4.0, 7)
+    freqs = periodogram(signal, fs=SFREQ)[0]
+    return freqs, np.mean([periodogram(signal, fs=SFREQ, window=taper)[1] for taper in tapers], axis=0)
+
+
+def _band(freqs: np.ndarray, band: tuple) -> np.ndarray:
+    return (freqs >= band[0]) & (freqs <= band[1])
+
+
+def _reference_band_power(signal, method, band=(8.0, 13.0)):
+    freqs, psd = _psd(signal, method)
+    return np.sum(psd[_band(freqs, band)]) * (freqs[1] - freqs[0])
+
+
+def _reference_relative_band_power(signal, method):
+    return _reference_band_power(signal, method) / _reference_band_power(signal, method, (1.0, 45.0))
+
+
+def _reference_spectral_edge(signal, method):
+    freqs, psd = _psd(signal, method)
+    in_range = _band(freqs, (1.0, 45.0))
+    freqs, psd = freqs[in_range], psd[in_range]
+    for idx in range(len(freqs)):
+        if np.sum(psd[:idx + 1]) >= 0.95 * np.sum(psd):
+            return freqs[idx]
+
+
+def _reference_spectral_entropy(signal, method):
+    freqs, psd = _psd(signal, method)
+    psd = psd[_band(freqs, (1.0, 45.0))]
+    return entropy(psd, base=2) / np.log2(len(psd))
+
+
+def _reference_peak_frequency(signal, method):
+    freqs, psd = _psd(signal, method)
+    in_range = _band(freqs, (1.0, 45.0))
+    return freqs[in_range][np.argmax(psd[in_range])]
+
+
+def _reference_aperiodic_slope(signal, method):
+    freqs, psd = _psd(signal, method)
+    in_range = _band(freqs, (1.0, 40.0))
+    return np.polyfit(np.log10(freqs[in_range]), np.log10(psd[in_range]), 1)[0]
+
+
+METRICS = [
+    (spectral.band_power, _reference_band_power),
+    (spectral.relative_band_power, _reference_relative_band_power),
+    (spectral.spectral_edge, _reference_spectral_edge),
+    (spectral.spectral_entropy, _reference_spectral_entropy),
+    (spectral.peak_frequency, _reference_peak_frequency),
+    (spectral.aperiodic_slope, _reference_aperiodic_slope),
+]
+
+
+# epochs longer than, equal to and shorter than the Welch segments
+@pytest.mark.parametrize('n_samples', [1024, 256, 100])
+@pytest.mark.parametrize('method', ['welch', 'multitaper'])
+@pytest.mark.parametrize('metric, reference', METRICS)
+def test_spectral_metrics_match_scipy(metric, reference, method, n_samples):
+    signals = _signals(n_samples)
+    np.testing.assert_allclose(metric(signals, SFREQ, method=method),
+                               [reference(signal, method) for signal in signals], rtol=1e-10)
+
+
+@pytest.mark.parametrize('n_samples', [1024, 100])
+def test_welch_band_power_matches_scipy(n_samples):
+    signals = _signals(n_samples)
+    np.testing.assert_allclose(spectral.welch_band_power(signals, SFREQ),
+                               [_reference_band_power(signal, 'welch') for signal in signals], rtol=1e-10)
+
+
+def test_welch_band_power_from_blocks_and_seams():
+    signals = _signals(1024)
+    # (channels, blocks, samples), as the sliding window evaluation passes them
+    blocks = signals.reshape(4, 4, 256)
+    values = spectral._welch_finalize(spectral._welch_block(blocks, SFREQ),
+                                      spectral._welch_seam(blocks[:, :-1], blocks[:, 1:], SFREQ), 256, SFREQ)
+    np.testing.assert_allclose(values, spectral.welch_band_power(signals, SFREQ), rtol=1e-10)
+
+
+@pytest.mark.parametrize('metric, reference', METRICS)
+def test_blocks_of_epochs_match_single_series(metric, reference):
+    epochs = np.stack([_signals(512), _signals(512)[::-1]])
+    values = metric(epochs, SFREQ)
+    assert values.shape == (2, 4)
+    np.testing.assert_allclose(values, [[metric(series, SFREQ) for series in epoch] for epoch in epochs],
+                               rtol=1e-10)
+
+
+@pytest.mark.parametrize('method', ['welch', 'multitaper'])
+@pytest.mark.parametrize('metric, reference', METRICS)
+def test_nan_channel_does_not_affect_other_channels(metric, reference, method):
+    signals = _signals(512)
+    signals[1] = np.nan
+    values = metric(signals, SFREQ, method=method)
+    assert np.isnan(values[1])
+    np.testing.assert_allclose(values[[0, 2, 3]], [reference(signals[i], method) for i in (0, 2, 3)], rtol=1e-10)